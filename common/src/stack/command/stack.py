@@ -15,11 +15,14 @@
 import os
 import pwd
 import sys
+import time
+import shlex
 import syslog
 import getopt
 import traceback
 import signal
 import stack        # need this so we can load the stack.commands.* modules
+from stack.commandindex import Lookup
 from stack.exception import CommandError
 
 
@@ -94,7 +97,22 @@ except pymysql.err.OperationalError:
 	Database = None
 
 
-def run_command(args, debug=False):
+# Modules (and the names that are not modules) we have already tried
+# to import, a batch runs the same few commands over and over.
+
+Modules = {}
+
+def import_module(name):
+	if name not in Modules:
+		try:
+			__import__(name)
+			Modules[name] = sys.modules[name]
+		except ImportError:
+			Modules[name] = None
+	return Modules[name]
+
+
+def run_command(args, debug=False, stream=False):
 	# Check if the stack command has been quoted.
 
 	module = None
@@ -105,12 +123,20 @@ def run_command(args, debug=False):
 	if len(cmd) > 1:
 		s = 'stack.commands.%s' % '.'.join(cmd)
 		try:
-			__import__(s)
-			module = eval(s)
+			module = import_module(s)
 			i = 1
 		except:
 			module = None
 
+	# The command index (built at install time) knows which
+	# prefix of the command line is the command module.
+
+	if not module:
+		found = Lookup(args)
+		if found:
+			(s, i) = found
+			module = import_module(s)
+
 	# Treat the entire command line as if it were a python
 	# command module and keep popping arguments off the end
 	# until we get a match.	 If no match is found issue an
@@ -118,13 +144,9 @@ def run_command(args, debug=False):
 	if not module:
 		for i in range(len(args), 0, -1):
 			s = 'stack.commands.%s' % '.'.join(args[:i])
-			try:
-				__import__(s)
-				module = eval(s)
-				if module:
-					break
-			except ImportError:
-				continue
+			module = import_module(s)
+			if module:
+				break
 
 	if not module:
 		sys.stderr.write('Error - Invalid stack command "%s"\n' % args[0])
@@ -149,8 +171,16 @@ def run_command(args, debug=False):
 		print(help.getText())
 		return -1
 
+	# When streaming the output is written while the command runs,
+	# so the SIGPIPE needs the system default (see below) already.
+
+	if stream:
+		signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
 	try:
 		command = getattr(module, 'Command')(Database, debug)
+		if stream:
+			command.stream = sys.stdout.buffer
 #		 t0 = time.time()
 		rc = command.runWrapper(name, args[i:])
 #		syslog.syslog(syslog.LOG_INFO, 'runtime %.3f' % (time.time() - t0))
@@ -158,6 +188,14 @@ def run_command(args, debug=False):
 		sys.stderr.write('%s\n' % e)
 		syslog.syslog(syslog.LOG_ERR, '%s' % e)
 		return -1
+	except SystemExit as e:
+		# A command calling sys.exit() (create pallet) has failed,
+		# in a batch the next command still runs.
+		if isinstance(e.code, int) and e.code:
+			return e.code
+		if e.code:
+			sys.stderr.write('%s\n' % e.code)
+		return -1
 	except Exception as e:
 		# Sanitize Exceptions, and log them.
 		exc, msg, tb = sys.exc_info()
@@ -169,6 +207,9 @@ def run_command(args, debug=False):
 		syslog.syslog(syslog.LOG_ERR, error)
 		return -1
 
+	if stream:
+		sys.stdout.flush()
+
 	text = command.getText()
 
 	# set the SIGPIPE to the system default (instead of python default)
@@ -179,22 +220,110 @@ def run_command(args, debug=False):
 		print(text, end='')
 		if text[len(text) - 1] != '\n':
 			print()
-	syslog.closelog()
 	if rc is True:
 		return 0
 	return -1
 
 
+def read_batch(fin):
+	"""
+	Reads stack commands, one per line, the way the shell would:
+	blank lines and comments are skipped, a trailing backslash
+	continues the line and a leading 'stack' (as in the output of
+	'stack dump') is ignored.  Yields the line number and the
+	arguments of each command.
+	"""
+
+	line  = ''
+	start = 0
+	for (n, text) in enumerate(fin, 1):
+		if not line:
+			start = n
+		if text.endswith('\\\n'):
+			line += text[:-2]
+			continue
+		line += text
+		try:
+			args = shlex.split(line, comments=True)
+		except ValueError:
+			yield (start, line.strip(), None)
+			line = ''
+			continue
+		line = ''
+		if args and os.path.basename(args[0]) in [ 'stack', 'stack.py' ]:
+			args = args[1:]
+		if args:
+			yield (start, ' '.join(args), args)
+	if line:
+		yield (start, line.strip(), None)
+
+
+def run_batch(filename, debug=False, stream=False, keepgoing=False):
+	"""
+	Runs every command in FILENAME (stdin if None or '-') in this
+	process.  Stops at the first failed command unless KEEPGOING,
+	either way a summary is written at the end.
+	"""
+
+	if not filename or filename == '-':
+		fin = sys.stdin
+	else:
+		try:
+			fin = open(filename, 'r')
+		except OSError as e:
+			sys.stderr.write('error - %s\n' % e)
+			return -1
+
+	t0	= time.time()
+	count	= 0
+	failed	= []
+	for (n, line, args) in read_batch(fin):
+		count += 1
+		if args is None:
+			sys.stderr.write('error - line %d: cannot parse "%s"\n' %
+					 (n, line))
+			rc = -1
+		else:
+			rc = run_command(args, debug, stream)
+		sys.stdout.flush()
+		if rc:
+			failed.append((n, line))
+			if not keepgoing:
+				break
+
+	if fin is not sys.stdin:
+		fin.close()
+
+	sys.stderr.write('batch: %d commands, %d failed (%.3fs)\n' %
+			 (count, len(failed), time.time() - t0))
+	for (n, line) in failed:
+		sys.stderr.write('	line %d: %s\n' % (n, line))
+
+	if failed:
+		return -1
+	return 0
+
+
 try:
-	opts, args = getopt.getopt(sys.argv[1:], '', ['debug', 'help', 'version'])
+	opts, args = getopt.getopt(sys.argv[1:], '',
+		['debug', 'help', 'version', 'stream', 'batch', 'continue'])
 except getopt.GetoptError as msg:
 	sys.stderr.write("error - %s\n" % msg)
 	sys.exit(1)
 
-debug = False
+debug	  = False
+stream	  = False
+batch	  = False
+keepgoing = False
 for o, a in opts:
 	if o == '--debug':
 		debug = True
+	elif o == '--stream':
+		stream = True
+	elif o == '--batch':
+		batch = True
+	elif o == '--continue':
+		keepgoing = True
 	elif o == '--help':
 		rc = run_command(['help'])
 		sys.exit(rc)
@@ -203,9 +332,17 @@ for o, a in opts:
 		sys.exit(rc)
 
 
-if len(args) == 0:
+# stack --batch [--continue] [file] runs the commands in FILE (or
+# stdin) using a single process and database connection.
+
+if batch:
+	if len(args) > 1:
+		sys.stderr.write('error - only one batch file\n')
+		sys.exit(1)
+	rc = run_batch(args[0] if args else None, debug, stream, keepgoing)
+elif len(args) == 0:
 	rc = run_command(['help'])
-	sys.exit(rc)
 else:
-	rc = run_command(args, debug)
-	sys.exit(rc)
+	rc = run_command(args, debug, stream)
+syslog.closelog()
+sys.exit(rc)
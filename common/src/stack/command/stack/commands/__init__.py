@@ -20,18 +20,20 @@ import syslog
 import pwd
 import sys
 import json
+import html
 import marshal
 import hashlib
+import ipaddress
 import subprocess
-from xml.sax import saxutils
 from xml.sax import handler
 from xml.sax import make_parser
 from pymysql import OperationalError, ProgrammingError
 from functools import partial
 
 import stack.graph
+import stack.querycache
 import stack
-from stack.cond import EvalCondExpr
+import stack.cond
 from stack.exception import CommandError, ParamRequired
 from stack.bool import str2bool, bool2str
 
@@ -306,6 +308,47 @@ class RollArgumentProcessor:
 class HostArgumentProcessor:
 	"""An Interface class to add the ability to process host arguments."""
 	
+	def getHostPlacement(self, host, appliances):
+		"""Returns the (appliance, rack, rank) of a HOST name of
+		the standard form basename-rack-rank.  The appliance is
+		the basename if it is one of the APPLIANCES, otherwise
+		None.  For any other name all three are None."""
+
+		try:
+			basename, rack, rank = host.split('-')
+		except ValueError:
+			return (None, None, None)
+		if basename not in appliances:
+			basename = None
+		return (basename, rack, rank)
+
+	def getNodeNames(self, hosts, subnet=None):
+		"""Returns a dictionary mapping each of the HOSTS to the name
+		used for it on the SUBNET network (see
+		DatabaseConnection.getNodeName).  Hosts without an
+		interface on the SUBNET map to None."""
+
+		if not subnet:
+			return dict([ (host, host) for host in hosts ])
+
+		names = {}
+		for (host, netname, zone) in self.db.select("""
+			n.name, net.name, s.zone from
+			nodes n, networks net, subnets s where
+			net.node = n.id and net.subnet = s.id and
+			s.name like '%s'
+			""" % subnet):
+
+			# If interface exists, but name is not set
+			# infer name from nodes table, and append
+			# dns zone
+			if not netname:
+				netname = host
+			names[host] = '%s.%s' % (netname, zone)
+
+		return names
+
+
 	def getHostnames(self, names=[], managed_only=False, subnet=None, host_filter=None, order='asc'):
 		"""Expands the given list of names to valid cluster hostnames.	A name
 		can be:
@@ -339,38 +382,19 @@ class HostArgumentProcessor:
 
 		"""
 
-		adhoc	 = False
 		hostList = []
 		hostDict = {}
 
 		#
-		# list the frontend first
+		# list the frontend first, then the backend appliances
 		#
-		frontends = self.db.select(
+		for host, in self.db.select(
 			"""
 			n.name from
-			nodes n, appliances a where a.name = "frontend"
-			and a.id = n.appliance order by rack, rank %s
-			""" % order)
-				
-		#
-		# now get the backend appliances
-		#
-		backends = self.db.select(
-			"""
-			n.name from
-			nodes n, appliances a where a.name != "frontend"
-			and a.id = n.appliance order by rack, rank %s
-			""" % order)
-
-		hosts = []
-
-		if frontends:
-			hosts.extend(frontends)
-		if backends:
-			hosts.extend(backends)
-
-		for host, in hosts:
+			nodes n, appliances a where
+			a.id = n.appliance order by
+			a.name != "frontend", rack, rank %s
+			""" % order):
 
 			# If we have a list of hostnames (or groups) then
 			# disable all the hosts first and selectively
@@ -386,95 +410,107 @@ class HostArgumentProcessor:
 			# interface rather than the name in the nodes table
 			
 			hostList.append(host)
-			
-			if names:
-				hostDict[host] = None
-			else:
-				hostDict[host] = self.db.getNodeName(host, 
-								     subnet)
-				
+			hostDict[host] = None
+
+		nodeNames = self.getNodeNames(hostList, subnet)
+		if not names:
+			for host in hostList:
+				hostDict[host] = nodeNames.get(host)
+
+		# The scoped groups (a:backend, g:gpu, ...) are selected
+		# with a single indexed query each.  Only true 'where'
+		# expressions need the host attributes, and then only
+		# the attributes the expressions reference.
+
+		scopes = {
+			'a': """n.name from nodes n, appliances a where
+				n.appliance = a.id and a.name = '%s'""",
+			'e': """n.name from nodes n, environments e where
+				n.environment = e.id and e.name = '%s'""",
+			'o': """n.name from nodes n, boxes b, oses o where
+				n.box = b.id and b.os = o.id and o.name = '%s'""",
+			'b': """n.name from nodes n, boxes b where
+				n.box = b.id and b.name = '%s'""",
+			'g': """n.name from nodes n, memberships m, groups g where
+				n.id = m.nodeid and m.groupid = g.id and
+				g.name = '%s'""",
+			'r': """n.name from nodes n where n.rack = '%s'"""
+		}
 
-		l = []
+		l     = []
+		attrs = set()
 		if names:
 			for host in names:
 				tokens = host.split(':', 1)
 				if len(tokens) == 2:
 					scope, target = tokens
-					if scope == 'a':
-						l.append('where appliance == "%s"' % target)
-					elif scope == 'e':
-						l.append('where environment == "%s"' % target)
-					elif scope == 'o':
-						l.append('where os == "%s"' % target)
-					elif scope == 'b':
-						l.append('where box == "%s"' % target)
-					elif scope == 'g':
-						l.append('where group.%s == True' % target)
-					elif scope == 'r':
-						l.append('where rack == "%s"' % target)
-					adhoc = True
+					if scope in scopes:
+						l.append((scope, target))
 					continue
 				if host.find('where') == 0:
-					l.append(host)
-					adhoc = True
+					exp = host[5:]
+					try:
+						expr = stack.cond.CompileCondExpr(exp)
+					except SyntaxError:
+						raise CommandError(self, 'group syntax "%s"' % exp)
+					attrs.update(expr.attrs)
+					l.append(('where', expr))
 					continue
-				l.append(host.lower())
+				l.append((None, host.lower()))
 		names = l
 
-		# If we have any Ad-Hoc groupings we need to load the attributes
-		# for every host in the nodes tables.  Since this is a lot of
-		# work handle the common case and avoid the work when just
-		# a list of hosts.
-		#
-		# Also load the attributes if the managed_only argument is true
-		# since we need to looked the managed attribute.
+		# Load the attributes referenced by any ad-hoc groups,
+		# and the managed attribute if managed_only is true.
 
-		hostAttrs  = {}
+		hostAttrs = {}
 		for host in hostList:
 			hostAttrs[host] = {}
-		if adhoc or managed_only:
-			for row in self.call('list.host.attr', hostList):
-				h = row['host']
-				a = row['attr']
-				v = row['value']
-				hostAttrs[h][a] = v
-			
+		if managed_only:
+			attrs.add('managed')
+		if attrs:
+			hostAttrs = self.getHostAttrs(hostList, sorted(attrs))
 
 		# Finally iterate over all the host/groups
 
-		list	 = []
+		hostSet  = set(hostList)
 		explicit = {}
-		for name in names:
+		for (scope, name) in names:
 
 			# ad-hoc group
 			
-			if name.find('where') == 0:
+			if scope == 'where':
 				for host in hostList:
-					exp = name[5:]
-					try:
-						res = EvalCondExpr(exp, hostAttrs[host])
-					except SyntaxError:
-						raise CommandError(self, 'group syntax "%s"' % exp)
-					if res:
-						s = self.db.getHostname(host, subnet)
-						hostDict[host] = s
+					if name.eval(hostAttrs[host]):
+						hostDict[host] = nodeNames.get(host)
 						if host not in explicit:
 							explicit[host] = False
-#					Debug('group %s is %s for %s' %
-#				      (exp, res, host))
+
+			# scoped group
+
+			elif scope:
+				for host, in self.db.select(scopes[scope] % name):
+					if host not in hostSet:
+						continue
+					hostDict[host] = nodeNames.get(host)
+					if host not in explicit:
+						explicit[host] = False
 
 			# glob regex hostname
 
 			elif '*' in name or '?' in name or '[' in name:
 				for host in fnmatch.filter(hostList, name):
-					s = self.db.getHostname(host, subnet)
-					hostDict[host] = s
+					hostDict[host] = nodeNames.get(host)
 					if host not in explicit:
 						explicit[host] = False
 					
 
-			# simple hostname
+			# simple hostname, anything not in the nodes table
+			# (IP, MAC, FQDN, ...) needs to be resolved
 						
+			elif name in hostSet:
+				explicit[name] = True
+				hostDict[name] = nodeNames.get(name)
+
 			else:
 				host = self.db.getHostname(name)
 				explicit[host] = True
@@ -499,7 +535,7 @@ class HostArgumentProcessor:
 				continue
 
 			if managed_only:
-				managed = str2bool(hostAttrs[host]['managed'])
+				managed = str2bool(hostAttrs[host].get('managed'))
 				if not managed and not explicit.get(host):
 					continue
 			
@@ -716,7 +752,7 @@ class DocStringHandler(handler.ContentHandler,
 			s += '</arg>\n'
 		s += '</cmdsynopsis>\n'
 		s += '<para>\n'
-		s += saxutils.escape(self.section['description'])
+		s += html.escape(self.section['description'], quote=False)
 		s += '\n</para>\n'
 		if self.section['arg']:
 			s += '<variablelist><title>arguments</title>\n'
@@ -730,7 +766,7 @@ class DocStringHandler(handler.ContentHandler,
 				s += '\t<term>%s</term>\n' % term
 				s += '\t<listitem>\n'
 				s += '\t<para>\n'
-				s += saxutils.escape(txt)
+				s += html.escape(txt, quote=False)
 				s += '\n\t</para>\n'
 				s += '\t</listitem>\n'
 				s += '\t</varlistentry>\n'
@@ -752,7 +788,7 @@ class DocStringHandler(handler.ContentHandler,
 					(optStart, key, val, optEnd)
 				s += '\t<listitem>\n'
 				s += '\t<para>\n'
-				s += saxutils.escape(txt)
+				s += html.escape(txt, quote=False)
 				s += '\n\t</para>\n'
 				s += '\t</listitem>\n'
 				s += '\t</varlistentry>\n'
@@ -770,7 +806,7 @@ class DocStringHandler(handler.ContentHandler,
 				s += '\n\t</term>\n'
 				s += '\t<listitem>\n'
 				s += '\t<para>\n'
-				s += saxutils.escape(txt)
+				s += html.escape(txt, quote=False)
 				s += '\n\t</para>\n'
 				s += '\t</listitem>\n'
 				s += '\t</varlistentry>\n'
@@ -1001,10 +1037,17 @@ class DatabaseConnection:
 	this object (self.db).
 	"""
 
-	def __init__(self, db):
+	def __init__(self, db, parent=None):
 
 		# self.database : object returned from orginal connect call
 		# self.link	: database cursor used by everyone else
+		#
+		# A PARENT DatabaseConnection shares its connection and
+		# select cache, but each command gets its own cursor so
+		# nested commands cannot clobber a pending fetch.
+
+		if parent:
+			db = parent.database
 		if db:
 			self.database = db
 			self.link     = db.cursor()
@@ -1023,6 +1066,37 @@ class DatabaseConnection:
 		self.cache   = {}
 		self.caching = caching
 
+		# Tables written since the transaction (if any) started,
+		# None in the list means an unknown table.
+
+		self.transaction = { 'open': False, 'tables': [] }
+
+		# Optional environment variable STACKSHAREDCACHE enables
+		# the cross-process select cache.  Default is to only
+		# cache within a single command (and the commands it
+		# calls).
+
+		# What a select returns depends on the database user, so
+		# each one gets entries of their own.
+
+		self.shared = None
+		shared	    = os.environ.get('STACKSHAREDCACHE')
+		user	    = getattr(db, 'user', None)
+		if isinstance(user, bytes):
+			user = user.decode()
+		if not parent and user and shared and str2bool(shared):
+			try:
+				self.shared = stack.querycache.QueryCache(
+					stack.querycache.CacheDir, user)
+			except OSError:
+				self.shared = None
+
+		if parent:
+			self.cache	 = parent.cache
+			self.caching	 = parent.caching
+			self.shared	 = parent.shared
+			self.transaction = parent.transaction
+
 
 	def enableCache(self):
 		self.caching = True
@@ -1031,8 +1105,18 @@ class DatabaseConnection:
 		self.caching = False
 		self.clearCache()
 
-	def clearCache(self):
-		self.cache = {}
+	def clearCache(self, tables=None):
+		"""Removes the cached selects that read any of the TABLES,
+		if TABLES is None the entire cache is cleared."""
+
+		if tables is None:
+			self.cache.clear()
+			return
+
+		for k in [ k for k in self.cache.keys() ]:
+			(t, rows) = self.cache[k]
+			if t is None or t & tables:
+				del self.cache[k]
 
 	def select(self, command):
 		if not self.link:
@@ -1046,38 +1130,107 @@ class DatabaseConnection:
 
 #		 print 'select', k, command
 		if k in self.cache:
-			rows = self.cache[k]
+			(tables, rows) = self.cache[k]
 #			 print >> sys.stderr, '-\n%s\n%s\n' % (command, rows)
-		else:
-			try:
-				self.execute('select %s' % command)
-				rows = self.fetchall()
-			except (OperationalError, ProgrammingError):
-				# Permission error return the empty set
-				# Syntax errors throw exceptions
-				rows = []
+			return rows
+
+		tables = stack.querycache.Tables(command)
+
+		shared = None
+		if self.caching and self.shared:
+			shared = self.shared
+			rows   = shared.get(k)
+			if rows is not None:
+				self.cache[k] = (tables, rows)
+				return rows
+
+		try:
+			if shared:
+				stamp = shared.stamp(tables)
+			self.execute('select %s' % command)
+			rows = self.fetchall()
+			if shared:
+				shared.put(k, stamp, rows)
+		except (OperationalError, ProgrammingError):
+			# Permission error return the empty set
+			# Syntax errors throw exceptions
+			rows = []
 				
-			if self.caching:
-				self.cache[k] = rows
+		if self.caching:
+			self.cache[k] = (tables, rows)
 
 		return rows
 
 					
-	def execute(self, command):
+	def execute(self, command, args=None):
+		"""Runs the SQL COMMAND, ARGS are the values of its %s
+		placeholders (see pymysql)."""
+
+		return self.executeSQL(command, args)
+
+	def executemany(self, command, args):
+		"""Runs the SQL COMMAND for each of the ARGS, pymysql
+		turns an insert into multi-row statements."""
+
+		return self.executeSQL(command, args, many=True)
+
+	def executeSQL(self, command, args=None, many=False):
 		command = command.strip()
 
-		if command.find('select') == -1:
-			self.clearCache()
+		# Writes only invalidate the cached selects that read
+		# the tables being written.  Inside a transaction another
+		# process can read (and cache) the old rows until the
+		# commit, so the tables are invalidated again when the
+		# transaction ends.
+
+		write	    = stack.querycache.IsWrite(command)
+		transaction = stack.querycache.Transaction(command)
+		if write:
+			tables = stack.querycache.Tables(command)
+			self.clearCache(tables)
+			if self.transaction['open']:
+				self.transaction['tables'].append(tables)
 						
 		if self.link:
 			t0 = time.time()
-			result = self.link.execute(command)
+			if many:
+				result = self.link.executemany(command, args)
+			elif args is not None:
+				result = self.link.execute(command, args)
+			else:
+				result = self.link.execute(command)
 			t1 = time.time()
 			Debug('SQL EX: %.3f %s' % ((t1 - t0), command))
+			if write and self.shared:
+				self.shared.invalidate(tables)
+			if transaction:
+				self.endTransaction()
+				self.transaction['open'] = transaction == 'begin'
 			return result
 		
 		return None
 
+	def endTransaction(self):
+		"""Invalidates the tables written in the transaction that
+		just committed or rolled back (starting a transaction
+		commits the previous one)."""
+
+		written = self.transaction['tables']
+		self.transaction['tables'] = []
+		if not written:
+			return
+
+		if None in written:
+			tables = None
+		else:
+			tables = set()
+			for t in written:
+				tables.update(t)
+
+		self.clearCache(tables)
+		if self.shared:
+			self.shared.invalidate(tables)
+
 	def fetchone(self):
 		if self.link:
 			row = self.link.fetchone()
@@ -1471,7 +1624,465 @@ class DatabaseConnection:
 		return self.getNodeName(hostname, subnet)
 
 
-		
+
+class AttributeResolver:
+	"""Resolves attributes for a subset of the cluster.  Rather than
+	building the attribute map of every object in every scope only the
+	scopes referenced by the requested targets are loaded, and each is
+	loaded with a single set-based query.
+
+	Scope precedence is the same as 'list attr':
+
+		host > environment > appliance > os > global
+
+	Constant attributes are mixed in on top of the variables of their
+	scope (hosts can opt out with const_overwrite=false).  Attributes
+	are returned as a dictionary of (value, shadow, type, scope)
+	tuples keyed by attribute name.
+	"""
+
+	tables = {
+		'os'	     : 'oses',
+		'appliance'  : 'appliances',
+		'environment': 'environments',
+		'host'	     : 'nodes'
+	}
+
+	globalConsts = [
+		'Kickstart_PrivateKickstartHost',
+		'Kickstart_PrivateAddress',
+		'Kickstart_PrivateHostname',
+		'Kickstart_PrivateBroadcast',
+		'Kickstart_PrivateDNSDomain',
+		'Kickstart_PrivateNetwork',
+		'Kickstart_PrivateNetmask',
+		'Kickstart_PrivateNetmaskCIDR',
+		'Kickstart_PublicAddress',
+		'Kickstart_PublicHostname',
+		'Kickstart_PublicBroadcast',
+		'Kickstart_PublicDNSDomain',
+		'Kickstart_PublicNetwork',
+		'Kickstart_PublicNetmask',
+		'Kickstart_PublicNetmaskCIDR',
+		'release',
+		'version'
+	]
+
+	def __init__(self, db):
+		self.db = db
+
+	def sqlList(self, names):
+		return '(%s)' % ','.join([ "'%s'" % n for n in names ])
+
+	def sqlLike(self, globs):
+		"""Converts the shell GLOBS into an SQL expression that
+		selects a superset of the matching attributes.  Returns None
+		if the globs cannot be expressed as like patterns."""
+
+		if not globs:
+			return None
+		patterns = []
+		for glob in globs:
+			for c in '[\\\'"':
+				if c in glob:
+					return None
+			patterns.append("a.attr like '%s'" %
+				glob.replace('*', '%').replace('?', '_'))
+		return ' or '.join(patterns)
+
+	def match(self, globs, names):
+		"""Returns the NAMES selected by any of the GLOBS."""
+
+		# Once any list command is loaded 'list' in this module
+		# is the stack.commands.list package, not the builtin.
+
+		if not globs:
+			return [ n for n in names ]
+		return [ n for n in names
+			 if [ g for g in globs if fnmatch.fnmatchcase(n, g) ] ]
+
+	def wants(self, globs, names):
+		"""Returns True if any of the NAMES is selected by GLOBS."""
+
+		return len(self.match(globs, names)) > 0
+
+
+	def getVars(self, scope, targets, globs=None):
+		"""Returns the variable attributes for the TARGETS of
+		SCOPE.  The const_overwrite attribute is always loaded
+		for hosts since it controls how constants are applied."""
+
+		attributes = {}
+		for target in targets:
+			attributes[target] = {}
+		if not targets:
+			return attributes
+
+		filter = ''
+		like   = self.sqlLike(globs)
+		if like:
+			if scope == 'host':
+				filter = """and (%s or
+					a.attr = 'const_overwrite')""" % like
+			else:
+				filter = 'and (%s)' % like
+
+		if scope == 'global':
+			columns = "'global', a.attr, a.value"
+			query	= """
+				from attributes a
+				where a.scope = 'global' %s
+				""" % filter
+		else:
+			columns = 't.name, a.attr, a.value'
+			query	= """
+				from attributes a, %s t where
+				a.scope = '%s' and a.scopeid = t.id and
+				t.name in %s %s
+				""" % (self.tables[scope], scope,
+				       self.sqlList(targets), filter)
+
+		# Non-root users cannot read the shadow column, fall
+		# back to the value only query.
+
+		rows = self.db.select('%s, a.shadow %s' % (columns, query))
+		if rows:
+			for (o, a, v, x) in rows:
+				if o in attributes:
+					attributes[o][a] = (v, x, 'var', scope)
+		else:
+			for (o, a, v) in self.db.select('%s %s' % (columns, query)):
+				if o in attributes:
+					attributes[o][a] = (v, None, 'var', scope)
+
+		return attributes
+
+
+	def getGlobalConsts(self, globs=None):
+		readonly = {}
+
+		if not self.wants(globs, self.globalConsts):
+			return readonly
+
+		for (ip, host, subnet, netmask) in self.db.select(
+				"""
+				n.ip, if (n.name <> NULL, n.name, nd.name),
+				s.address, s.mask from
+				networks n, appliances a, subnets s, nodes nd
+				where
+				n.node=nd.id and nd.appliance=a.id and
+				a.name='frontend' and n.subnet=s.id and
+				s.name='private'
+				"""):
+			readonly['Kickstart_PrivateKickstartHost'] = ip
+			readonly['Kickstart_PrivateAddress'] = ip
+			readonly['Kickstart_PrivateHostname'] = host
+			ipnetwork = ipaddress.IPv4Network(subnet + '/' + netmask)
+			readonly['Kickstart_PrivateBroadcast'] = '%s' % ipnetwork.broadcast_address
+
+		for (ip, host, zone, subnet, netmask) in self.db.select(
+				"""
+				n.ip, if (n.name <> NULL, n.name, nd.name),
+				s.zone, s.address, s.mask from
+				networks n, appliances a, subnets s, nodes nd
+				where
+				n.node=nd.id and nd.appliance=a.id and
+				a.name='frontend' and n.subnet=s.id and
+				s.name='public'
+				"""):
+			readonly['Kickstart_PublicAddress'] = ip
+			readonly['Kickstart_PublicHostname'] = '%s.%s' % (host, zone)
+			ipnetwork = ipaddress.IPv4Network(u'%s/%s' % (subnet, netmask))
+			readonly['Kickstart_PublicBroadcast'] = '%s' % ipnetwork.broadcast_address
+
+		for (name, subnet, netmask, zone) in self.db.select(
+				"""
+				name, address, mask, zone from
+				subnets
+				"""):
+			ipnetwork = ipaddress.IPv4Network(u'%s/%s' % (subnet, netmask))
+			if name == 'private':
+				readonly['Kickstart_PrivateDNSDomain'] = zone
+				readonly['Kickstart_PrivateNetwork'] = subnet
+				readonly['Kickstart_PrivateNetmask'] = netmask
+				readonly['Kickstart_PrivateNetmaskCIDR'] = '%s' % ipnetwork.prefixlen
+			elif name == 'public':
+				readonly['Kickstart_PublicDNSDomain'] = zone
+				readonly['Kickstart_PublicNetwork'] = subnet
+				readonly['Kickstart_PublicNetmask'] = netmask
+				readonly['Kickstart_PublicNetmaskCIDR'] = '%s' % ipnetwork.prefixlen
+
+		readonly['release'] = stack.release
+		readonly['version'] = stack.version
+
+		return readonly
+
+
+	def getHostPlacement(self, hosts):
+		"""Returns a dictionary of (rack, rank, environment, box,
+		os, appliance, longname) tuples for the HOSTS."""
+
+		placement = {}
+		if not hosts:
+			return placement
+
+		for (name, rack, rank, env, box, osname, appliance, longname) in self.db.select(
+				"""
+				n.name, n.rack, n.rank, e.name, b.name,
+				o.name, a.name, a.longname from nodes n
+				left join environments e on n.environment=e.id
+				left join boxes b on n.box=b.id
+				left join oses o on b.os=o.id
+				left join appliances a on n.appliance=a.id
+				where n.name in %s
+				""" % self.sqlList(hosts)):
+			placement[name] = (rack, rank, env, box, osname,
+					   appliance, longname)
+
+		return placement
+
+
+	def getBoxes(self, boxes):
+		"""Returns the pallets, carts, and OS version of the
+		BOXES, in the same form as 'list box'."""
+
+		info = {}
+		for box in boxes:
+			info[box] = { 'pallets'   : [],
+				      'carts'	  : [],
+				      'os.version': 'unknown' }
+		if not boxes:
+			return info
+
+		# Compute a version number for each os pallet
+		#
+		# If the pallet already has a '.' take everything
+		# before the '.' and add '.x'. If the version has no
+		# '.' add '.x'
+
+		versions = {}
+		for (name, version, rel) in self.db.select(
+				"""
+				distinct name, version, rel from rolls
+				where name in ('SLES', 'CentOS')
+				"""):
+			key = '%s-%s-%s' % (name, version, rel)
+			versions[key] = '%s.x' % version.split('.')[0]
+
+		for (box, name, version, rel) in self.db.select(
+				"""
+				b.name, r.name, r.version, r.rel from
+				rolls r, boxes b, stacks s where
+				b.id = s.box and s.roll = r.id and
+				b.name in %s
+				""" % self.sqlList(boxes)):
+			fullname = '%s-%s' % (name, version)
+			if rel:
+				fullname += '-%s' % rel
+			info[box]['pallets'].append(fullname)
+
+		for (box, cart) in self.db.select(
+				"""
+				b.name, c.name from
+				carts c, boxes b, cart_stacks s where
+				s.cart = c.id and s.box = b.id and
+				b.name in %s order by c.id
+				""" % self.sqlList(boxes)):
+			info[box]['carts'].append(cart)
+
+		for box in info:
+			for pallet in info[box]['pallets']:
+				if pallet in versions:
+					info[box]['os.version'] = versions[pallet]
+					break
+
+		return info
+
+
+	def getHostConsts(self, hosts, placement, globs=None):
+		"""Returns the constant attributes for the HOSTS.  Only the
+		queries needed to produce constants matched by GLOB are
+		run."""
+
+		readonly = {}
+		for host in hosts:
+			readonly[host] = {}
+
+		boxes = []
+		for host in hosts:
+			if host not in placement:
+				continue
+			(rack, rank, env, box, osname, appliance, longname) = placement[host]
+			r = readonly[host]
+			r['rack']     = rack
+			r['rank']     = rank
+			r['os']	      = osname
+			r['hostname'] = host
+			if env:
+				r['environment'] = env
+			if box and appliance:
+				r['box']		= box
+				r['appliance']		= appliance
+				r['appliance.longname'] = longname
+				if box not in boxes:
+					boxes.append(box)
+
+		if self.wants(globs, [ 'pallets', 'carts', 'os.version' ]):
+			info = self.getBoxes(boxes)
+			for host in hosts:
+				r = readonly[host]
+				if 'box' in r:
+					box = r['box']
+					r['pallets']	= info[box]['pallets']
+					r['carts']	= info[box]['carts']
+					r['os.version'] = info[box]['os.version']
+
+		if self.wants(globs, [ 'hostaddr', 'domainname' ]):
+			for (name, zone, address) in self.db.select(
+					"""
+					n.name, s.zone, nt.ip from
+					networks nt, nodes n, subnets s where
+					nt.main=true and nt.node=n.id and
+					nt.subnet=s.id and n.name in %s
+					""" % self.sqlList(hosts)):
+				readonly[name]['hostaddr']   = address
+				readonly[name]['domainname'] = zone
+
+		if not globs or [ g for g in globs if g[0] in '*?[g' ]:
+			for host in hosts:
+				if host in placement:
+					readonly[host]['groups'] = ''
+			for (name, group) in self.db.select(
+					"""
+					n.name, g.name from
+					groups g, memberships m, nodes n where
+					n.id = m.nodeid and g.id = m.groupid and
+					n.name in %s order by g.name
+					""" % self.sqlList(hosts)):
+				r = readonly[name]
+				r['group.%s' % group] = 'true'
+				if r['groups']:
+					r['groups'] += ' %s' % group
+				else:
+					r['groups'] = group
+
+		return readonly
+
+
+	def resolve(self, scope, targets, glob=None, var=True, const=True,
+		    resolve=True):
+		"""Returns a dictionary, keyed by target, of the attributes
+		for the TARGETS of SCOPE.  If GLOB is set only the matching
+		attributes are loaded and returned, GLOB can be a single
+		pattern or a list of patterns."""
+
+		if isinstance(glob, str):
+			globs = [ glob ] if glob else None
+		else:
+			globs = glob
+
+		if scope == 'global':
+			targets = [ 'global' ]
+
+		if var:
+			attributes = self.getVars(scope, targets, globs)
+		else:
+			attributes = {}
+			for target in targets:
+				attributes[target] = {}
+
+		if scope == 'global' and const:
+			for (key, value) in self.getGlobalConsts(globs).items():
+				attributes['global'][key] = (value, None, 'const', 'global')
+
+		placement = {}
+		if scope == 'host' and (const or resolve):
+			placement = self.getHostPlacement(targets)
+
+		if scope == 'host' and const:
+			readonly = self.getHostConsts(targets, placement, globs)
+			for host in targets:
+				a  = attributes[host]
+				r  = readonly[host]
+				ro = True
+
+				if 'const_overwrite' in a:
+
+					# This attribute allows a host to overwrite
+					# constant attributes. This is crazy dangerous,
+					# do not use this attribute.
+
+					(n, v, t, s) = a['const_overwrite']
+					ro = str2bool(v)
+
+				if ro:
+					for key in r: # slam consts on top of attrs
+						a[key] = (r[key], None, 'const', 'host')
+				else:
+					for key in r: # only add new consts to attrs
+						if key not in a:
+							a[key] = (r[key], None, 'const', 'host')
+
+		if resolve and scope == 'host':
+
+			# Load each parent scope once for all the targets
+			# that reference it.
+
+			parents = { 'environment': [],
+				    'appliance'  : [],
+				    'os'	 : [] }
+			for host in targets:
+				if host not in placement:
+					continue
+				(rack, rank, env, box, osname, appliance, longname) = placement[host]
+				for (s, name) in [ ('environment', env),
+						   ('appliance', appliance),
+						   ('os', osname) ]:
+					if name and name not in parents[s]:
+						parents[s].append(name)
+
+			scopes = {}
+			for s in parents:
+				if var:
+					scopes[s] = self.getVars(s, parents[s], globs)
+				else:
+					scopes[s] = {}
+
+			for host in targets:
+				if host not in placement:
+					continue
+				(rack, rank, env, box, osname, appliance, longname) = placement[host]
+				for (s, name) in [ ('environment', env),
+						   ('appliance', appliance),
+						   ('os', osname) ]:
+					if name not in scopes[s]:
+						continue
+					for (a, v) in scopes[s][name].items():
+						if a not in attributes[host]:
+							attributes[host][a] = v
+
+		if resolve and scope != 'global':
+			if var:
+				parent = self.getVars('global', [ 'global' ], globs)['global']
+			else:
+				parent = {}
+			if const:
+				for (key, value) in self.getGlobalConsts(globs).items():
+					parent[key] = (value, None, 'const', 'global')
+			for target in targets:
+				for (a, v) in parent.items():
+					if a not in attributes[target]:
+						attributes[target][a] = v
+
+		if globs:
+			for target in targets:
+				matches = {}
+				for key in self.match(globs, attributes[target].keys()):
+					matches[key] = attributes[target][key]
+				attributes[target] = matches
+
+		return attributes
+
 
 class Command:
 	"""Base class for all Stack commands the general command line form
@@ -1492,17 +2103,39 @@ class Command:
 	def __init__(self, database, debug=False):
 		"""Creates a DatabaseConnection for the StackCommand to use.
 		This is called for all commands, including those that do not
-		require a database connection."""
+		require a database connection.
+
+		If DATABASE is already a DatabaseConnection (a command
+		called from another command) its connection and query cache
+		are shared."""
 
 		stack.commands._debug = debug
 
-		self.db = DatabaseConnection(database)
+		if isinstance(database, DatabaseConnection):
+			self.db = DatabaseConnection(None, database)
+		else:
+			self.db = DatabaseConnection(database)
 
 		self.text  = ''
 		self.bytes = b''
 
 		
 		self.output = []
+
+		# When a command is run in-process through call() the
+		# output rows are kept as a list of dictionaries rather
+		# than being serialized.
+
+		self.structured = False
+		self.rows	= None
+
+		# When STREAM is set (a binary file object) the output is
+		# written to it as it is produced rather than buffered
+		# in the text.  See addText, beginOutput and endOutput.
+
+		self.stream	  = None
+		self.outputHeader = None
+		self.outputChunk  = []
 	
 		self.arch = os.uname()[4]
 		if self.arch in ['i386', 'i486', 'i586', 'i686']:
@@ -1627,13 +2260,24 @@ class Command:
 
 	def call(self, command, args=[]):
 		"""
-		Similar to the command method but uses the output-format=binary
-		to run a command and return a list of dictionary rows.
+		Similar to the command method but returns a list of
+		dictionary rows.  The command is run in-process, sharing
+		this command's database connection and cache, and the rows
+		are handed back directly without being serialized.
 		"""
 		# Do a copy of the args list
 		a = args[:]
 		a.append('output-format=binary')
-		s = self.command(command, a)
+		o = self.runCommand(command, a, structured=True)
+		if not o:
+			return []
+		if o.rows is not None:
+			return o.rows
+
+		# Commands that write their own output (rather than
+		# using endOutput) still return marshalled text.
+
+		s = o.getText()
 		if s:
 			return marshal.loads(s)
 
@@ -1646,9 +2290,37 @@ class Command:
 			sys.stderr.write('%s%s' % (_logPrefix, message))
 
 		
-	def command(self, command, args=[]):
+	def command(self, command, args=[], stream=False):
 		"""Import and run a Stack command.
-		Returns and output string."""
+		Returns and output string.
+
+		Commands that wrap another command set STREAM, if this
+		command is streaming its output the wrapped command writes
+		to the same stream."""
+
+		# Commands that wrap another command (e.g. list host attr)
+		# forward their arguments, including the output format.  When
+		# we are being called in-process pass the structured output
+		# of the wrapped command straight through.
+
+		structured = self.structured and 'output-format=binary' in args
+
+		if stream:
+			stream = self.stream
+		else:
+			stream = None
+
+		o = self.runCommand(command, args, structured, stream)
+		if not o:
+			return ''
+		if structured:
+			self.rows = o.rows
+		return o.getText()
+
+
+	def runCommand(self, command, args=[], structured=False, stream=None):
+		"""Import and run a Stack command in-process.  Returns the
+		command object, or None if COMMAND is not a command."""
 
 		modpath = 'stack.commands.%s' % command
 		#print('+ ', command)
@@ -1656,18 +2328,20 @@ class Command:
 		mod = eval(modpath)
 
 		try:
-			o = getattr(mod, 'Command')(self.db.database)
+			o = getattr(mod, 'Command')(self.db)
 			name = ' '.join(command.split('.'))
 		except AttributeError:
-			return ''
+			return None
 
 		# Call the command and store the return code in the
 		# class member self.rc so the caller can check
-		# the return code.  The actual text is what we return.
+		# the return code.
 
+		o.structured = structured
+		o.stream     = stream
 		self.rc = o.runWrapper(name, args, self.level + 1)
 		#print ('- ', command)
-		return o.getText()
+		return o
 
 
 	def loadPlugins(self):
@@ -1842,9 +2516,14 @@ class Command:
 		self.bytes = b''
 		
 	def addText(self, s):
-		"""Append a string to the output text buffer."""
+		"""Append a string to the output text buffer, or write it
+		to the output stream."""
 		if s:
-			if isinstance(s, str):
+			if self.stream is not None:
+				if isinstance(s, str):
+					s = s.encode()
+				self.stream.write(s)
+			elif isinstance(s, str):
 				self.text += s
 			else:
 				self.bytes += s
@@ -1857,9 +2536,19 @@ class Command:
 			return self.bytes
 		return None
 
-	def beginOutput(self):
-		"""Reset the output list buffer."""
-		self.output = []
+	def beginOutput(self, header=None):
+		"""Reset the output list buffer.  A command that knows the
+		HEADER (the same as it passes to endOutput) up front can
+		pass it here, then when streaming json or binary every row
+		is written as it is added rather than at endOutput."""
+		self.output	  = []
+		self.outputHeader = None
+		self.outputChunk  = []
+
+		if header and self.stream is not None and not self.structured:
+			(format, format_args) = self.getOutputFormat()
+			if format in [ 'json', 'binary' ]:
+				self.outputHeader = header
 		
 	def addOutput(self, owner, vals):
 		"""Append a list to the output list buffer."""
@@ -1876,18 +2565,48 @@ class Command:
 		else:
 			out.append(vals)
 
-		self.output.append(out)
+		if self.outputHeader:
+			self.streamRow(out)
+		else:
+			self.output.append(out)
+
+	def streamRow(self, line=None):
+		"""Writes the output LINE to the stream, json rows are
+		written one at a time and binary rows in chunks.  Without
+		a LINE the last binary chunk is written."""
+
+		(format, format_args) = self.getOutputFormat()
+		if format == 'json':
+			if line:
+				self.addText('%s\n' % json.dumps(
+					self.outputRow(self.outputHeader, line)))
+			return
+
+		if line:
+			self.outputChunk.append(self.outputRow(self.outputHeader, line))
+		if self.outputChunk and (not line or len(self.outputChunk) == 1000):
+			self.addText(marshal.dumps(self.outputChunk))
+			self.outputChunk = []
 		
 		
-	def endOutput(self, header=[], padChar='-', trimOwner=False):
-		"""Pretty prints the output list buffer."""
-
-		# Handle the simple case of no output, and bail out
-		# early.  We do this to avoid printing out nothing
-		# but a header w/o any rows.
+	def outputRow(self, header, line):
+		"""Returns the output LINE as a dictionary keyed by the
+		HEADER."""
+		dict = {}
+		for i in range(0, len(header)):
+			if header[i]:
+				key = header[i]
+				val = line[i]
+				if key in dict:
+					if not isinstance(dict[key], type([])):
+						dict[key] = [dict[key]]
+					dict[key].append(val)
+				else:
+					dict[key] = val
+		return dict
 
-		if not self.output:
-			return
+	def getOutputFormat(self):
+		"""Returns the OUTPUT-FORMAT parameter and its argument."""
 
 		# The OUTPUT-FORMAT option can change the default from
 		# human readable text to something else.  Currently
@@ -1898,7 +2617,9 @@ class Command:
 		# binary	- marshalled python
 		# text		- default (for humans)
 		
-		format = self._params.get('output-format')
+		format = None
+		if self._params:
+			format = self._params.get('output-format')
 		if not format:
 			format = 'text'
 
@@ -1910,6 +2631,27 @@ class Command:
 			format	    = tokens[0]
 			format_args = tokens[1].lower()
 
+		return (format, format_args)
+
+	def endOutput(self, header=[], padChar='-', trimOwner=False):
+		"""Pretty prints the output list buffer."""
+
+		# The rows were already written as they were added.
+
+		if self.outputHeader:
+			self.streamRow()
+			self.outputHeader = None
+			return
+
+		# Handle the simple case of no output, and bail out
+		# early.  We do this to avoid printing out nothing
+		# but a header w/o any rows.
+
+		if not self.output:
+			return
+
+		(format, format_args) = self.getOutputFormat()
+
 		if format in ['col', 'shell', 'json', 'python', 'binary']:
 			if not header: # need to build a generic header
 				if len(self.output) > 0:
@@ -1919,20 +2661,23 @@ class Command:
 				header = []
 				for i in range(0, rows):
 					header.append('col-%d' % i)
+
+			# When streaming the rows of a command that did
+			# not give its header to beginOutput are written
+			# now, in the same form.
+
+			if self.stream is not None and format in [ 'json', 'binary' ]:
+				self.outputHeader = header
+				for line in self.output:
+					self.streamRow(line)
+				self.streamRow()
+				self.outputHeader = None
+				self.output	  = []
+				return
+
 			list = []
 			for line in self.output:
-				dict = {}
-				for i in range(0, len(header)):
-					if header[i]:
-						key = header[i]
-						val = line[i]
-						if key in dict:
-							if not isinstance(dict[key], list):
-								dict[key] = [dict[key]]
-							dict[key].append(val)
-						else:
-							dict[key] = val
-				list.append(dict)
+				list.append(self.outputRow(header, line))
 			if format == 'col':
 				for row in list:
 					try:
@@ -1951,6 +2696,8 @@ class Command:
 					self.addText('\n')
 			elif format == 'python':
 				self.addText('%s' % list)
+			elif format == 'binary' and self.structured:
+				self.rows = list
 			elif format == 'binary':
 				self.addText(marshal.dumps(list))
 			else:
@@ -2276,9 +3023,70 @@ class Command:
 		return self.getHostAttr('localhost', attr)
 
 	def getHostAttr(self, host, attr):
-		for row in self.call('list.host.attr', [host, 'attr=%s' % attr]):
-			return row['value']
-		return None
+		return self.getHostAttrs([ host ], [ attr ]).get(host, {}).get(attr)
+
+	def getHostAttrs(self, hosts, attrs=None, shadow=True):
+		"""Returns a dictionary of {host: {attr: value}} for the
+		HOSTS.  If ATTRS is a list of attribute names (or globs)
+		only those attributes are resolved, otherwise all the
+		attributes are returned.
+
+		All the hosts are resolved in a single pass so the number
+		of database queries does not depend on the number of hosts.
+		Use this rather than calling getHostAttr in a loop."""
+
+		# Normalize the hostnames.  Names, addresses, MACs and
+		# FQDNs are all resolved with a single query, only names
+		# the database knows nothing about (DNS aliases) are left
+		# to getHostname.
+
+		resolver = AttributeResolver(self.db)
+		names	 = {}
+		if hosts:
+			bases  = [ h.split('.')[0] for h in hosts ]
+			byName = {}
+			byAddr = {}
+			byFQDN = {}
+			for (name, ip, mac, netname, zone) in self.db.select("""
+				n.name, nt.ip, nt.mac, nt.name, s.zone from nodes n
+				left join networks nt on nt.node=n.id
+				left join subnets s on nt.subnet=s.id
+				where n.name in %s or nt.ip in %s or nt.mac in %s or
+				n.name in %s or nt.name in %s
+				""" % (resolver.sqlList(hosts), resolver.sqlList(hosts),
+				       resolver.sqlList(hosts), resolver.sqlList(bases),
+				       resolver.sqlList(bases))):
+				byName[name.lower()] = name
+				if mac:
+					byAddr.setdefault(mac.lower(), name)
+				if ip:
+					byAddr.setdefault(ip, name)
+				if zone:
+					byFQDN.setdefault('%s.%s' % (name, zone), name)
+					if netname:
+						byFQDN.setdefault('%s.%s' % (netname, zone), name)
+
+			for host in hosts:
+				if host.lower() in byName:
+					names[host] = byName[host.lower()]
+				elif host.lower() in byAddr:
+					names[host] = byAddr[host.lower()]
+				elif host in byFQDN:
+					names[host] = byFQDN[host]
+				else:
+					names[host] = self.db.getHostname(host)
+
+		attributes = resolver.resolve('host', [ n for n in set(names.values()) ], attrs)
+
+		result = {}
+		for host in hosts:
+			result[host] = {}
+			for (a, (v, x, t, s)) in attributes[names[host]].items():
+				if x and shadow:
+					v = x
+				result[host][a] = v
+
+		return result
 
 
 
@@ -124,3 +124,7 @@ class Command(stack.commands.CartArgumentProcessor,
 					os.chmod(filepath, perms)
 				except:
 					pass
+
+		# build the repo now rather than on the first install
+
+		self.command('compile.cart', [ cart ])
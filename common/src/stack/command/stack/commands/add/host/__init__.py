@@ -90,20 +90,7 @@ class Command(command):
 	
 		appliances = self.getApplianceNames()
 
-		appliance = None
-		rack = None
-		rank = None
-
-		try:
-			basename, rack, rank = host.split('-')
-			if basename in appliances:
-				appliance = basename
-				rack = (rack)
-				rank = (rank)
-		except:
-			appliance = None
-			rack = None
-			rank = None
+		(appliance, rack, rank) = self.getHostPlacement(host, appliances)
 				
 		# fillParams with the above default values
 		(appliance, longname, rack, rank, box, environment,
@@ -12,6 +12,104 @@ import subprocess
 import stack.commands
 import stack.lock
 
+CartDir	  = '/export/stack/carts'
+MutexFile = '/var/tmp/cart.%s.mutex'
+
+
+def Fingerprint(cartpath):
+	"""
+	Returns the size and mtime of every file in the cart
+	"""
+	repodata = os.path.join(cartpath, 'repodata')
+	newfinger = {}
+
+	for dirpath, dirnames, filenames in os.walk(cartpath):
+		#
+		# ignore 'repodata' directory
+		#
+		if dirpath == repodata:
+			continue
+
+		for file in filenames:
+			#
+			# ignore the 'fingerprint' file
+			#
+			if file == 'fingerprint':
+				continue
+
+			filepath = os.path.join(dirpath, file)
+			filestat = os.stat(filepath)
+			fsize = '%d' % filestat.st_size
+			fmtime = '%d' % filestat.st_mtime
+
+			newfinger[filepath] = {
+				'size' : fsize, 
+				'mtime' : fmtime }
+
+	return newfinger
+
+
+def ReadFingerprint(cartpath):
+	"""
+	Returns the fingerprint saved the last time the cart was compiled
+	"""
+	fingerprint = os.path.join(cartpath, 'fingerprint')
+	existingfinger = {}
+
+	if os.path.exists(fingerprint):
+		file = open(fingerprint)
+		for line in file.readlines():
+			l = line.split()
+			if len(l) == 3:
+				fname = l[0].strip()
+				fsize = l[1].strip()
+				fmtime = l[2].strip()	
+
+				existingfinger[fname] = {
+					'size'  : fsize, 
+					'mtime' : fmtime }
+		file.close()
+
+	return existingfinger
+
+
+def Changed(cart):
+	"""
+	Returns True if the cart needs to be compiled.  This only stats the
+	files in the cart and is cheap compared to running 'compile cart'.
+	"""
+	cartpath = os.path.join(CartDir, cart)
+	if not os.path.exists(os.path.join(cartpath, 'repodata')):
+		return True
+	return ReadFingerprint(cartpath) != Fingerprint(cartpath)
+
+
+def Compiling(cart):
+	"""
+	Returns True if the cart is being compiled
+	"""
+	try:
+		mutex = stack.lock.Mutex(MutexFile % cart)
+	except OSError:
+		return False
+	if mutex.acquire_nonblocking():
+		return True
+	mutex.release()
+	return False
+
+
+def Compile(cart):
+	"""
+	Forks off 'compile cart' (it may take a long time) if the cart has
+	changed since it was compiled and no one is compiling it already.
+	Returns True if it did.
+	"""
+	if Compiling(cart) or not Changed(cart):
+		return False
+	subprocess.Popen([ '/opt/stack/bin/stack', 'compile', 'cart', cart ],
+		stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	return True
+
 
 class Command(stack.commands.CartArgumentProcessor,
 	stack.commands.compile.command):
@@ -35,53 +133,12 @@ class Command(stack.commands.CartArgumentProcessor,
 		# compile a repo for the cart, but only if the cart has been
 		# changed since the last time we ran this command
 		#
-		cartpath = '/export/stack/carts/%s' % cart
+		cartpath = os.path.join(CartDir, cart)
 		repodata = os.path.join(cartpath, 'repodata')
 		fingerprint = os.path.join(cartpath, 'fingerprint')
-		existingfinger = {}
-
-		if os.path.exists(fingerprint):
-			file = open(fingerprint)
-			for line in file.readlines():
-				l = line.split()
-				if len(l) == 3:
-					fname = l[0].strip()
-					fsize = l[1].strip()
-					fmtime = l[2].strip()	
-
-					existingfinger[fname] = {
-						'size'  : fsize, 
-						'mtime' : fmtime }
-			file.close()
-
-		newfinger = {}
+		existingfinger = ReadFingerprint(cartpath)
+		newfinger = Fingerprint(cartpath)
 
-		for dirpath, dirnames, filenames in os.walk(cartpath):
-			#
-			# ignore 'repodata' directory
-			#
-			if dirpath == repodata:
-				continue
-
-			for file in filenames:
-				#
-				# ignore the 'fingerprint' file
-				#
-				if file == 'fingerprint':
-					continue
-
-				filepath = os.path.join(dirpath, file)
-				filestat = os.stat(filepath)
-				fsize = '%d' % filestat.st_size
-				fmtime = '%d' % filestat.st_mtime
-
-				#
-				# always populate 'newfinger' 
-				#
-				newfinger[filepath] = {
-					'size' : fsize, 
-					'mtime' : fmtime }
-				
 		#
 		# now figure out if the cart has changed since the last time
 		# the fingerprint was calculated
@@ -103,7 +160,7 @@ class Command(stack.commands.CartArgumentProcessor,
 				| stat.S_IWGRP
 
 			try:
-				os.chmod(dirpath, perms)
+				os.chmod(cartpath, perms)
 			except:
 				pass
 
@@ -189,7 +246,7 @@ class Command(stack.commands.CartArgumentProcessor,
 			#
 			# ensure only one process can update the cart at a time
 			#
-			mutexfile = '/var/tmp/cart.%s.mutex' % cart
+			mutexfile = MutexFile % cart
 			mutex = stack.lock.Mutex(mutexfile)
 
 			gr_name, gr_passwd, gr_gid, gr_mem = \
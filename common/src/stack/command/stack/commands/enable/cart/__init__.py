@@ -64,6 +64,10 @@ class Command(stack.commands.CartArgumentProcessor,
 					(select id from carts where name='%s')
 					)""" % (box, cart))
 
+			# build the repo now rather than on the first install
+
+			self.command('compile.cart', [ cart ])
+
 		# Regenerate stacki.repo
 		os.system("""
 			/opt/stack/bin/stack report host repo localhost | 
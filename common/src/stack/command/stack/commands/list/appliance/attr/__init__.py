@@ -21,6 +21,6 @@ class Command(stack.commands.list.appliance.command):
 	"""
 
 	def run(self, params, args):
-		self.addText(self.command('list.attr', self._argv + [ 'scope=appliance' ]))
+		self.addText(self.command('list.attr', self._argv + [ 'scope=appliance' ], stream=True))
 		return self.rc
 
@@ -0,0 +1,46 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import stack.commands
+import stack.querycache
+
+
+class Command(stack.commands.list.command):
+	"""
+	List the statistics of the shared database query cache.  The
+	shared cache is enabled by setting the STACKSHAREDCACHE
+	environment variable to "yes".
+
+	The hits, misses, and invalidations are counted (without
+	locking, so approximately) across all processes; the entries
+	and bytes are for the calling user.  Only root and the apache
+	user can use the shared cache.
+
+	<example cmd='list cache'>
+	List the shared query cache statistics.
+	</example>
+	"""
+
+	def run(self, params, args):
+
+		shared = self.db.shared
+		if not shared:
+			if not os.path.exists(stack.querycache.CacheDir):
+				return
+			try:
+				shared = stack.querycache.QueryCache()
+			except OSError:
+				return
+
+		stats = shared.stats()
+
+		self.beginOutput()
+		self.addOutput(shared.path, (stats['hits'], stats['misses'],
+			stats['invalidations'], stats['entries'],
+			stats['bytes']))
+		self.endOutput(header=['cache', 'hits', 'misses',
+			'invalidations', 'entries', 'bytes'], trimOwner=False)
@@ -21,5 +21,5 @@ class Command(stack.commands.list.environment.command):
 	"""
 
 	def run(self, params, args):
-		self.addText(self.command('list.attr', self._argv + [ 'scope=environment' ]))
+		self.addText(self.command('list.attr', self._argv + [ 'scope=environment' ], stream=True))
 		return self.rc
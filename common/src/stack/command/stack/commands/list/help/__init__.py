@@ -14,6 +14,7 @@
 import os
 import stack.file
 import stack.commands
+import stack.commandindex
 from stack.exception import CommandError
 
 
@@ -60,14 +61,22 @@ class Command(stack.commands.list.command):
 			filepath = stack.commands.__path__[0]
 			modpath  = 'stack.commands'
 		
-		tree = stack.file.Tree(filepath)
-		dirs = sorted(tree.getDirs())
+		tree  = stack.file.Tree(filepath)
+		dirs  = sorted(tree.getDirs())
+		index = stack.commandindex.Load() or {}
 
 		for dir in dirs:
 			if not dir:
 				continue
 				
 			module = '%s.%s' % (modpath, '.'.join(dir.split(os.sep)))
+
+			# Don't import the packages the index knows have
+			# no Command.
+
+			if index.get(module[len('stack.commands.'):]) is False:
+				continue
+
 			try:
 				__import__(module)
 			except ImportError:
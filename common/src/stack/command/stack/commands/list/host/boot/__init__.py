@@ -47,14 +47,16 @@ class Command(stack.commands.list.host.command):
 			boot[h] = b
 
 		self.beginOutput()
-		for host in self.getHostnames(args):
+		hosts = self.getHostnames(args)
+		attrs = self.getHostAttrs(hosts, [ 'nukedisks', 'nukecontroller' ])
+		for host in hosts:
 			nukecontroller = False
-			nukedisks = self.getHostAttr(host, 'nukedisks')
+			nukedisks = attrs[host].get('nukedisks')
 			if not nukedisks:
 				nukedisks = False
 			else:
 				nukedisks = self.str2bool(nukedisks)
-			nukecontroller = self.getHostAttr(host, 'nukecontroller')
+			nukecontroller = attrs[host].get('nukecontroller')
 			if not nukecontroller:
 				nukecontroller = False
 			else:
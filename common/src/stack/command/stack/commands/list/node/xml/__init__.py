@@ -13,12 +13,11 @@
 
 
 import os
-import subprocess
 import stack
 import stack.profile
 import stack.commands
+import stack.commands.compile.cart
 from stack.exception import ArgRequired, CommandError
-from xml.sax import make_parser
 from xml.sax import saxutils
 
 
@@ -192,57 +191,32 @@ class Command(stack.commands.list.command,
 		# get the carts associated with the box
 		#
 		output = self.call('list.cart')
-		devnull = open('/dev/null', 'w')
 		for o in output:
 			if attrs['box'] in o['boxes'].split():
 				items.append(os.path.join('/export', 'stack',
 					'carts', o['name']))
 	
 				#
-				# if a cart has changed since the last time we
-				# built a kickstart file, we will need to
-				# 'compile' it which may take a long time
-				# (because we create a repo in the cart and
-				# if there are a lot of RPMS the checksum will
-				# take a long time) -- so, let's fork off the
-				# cart compilation.
+				# carts are compiled when they are added,
+				# enabled, or unpacked.  If a cart has been
+				# changed by hand since, compile it unless
+				# another profile request already does.
 				#
-				subprocess.Popen([ '/opt/stack/bin/stack',
-					'compile', 'cart', o['name'] ],
-					stdout=devnull, stderr=devnull)
+				stack.commands.compile.cart.Compile(o['name'])
 
 		if basedir:
 			if os.path.exists(basedir) and os.path.isdir(basedir):
 				items = [os.path.realpath(basedir)]
 
-		handler = stack.profile.GraphHandler(attrs, directories=items)
-
-		for item in items:
-			graph = os.path.join(item, 'graph')
-			if not os.path.exists(graph):
-				continue
+		# Parsing and traversing the graph is the same for every
+		# host using these pallets and carts, the cache only redoes
+		# it when a graph file changes.
 
-			for file in os.listdir(graph):
-				base, ext = os.path.splitext(file)
-				if ext == '.xml':
-					parser = make_parser(["stack.expatreader"])
-					parser.setContentHandler(handler)
-					parser.feed(handler.getXMLHeader())
-					with open(os.path.join(graph, file), 'r') as xml:
-						for line in xml.readlines():
-							if line.find('<?xml') != -1:
-								continue
-							parser.feed(line)
-
-
-		graph = handler.getMainGraph()
-		if graph.hasNode(root):
-			root = graph.getNode(root)
-		else:
+		handler = stack.profile.GraphHandler(attrs, directories=items)
+		result  = stack.profile.GraphCache(items).traverse(handler, root)
+		if not result:
 			raise CommandError(self, 'node "%s" not in graph' % root)
-
-		nodes = stack.profile.FrameworkIterator(graph).run(root)
-		deps  = stack.profile.OrderIterator(handler.getOrderGraph()).run()
+		(nodes, deps) = result
 
 		# Initialize the hash table for the framework
 		# nodes, and filter out everyone not for our
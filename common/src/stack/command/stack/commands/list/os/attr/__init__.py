@@ -22,6 +22,6 @@ class Command(stack.commands.list.os.command):
 	"""
 
 	def run(self, params, args):
-		self.addText(self.command('list.attr', self._argv + [ 'scope=os' ]))
+		self.addText(self.command('list.attr', self._argv + [ 'scope=os' ], stream=True))
 		return self.rc
 
@@ -54,6 +54,7 @@ class Command(stack.commands.load.command):
 
 		self.hosts = {}
 		self.interfaces = {}
+		self.removed = []
 
 		sys.stderr.write('Loading Spreadsheet\n')
 		self.runImplementation('load_%s' % processor, (filename, ))
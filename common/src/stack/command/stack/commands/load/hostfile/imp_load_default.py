@@ -33,18 +33,22 @@ class Implementation(stack.commands.ApplianceArgumentProcessor,
 				% appliance
 			raise CommandError(self.owner, msg)
 
-	def checkIP(self, ip):
-		for o in self.list_host_interface:
-			if o['ip'] == ip:
-				msg = 'IP "%s" is already in the database' % ip
-				raise CommandError(self.owner, msg)
+	# The interfaces of the hosts in the spreadsheet are replaced,
+	# so an IP or MAC only conflicts with the interface of a host
+	# that is not being loaded.
+
+	def checkIP(self, ip, vlan):
+		host = self.ips.get((ip, vlan))
+		if host and host not in self.owner.interfaces:
+			msg = 'IP "%s" is already in the database' % ip
+			raise CommandError(self.owner, msg)
 
 	def checkMAC(self, mac):
-		for o in self.list_host_interface:
-			if o['mac'].lower() == mac:
-				msg = 'MAC "%s" is already in the database' \
-					% mac
-				raise CommandError(self.owner, msg)
+		host = self.macs.get(mac)
+		if host and host not in self.owner.interfaces:
+			msg = 'MAC "%s" is already in the database' \
+				% mac
+			raise CommandError(self.owner, msg)
 
 	def checkNetwork(self, network):
 		if network not in self.networks:
@@ -62,13 +66,24 @@ class Implementation(stack.commands.ApplianceArgumentProcessor,
 
 		self.list_host_interface = \
 			self.owner.call('list.host.interface')
+
+		# Index the existing interfaces by IP (per VLAN) and MAC
+
+		self.ips  = {}
+		self.macs = {}
+		for o in self.list_host_interface:
+			if o['ip']:
+				self.ips[(o['ip'], o['vlan'] or 'default')] = o['host']
+			if o['mac']:
+				self.macs[o['mac'].lower()] = o['host']
+
 		self.appliances = self.getApplianceNames()
 		# need all the info from networks(/subnets)
 		self.networks = dict((k, next(v)) for k, v in groupby(self.owner.call('list.network'), itemgetter('network')))
 		self.boxes = self.getBoxNames()
 		self.actions = [entry['bootaction'] for entry in self.owner.call('list.bootaction')]
 
-		reader = stack.csv.reader(open(filename, 'rU'))
+		reader = stack.csv.reader(open(filename, 'r'))
 
 		header = None
 		for row in reader:
@@ -277,23 +292,24 @@ class Implementation(stack.commands.ApplianceArgumentProcessor,
 
 		if hasboss:
 			#
-			# now remove all hosts not associated with this Boss
+			# now remove all hosts not associated with this Boss,
+			# the load plugin removes them from the database
 			#
-			for name in self.owner.hosts.keys():
-				if self.owner.hosts[name]['boss'] != thisboss:
+			existing = set([ o['host'] for o in self.list_host_interface ])
+			for name in list(self.owner.hosts.keys()):
+				if self.owner.hosts[name].get('boss') != thisboss:
 					del self.owner.hosts[name]
+					self.owner.interfaces.pop(name, None)
 
-					for o in self.list_host_interface:
-						if o['name'] == name:
-							self.owner.call(
-								'remove.host',
-								[ name ])
+					if name in existing:
+						self.owner.removed.append(name)
 
 		#
 		# sanity checks
 		#
-		macs = []
+		macs = set()
 		ips = {}
+		subnets = {}
 		for name in self.owner.hosts.keys():
 			#
 			# ensure at least one of the host entries has an
@@ -352,27 +368,27 @@ class Implementation(stack.commands.ApplianceArgumentProcessor,
 				except:
 					vlan = 'default'
 				if ip:
-#					self.checkIP(ip)
+					self.checkIP(ip, vlan)
 					if vlan in ips:
 						if ip in ips[vlan]:
 							msg = 'duplicate IP "%s" in the input file' % ip
 							raise CommandError(self.owner, msg)
 					else:
-						ips[vlan] = []
+						ips[vlan] = set()
 
-					ips[vlan].append(ip)
+					ips[vlan].add(ip)
 
 				try:
 					mac = self.owner.interfaces[name][interface]['mac']
 				except:
 					mac = None
 				if mac:
-#					self.checkMAC(mac)
+					self.checkMAC(mac)
 					if mac in macs:
 						msg = 'duplicate MAC "%s" in the input file' % mac
 						raise CommandError(self.owner, msg)
 
-					macs.append(mac)
+					macs.add(mac)
 
 				try:
 					network = self.owner.interfaces[name][interface]['network']
@@ -383,8 +399,10 @@ class Implementation(stack.commands.ApplianceArgumentProcessor,
 
 					# check if 'ip' could exist in 'network'
 					network_ip, netmask = itemgetter('address', 'mask')(self.networks[network])
-					ipnetwork = ipaddress.IPv4Network(network_ip + '/' + netmask)
-					if ipaddress.IPv4Address(ip) not in ipnetwork:
+					if network not in subnets:
+						subnets[network] = ipaddress.IPv4Network(network_ip + '/' + netmask)
+					ipnetwork = subnets[network]
+					if ip and ipaddress.IPv4Address(ip) not in ipnetwork:
 						msg = 'IP "%s" is not in the "%s" IP space (%s/%s)' % (ip, network, network_ip, ipnetwork.prefixlen)
 						raise CommandError(self.owner, msg)
 
@@ -9,201 +9,287 @@
 import sys
 import stack.commands
 from stack.bool import str2bool
+from stack.exception import CommandError
+
+# Rows per statement for the deletes and updates, keeps each
+# statement well below the server's max_allowed_packet.  pymysql
+# splits the multi-row inserts itself.
+
+Chunk = 1000
 
 
 class Plugin(stack.commands.HostArgumentProcessor, stack.commands.Plugin):
+	"""
+	Loads the hosts and interfaces of the spreadsheet with a few
+	multi-row statements per table (rather than a command per host
+	and interface) inside a single transaction, so a spreadsheet is
+	either loaded completely or not at all.
+	"""
 
 	def provides(self):
 		return 'default'
 
 
-	def removeInterfaces(self, host):
-		output = self.owner.call('list.host.interface', [ host ])
-		for v in output:
-			if v['interface']:
-				self.owner.call('remove.host.interface',
-					[ host, 'interface=%s' % v['interface'] ])
+	def insert(self, table, columns, rows):
+		if rows:
+			self.db.executemany('insert into %s (%s) values (%s)' %
+				(table, ', '.join(columns),
+				 ', '.join([ '%s' ] * len(columns))), rows)
+
+
+	def delete(self, table, column, ids):
+		ids = sorted(ids)
+		for i in range(0, len(ids), Chunk):
+			self.db.execute('delete from %s where %s in (%s)' %
+				(table, column,
+				 ', '.join([ '%d' % id for id in ids[i:i + Chunk] ])))
+
+
+	def update(self, column, values):
+		"""Sets the nodes COLUMN, VALUES maps node ids to values."""
+
+		ids = sorted(values)
+		for i in range(0, len(ids), Chunk):
+			chunk = ids[i:i + Chunk]
+			self.db.execute("""
+				update nodes set %s = case id %s end
+				where id in (%s)
+				""" % (column,
+				' '.join([ 'when %d then %%s' % id for id in chunk ]),
+				', '.join([ '%d' % id for id in chunk ])),
+				[ values[id] for id in chunk ])
+
+
+	def nodes(self):
+		return dict((name, id) for (id, name) in
+			    self.db.select('id, name from nodes'))
+
+
+	def bootaction(self, action, type):
+		try:
+			return self.bootnames[(action.lower(), type)]
+		except KeyError:
+			raise CommandError(self.owner,
+				'bootaction %s does not exist' % action)
+
+
+	def defaultaction(self, type, osid):
+		for os in [ osid, 0 ]:
+			if (type, os) in self.defaults:
+				return self.defaults[(type, os)]
+		osname = self.oses.get(osid, osid)
+		raise CommandError(self.owner,
+			'Cannot find default %s action for OS %s' % (type, osname))
 
 
 	def run(self, args):
 		hosts, interfaces = args
-		existinghosts = self.getHostnames()
-		existing_memberships = {}
-		existing_groups = {}
-		for group in self.owner.call('list.group'):
-			existing_groups[group['group']] = group['hosts']
-		for member in self.owner.call('list.host.group'):
-			existing_memberships[member['host']] = member['groups'].split()
-
-		# prune group assignments for incoming hosts
-		for host in hosts.keys():
-			# no need to prune hosts not from the spreadsheet, or totally new hosts
-			if host not in existinghosts:
+
+		self.appliances = dict((name, id) for (id, name) in
+			self.db.select('id, name from appliances'))
+		self.boxes = dict((name, (id, os)) for (id, name, os) in
+			self.db.select('id, name, os from boxes'))
+		self.oses = dict((id, name) for (id, name) in
+			self.db.select('id, name from oses'))
+		self.subnets = dict((name, id) for (id, name) in
+			self.db.select('id, name from subnets'))
+		self.bootnames = dict(((name, type), id) for (id, name, type) in
+			self.db.select('id, name, type from bootnames'))
+		self.defaults = dict(((type, os), id) for (id, type, os) in
+			self.db.select("""
+				b.id, b.type, ba.os from bootnames b, bootactions ba
+				where b.name='default' and b.id=ba.bootname
+				"""))
+
+		self.db.execute('start transaction')
+		try:
+			# Hosts of other frontends (the boss column)
+
+			if self.owner.removed:
+				self.owner.call('remove.host',
+					self.owner.removed + [ 'sync=false' ])
+
+			existing = self.nodes()
+			self.loadHosts(hosts, existing)
+			self.loadGroups(hosts, existing)
+			self.loadInterfaces(interfaces)
+		except:
+			self.db.execute('rollback')
+			raise
+		self.db.execute('commit')
+
+
+	def loadHosts(self, hosts, existing):
+		sys.stderr.write('\tAdd Host\n')
+
+		rows	= []
+		columns = {
+			'appliance'	: {},
+			'box'		: {},
+			'rack'		: {},
+			'rank'		: {},
+			'comment'	: {},
+			'osaction'	: {},
+			'installaction' : {}
+			}
+
+		for host in sorted(hosts.keys()):
+			info = hosts[host]
+
+			comment = info.get('comment')
+			if comment and len(comment) > 140:
+				raise CommandError(self.owner,
+					'comments must be no longer than 140 characters')
+
+			actions = {}
+			for (key, type) in [ ('osaction', 'os'),
+					     ('installaction', 'install') ]:
+				if key in info:
+					actions[key] = self.bootaction(info[key], type)
+
+			if host in existing:
+				id = existing[host]
+				if 'appliance' in info:
+					columns['appliance'][id] = self.appliances[info['appliance']]
+				if 'box' in info:
+					columns['box'][id] = self.boxes[info['box']][0]
+				for key in [ 'rack', 'rank', 'comment' ]:
+					if key in info:
+						columns[key][id] = info[key]
+				for key in actions:
+					columns[key][id] = actions[key]
 				continue
 
-			for group in existing_memberships[host]:
-				self.owner.call('remove.host.group', [host, 'group=%s' % group])
+			# New host, same defaults as 'add host'
 
+			(appliance, rack, rank) = \
+				self.getHostPlacement(host, self.appliances)
+			appliance = info.get('appliance', appliance)
+			rack	  = info.get('rack', rack)
+			rank	  = info.get('rank', rank)
+			if appliance is None:
+				raise CommandError(self.owner,
+					'appliance required for host "%s"' % host)
+			if rack is None:
+				raise CommandError(self.owner,
+					'rack number required for host "%s"' % host)
+			if rank is None:
+				raise CommandError(self.owner,
+					'rank number required for host "%s"' % host)
 
+			box = info.get('box', 'default')
+			if box not in self.boxes:
+				raise CommandError(self.owner,
+					'box "%s" is not in the database' % box)
+			(boxid, osid) = self.boxes[box]
 
-		sys.stderr.write('\tAdd Host\n')
-		for host in hosts.keys():
-
-			sys.stderr.write('\t\t%s\r' % host)
-
-			#
-			# add the host if it doesn't exist
-			#
-			if host not in existinghosts:
-				args         = [ host ]
-				appliance    = hosts[host].get('appliance')
-				box          = hosts[host].get('box')
-				rack         = hosts[host].get('rack')
-				rank         = hosts[host].get('rank')
-
-				for paramName in [ 'appliance', 'box',
-						   'rack', 'rank' ]:
-					paramValue = hosts[host].get(paramName)
-					if paramValue:
-						args.append('%s=%s' %
-							(paramName, paramValue))
-						del hosts[host][paramName]
-
-				self.owner.call('add.host', args)
-
-			if 'installaction' in hosts[host]:
-				self.owner.call('set.host.bootaction', 
-						[ host,
-						  'sync=false',
-						  'type=install',
-						  'action=%s' % hosts[host]['installaction']
-					  ])
-				del hosts[host]['installaction']
-			if 'osaction' in hosts[host]:
-				self.owner.call('set.host.bootaction', 
-						[ host, 
-						  'sync=false',
-						  'type=os',
-						  'action=%s' % hosts[host]['osaction']
-					  ])
-				del hosts[host]['osaction']
-
-			if 'groups' in hosts[host]:
-				for groupname in hosts[host]['groups']:
-					if groupname not in existing_groups:
-						self.owner.call('add.group', [groupname])
-						existing_groups[groupname] = None
-
-					param = 'group=%s' % groupname
-					self.owner.call('add.host.group', [host, param])
-				del hosts[host]['groups']
-			#
-			# set the host attributes that are explicitly 
-			# identified in the spreadsheet
-			#
-			for key in hosts[host].keys():
-				if key == 'boss':
-					continue
-
-				if key == 'comment':
-					self.owner.call('set.host.comment',
-						[ host, 'comment=%s'
-						% hosts[host][key] ])
-				else:
-					self.owner.call('set.host.%s' % key,
-						[ host, '%s=%s' % (key, hosts[host][key]) ])
-
-
-			sys.stderr.write('\t\t%s\r' % (' ' * len(host)))
-
-
-		#
-		# process the host's interface(s) 
-		#
-
-		hosts = interfaces.keys()
-		argv = []
-		for a in interfaces.keys():
-			argv.append(a)
-
-		if argv: # remove previous host interfaces (if any)
-			argv.append('all=true')
-			self.owner.call('remove.host.interface', argv)
-		
-		sys.stderr.write('\tAdd Host Interface\n')
-		for host in hosts:
+			osaction = actions.get('osaction')
+			if osaction is None:
+				osaction = self.defaultaction('os', osid)
+			installaction = actions.get('installaction')
+			if installaction is None:
+				installaction = self.defaultaction('install', osid)
+
+			rows.append((host, self.appliances[appliance],
+				     boxid, rack, rank, osaction, installaction,
+				     comment))
+
+		self.insert('nodes', [ 'name', 'appliance', 'box', 'rack', 'rank',
+				       'osaction', 'installaction', 'comment' ],
+			    rows)
 
-			sys.stderr.write('\t\t%s\r' % host)
-			
-			for interface in interfaces[host].keys():
-				ip = None
-				mac = None
-				network = None
-				ifhostname = None
-				channel = None
-				options = None
-				vlan = None
-				default = None
-
-				if 'ip' in interfaces[host][interface].keys():
-					ip = interfaces[host][interface]['ip']
-				if 'mac' in interfaces[host][interface].keys():
-					mac = interfaces[host][interface]['mac']
-				if 'network' in interfaces[host][interface].keys():
-					network = interfaces[host][interface]['network']
-				if 'ifhostname' in interfaces[host][interface].keys():
-					ifhostname = interfaces[host][interface]['ifhostname']
-				if 'channel' in interfaces[host][interface].keys():
-					channel = interfaces[host][interface]['channel']
-				if 'options' in interfaces[host][interface].keys():
-					options = interfaces[host][interface]['options']
-				if 'vlan' in interfaces[host][interface].keys():
-					vlan = interfaces[host][interface]['vlan']
-				if 'default' in interfaces[host][interface].keys():
-					default = str2bool(interfaces[host][interface]['default'])
-				else:
-					default = False
-
-				#
-				# now add the interface
-				#
-				cmdparams = [ host,
-					'unsafe=true', 
-					'interface=%s' % interface,
-					'default=%s' % default ]
-				if mac:
-					cmdparams.append('mac=%s' % mac)
-				if ip:
-					cmdparams.append('ip=%s' % ip)
-				if network:
-					cmdparams.append('network=%s' % network)
-				if ifhostname:
-					cmdparams.append('name=%s' % ifhostname)
-				if vlan:
-					cmdparams.append('vlan=%d' % vlan)
-				if default:
-					cmdparams.append('name=%s' % host)
-				if 'bond' == interface[:4]:
-					cmdparams.append('module=bonding')
-
-				self.owner.call('add.host.interface', cmdparams)
-
-				if channel:
-					cmdparams = [ host,
-						'interface=%s' % interface,
-						'channel=%s' % channel ]
-					self.owner.call(
-						'set.host.interface.channel',
-						cmdparams)
-
-				if options:
-					cmdparams = [ host,
-						'interface=%s' % interface,
-						'options=%s' % options ]
-					self.owner.call(
-						'set.host.interface.options',
-						cmdparams)
-
-			sys.stderr.write('\t\t%s\r' % (' ' * len(host)))
+		for column in sorted(columns):
+			if columns[column]:
+				self.update(column, columns[column])
 
 
+	def loadGroups(self, hosts, existing):
+
+		# Incoming hosts lose their old group memberships.
+
+		self.delete('memberships', 'nodeid',
+			    [ existing[host] for host in hosts if host in existing ])
+
+		groups = dict((name, id) for (id, name) in
+			self.db.select('id, name from groups'))
+
+		new = set()
+		for host in hosts:
+			for group in hosts[host].get('groups', []):
+				if group not in groups:
+					new.add(group)
+		if new:
+			self.insert('groups', [ 'name' ],
+				    [ (group, ) for group in sorted(new) ])
+			groups = dict((name, id) for (id, name) in
+				self.db.select('id, name from groups'))
+
+		nodes = self.nodes()
+		rows  = []
+		for host in sorted(hosts.keys()):
+			members = set()
+			for group in hosts[host].get('groups', []):
+				if group in members:
+					raise CommandError(self.owner,
+						'%s already member of %s' % (host, group))
+				members.add(group)
+				rows.append((nodes[host], groups[group]))
+
+		self.insert('memberships', [ 'nodeid', 'groupid' ], rows)
+
+
+	def loadInterfaces(self, interfaces):
+		sys.stderr.write('\tAdd Host Interface\n')
+
+		nodes = self.nodes()
+
+		# Remove the previous host interfaces (if any)
+
+		self.delete('networks', 'node',
+			    [ nodes[host] for host in interfaces ])
+
+		rows = []
+		for host in sorted(interfaces.keys()):
+			for interface in sorted(interfaces[host].keys()):
+				info	= interfaces[host][interface]
+				default = str2bool(info.get('default', False))
+				name	= info.get('ifhostname')
+				if name and len(name.split('.')) > 1:
+					raise CommandError(self.owner,
+						'interface name "%s" must not be a FQDN' % name)
+				if default or (name and name.upper() == 'NULL'):
+					name = host
+
+				module = None
+				if interface[:4] == 'bond':
+					module = 'bonding'
+
+				subnet = None
+				if 'network' in info:
+					subnet = self.subnets.get(info['network'])
+
+				# 'NULL' clears a value, same as the 'add host
+				# interface' and 'set host interface' commands
+
+				ip = info.get('ip')
+				if ip and ip.upper() == 'NULL':
+					ip = None
+				mac = info.get('mac')
+				if mac and mac.upper() == 'NULL':
+					mac = None
+				options = info.get('options')
+				if options and options.upper() == 'NULL':
+					options = None
+				channel = info.get('channel')
+				if channel and channel.upper() == 'NULL':
+					channel = None
+
+				rows.append((nodes[host], mac, ip, name,
+					interface, subnet, module,
+					info.get('vlan') or None, options, channel,
+					default))
+
+		self.insert('networks', [ 'node', 'mac', 'ip', 'name', 'device',
+					  'subnet', 'module', 'vlanid', 'options',
+					  'channel', 'main' ],
+			    rows)
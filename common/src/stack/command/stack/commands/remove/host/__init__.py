@@ -37,6 +37,9 @@ class Command(command):
 		if len(args) < 1:
 			raise ArgRequired(self, 'host')
 
+		(sync, ) = self.fillParams([ ('sync', True) ])
+		sync = self.str2bool(sync)
+
 		me    = self.db.getHostname()
 		hosts = self.getHostnames(args)
 
@@ -54,5 +57,6 @@ class Command(command):
 		#	
 		# sync the config when done
 		#	
-		self.command('sync.config')
+		if sync:
+			self.command('sync.config')
 
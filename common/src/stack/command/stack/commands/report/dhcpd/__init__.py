@@ -96,8 +96,9 @@ class Command(stack.commands.HostArgumentProcessor,
 			"""):
 			data[row[0]].append(row[1:])
 
+		attrs = self.getHostAttrs(list(data.keys()), [ 'kickstartable' ])
 		for name in data.keys():
-			kickstartable = self.str2bool(self.getHostAttr(name, 'kickstartable'))
+			kickstartable = self.str2bool(attrs[name].get('kickstartable'))
 			mac = None
 			ip  = None
 			dev = None
@@ -40,8 +40,8 @@ class Command(stack.commands.Command,
 			}
 
 
-		for row in self.call('list.host.attr', hosts):
-			ha[row['host']]['attrs'][row['attr']] = row['value']
+		for (host, attrs) in self.getHostAttrs(hosts).items():
+			ha[host]['attrs'] = attrs
 
 		if not action: # param can override the db
 			for row in self.call('list.host.boot', hosts):
@@ -53,7 +53,7 @@ class Implementation(stack.commands.Implementation):
 
 
 		# Get pallets for Host
-		pallets = self.owner.getHostAttr(h['host'], 'pallets')
+		pallets = attrs.get('pallets', [])
 		os_template = sles11_os_template
 		for p in pallets:
 			if p.startswith('SLES-12'): # Why not use attrs['os.version']?
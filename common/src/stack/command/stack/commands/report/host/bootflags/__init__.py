@@ -34,8 +34,9 @@ class Command(stack.commands.HostArgumentProcessor,
 		self.beginOutput()
 
 		hosts = self.getHostnames(args)
+		attrs = self.getHostAttrs(hosts, [ 'bootflags' ])
 		for host in hosts:
-			flags = self.getHostAttr(host, 'bootflags')
+			flags = attrs[host].get('bootflags')
 			if not flags:
 				flags = ''
 			self.addOutput(host, '%s' % flags)
@@ -185,7 +185,7 @@ class Command(stack.commands.HostArgumentProcessor,
 			('IPMI_IMB', 'no') ]
 
 		for var, default in defaults:
-			attr = self.getHostAttr(host, var)
+			attr = self.attrs[host].get(var)
 			if not attr:
 				attr = default
 			self.addOutput(host, '%s=%s' % (var, attr))
@@ -221,7 +221,7 @@ class Command(stack.commands.HostArgumentProcessor,
 		# add a root user at id 2
 		self.addOutput(host, 'ipmitool user set name 2 root')
 
-		password = self.getHostAttr(host, 'ipmi_password')
+		password = self.attrs[host].get('ipmi_password')
 		if not password:
 			password = 'admin'
 
@@ -239,8 +239,9 @@ class Command(stack.commands.HostArgumentProcessor,
 
 
 		hosts = self.getHostnames(args)
+		self.attrs = self.getHostAttrs(hosts)
 		for host in hosts:
-			osname = self.getHostAttr(host, 'os')
+			osname = self.attrs[host].get('os')
 			self.runImplementation(osname, [host])
 
 		self.endOutput(padChar='', trimOwner=True)
@@ -40,7 +40,7 @@ class Implementation(stack.commands.Implementation):
 			# Host attributes can override the subnets tables
 			# definition of the netmask.
 
-			x = self.owner.getHostAttr(host, 'network.%s.netmask' % netname)
+			x = self.owner.attrs[host].get('network.%s.netmask' % netname)
 			if x:
 				netmask = x
 			
@@ -23,10 +23,12 @@ class Command(stack.commands.report.host.command):
 
 		self.beginOutput()
 
-		for host in self.getHostnames(args):
+		hosts = self.getHostnames(args)
+		attrs = self.getHostAttrs(hosts, [ 'Kickstart_PrivateAddress' ])
+		for host in hosts:
 			self.addOutput(host,
 				       '<stack:file stack:name="/etc/sysconfig/stack-mq">')
-			self.addOutput(host, 'MASTER=%s' % self.getHostAttr(host, 'Kickstart_PrivateAddress'))
+			self.addOutput(host, 'MASTER=%s' % attrs[host].get('Kickstart_PrivateAddress'))
 			self.addOutput(host, '</stack:file>')
 
 		self.endOutput(padChar='', trimOwner=True)
@@ -35,9 +35,11 @@ class Command(stack.commands.HostArgumentProcessor,
 		self.beginOutput()
 
 		hosts = self.getHostnames(args)
+		self.attrs = self.getHostAttrs(hosts, [ 'box',
+			'Kickstart_PrivateAddress' ])
 		for host in hosts:
 			osname = self.db.getHostOS(host)
-			server = self.getHostAttr(host, 'Kickstart_PrivateAddress')
+			server = self.attrs[host].get('Kickstart_PrivateAddress')
 			
 			if osname in [ 'redhat', 'sles' ]:
 				self.runImplementation('repo', (host, server, osname))
@@ -13,7 +13,7 @@ class Implementation(stack.commands.Implementation):
 		host	= args[0]
 		server	= args[1]
 		osname	= args[2]
-		box	= self.owner.getHostAttr(host, 'box')
+		box	= self.owner.attrs[host].get('box')
 		repo	= []
 
 		if osname == 'redhat':
@@ -12,7 +12,7 @@ class Implementation(stack.commands.Implementation):
 	def run(self, args):
 		host	= args[0]
 		server	= args[1]
-		box	= self.owner.getHostAttr(host, 'box')
+		box	= self.owner.attrs[host].get('box')
 		repo	= []
 
 		filename = '/etc/zypp/repos.d/stacki.repo'
@@ -26,11 +26,10 @@ class Command(stack.commands.HostArgumentProcessor, stack.commands.report.comman
 		self.beginOutput()
 
 		hosts = self.getHostnames(args)
+		hostAttrs = self.getHostAttrs(hosts)
 		for host in hosts:
 
-			attrs = {}
-			for row in self.call('list.host.attr', [ host ]):
-				attrs[row['attr']] = row['value']
+			attrs = hostAttrs[host]
 
 			protocol   = attrs.get('time.protocol')
 			appliance  = attrs.get('appliance')
@@ -14,9 +14,51 @@
 import sys
 import subprocess
 import stack.commands
+import stack.commands.list.host.profile
 import stack.gen
 
 
+def Profile(osname, attrs, text):
+	"""
+	Wraps the XML TEXT into a profile with a single install-post
+	script, the ATTRS become entities of the profile.
+	"""
+	xml = ''
+
+	if attrs:
+		xml += '<!DOCTYPE stacki-profile [\n'
+		for (k, v) in attrs.items():
+			xml += '\t<!ENTITY %s "%s">\n' % (k, v)
+		xml += ']>\n'
+
+	xml += '<stack:profile '
+	xml += 'stack:os="%s" ' % osname
+	xml += 'xmlns:stack="http://www.stacki.com" '
+	xml += 'stack:attrs="%s">\n' % attrs
+	xml += '<stack:script stack:stage="install-post">\n'
+	xml += text
+	xml += '</stack:script>\n'
+	xml += '</stack:profile>\n' 
+
+	return xml
+
+
+def Script(owner, osname, attrs, text):
+	"""
+	Same as 'report script' but the shell script is generated
+	in-process using the database connection of the OWNER command.
+	"""
+	o = stack.commands.list.host.profile.Command(owner.db)
+	o.beginOutput()
+	o.runImplementation(osname, (Profile(osname, attrs, text),
+				     'bash', 'main'))
+
+	script = ''
+	for (empty, line) in o.output:
+		script += '%s\n' % line
+	return script
+
+
 class Command(stack.commands.report.command):
 	"""
 	Take STDIN XML input and create a shell script that can be executed
@@ -45,26 +87,10 @@ class Command(stack.commands.report.command):
 			('os', self.os),
 			('attrs', {}) ])
 
-		xml = ''
-
 		if attrs:
 			attrs = eval(attrs)
-			xml += '<!DOCTYPE stacki-profile [\n'
-			for (k, v) in attrs.items():
-				xml += '\t<!ENTITY %s "%s">\n' % (k, v)
-			xml += ']>\n'
-
-		xml += '<stack:profile '
-		xml += 'stack:os="%s" ' % osname
-		xml += 'xmlns:stack="http://www.stacki.com" '
-		xml += 'stack:attrs="%s">\n' % attrs
-		xml += '<stack:script stack:stage="install-post">\n'
-
-		for line in sys.stdin.readlines():
-			xml += line
-
-		xml += '</stack:script>\n'
-		xml += '</stack:profile>\n' 
+
+		xml = Profile(osname, attrs, sys.stdin.read())
 
 		p = subprocess.Popen('/opt/stack/bin/stack list host profile chapter=main profile=bash',
 				     stdin=subprocess.PIPE,
@@ -12,9 +12,14 @@
 
 
 import os
+import stack.ssh
 import stack.commands
 from stack.exception import ParamType, ParamValue
 
+# Shared SSH connections (see stack.ssh.ControlPool).
+
+pool = stack.ssh.ControlPool()
+
 
 class Command(stack.commands.Command,
 	stack.commands.HostArgumentProcessor):
@@ -67,6 +72,15 @@ class Command(stack.commands.Command,
 	Set "run.host.threads" to set the default
 	</param>
 
+	<param type='string' name='method'>
+	The implementation used to run the command. 'ssh' starts a thread
+	for every host and reports all the output at the end. 'async' runs
+	all the hosts from one event loop and prints the output of each host
+	as soon as it is done (with output-format=json only when streaming,
+	see stack --stream).
+	Default is 'ssh'. Set "run.host.impl" to set the default
+	</param>
+
 	<example cmd='run host backend-0-0 command="hostname"'>
 	Run the command 'hostname' on backend-0-0.
 	</example>
@@ -135,10 +149,11 @@ class Command(stack.commands.Command,
 		# Check if we should collate the output
 		self.collate = self.str2bool(collate)
 
+		header = [ 'host', 'output' ]
 		if self.collate:
-			self.beginOutput()
+			self.beginOutput(header)
 
 		self.runImplementation(method, [self.hosts, cmd])
 
 		if self.collate:
-			self.endOutput(header=['host', 'output'], trimOwner=False)
+			self.endOutput(header=header, trimOwner=False)
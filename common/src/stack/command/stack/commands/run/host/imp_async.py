@@ -0,0 +1,199 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import sys
+import time
+import socket
+import asyncio
+import concurrent.futures
+import stack.commands
+import stack.commands.run.host
+
+
+# SSH port to probe before running the command, and how long to wait
+# for the sshd banner.
+
+Port	     = 22
+ProbeTimeout = 2.0
+
+# Number of hosts that can run at the same time when the 'threads'
+# parameter is 0.  Every host holds a socket and an ssh process with
+# its pipes, so an unbounded run on a large cluster would run out of
+# file descriptors.
+
+Concurrency  = 256
+
+
+class Implementation(stack.commands.Implementation):
+	"""
+	Runs the command on all the hosts from a single asyncio event
+	loop instead of one thread per host.  The output of each host
+	is reported as soon as the host is done.
+	"""
+
+	def run(self, args):
+		self.localhost = socket.gethostname().split('.')[0]
+
+		# Collated text output is printed a host at a time, the
+		# host column is as wide as the longest host name so it
+		# lines up the same as the table endOutput would print.
+		# Other output formats go through addOutput (and are
+		# written as they are added when streaming).
+
+		params = self.owner._params or {}
+		format = params.get('output-format', 'text')
+		self.incremental = self.owner.collate and format == 'text' \
+			and not self.owner.structured
+		self.width  = max([ len(h) for h in self.owner.hosts ] + [ 4 ])
+		self.header = False
+
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		try:
+			loop.run_until_complete(self.dispatch(self.owner.hosts))
+		except KeyboardInterrupt:
+			pass
+		finally:
+			loop.close()
+			asyncio.set_event_loop(None)
+
+	async def dispatch(self, hosts):
+		limit = self.owner.numthreads
+		if limit <= 0:
+			limit = Concurrency
+		semaphore = asyncio.BoundedSemaphore(limit)
+
+		# Starting the SSH connection of a host blocks until the
+		# handshake is done, those run in threads.
+
+		self.executor = concurrent.futures.ThreadPoolExecutor(limit)
+
+		tasks = []
+		for host in hosts:
+			await semaphore.acquire()
+			tasks.append(asyncio.ensure_future(self.runHost(host, semaphore)))
+			if self.owner.delay > 0:
+				await asyncio.sleep(self.owner.delay)
+
+		if tasks:
+			await asyncio.wait(tasks)
+		self.executor.shutdown()
+
+	async def runHost(self, host, semaphore):
+		try:
+			if host == self.localhost or await self.probe(host):
+				output = await self.execute(host)
+			else:
+				output = 'down'
+		except asyncio.TimeoutError:
+			output = 'error - timeout after %d seconds' % self.owner.timeout
+		except Exception as e:
+			output = 'error - %s' % e
+		finally:
+			semaphore.release()
+
+		self.report(host, output)
+
+	async def probe(self, host):
+		"""
+		Makes sure the machine is up and SSH is responding.
+
+		This catches the case when the node is up, sshd is sitting
+		on port 22, but it is not responding (e.g., the node is
+		overloaded, sshd is hung, etc.)
+		"""
+		writer = None
+		try:
+			(reader, writer) = await asyncio.wait_for(
+				asyncio.open_connection(host, Port), ProbeTimeout)
+			await asyncio.wait_for(reader.read(64), ProbeTimeout)
+		except (OSError, asyncio.TimeoutError):
+			return False
+		finally:
+			if writer:
+				writer.close()
+		return True
+
+	async def execute(self, host):
+		"""
+		Runs the command over SSH, STDERR is merged into STDOUT as
+		if this were the output of running the command on the
+		command line.  The ssh is terminated if it runs longer than
+		the timeout, the pooled connection of the host is left up.
+		Returns the output.
+		"""
+		pool	= stack.commands.run.host.pool
+		timeout = self.owner.timeout or None
+		start	= time.time()
+
+		# Use the pooled connection of the host if there is one,
+		# run host does not start (and leave behind) a master for
+		# every host.  Checking the master counts against the
+		# timeout.
+
+		options = []
+		if await asyncio.wait_for(
+				asyncio.get_event_loop().run_in_executor(
+					self.executor, pool.connect, host, False,
+					timeout), timeout):
+			options = pool.options(host)
+
+		proc = await asyncio.create_subprocess_exec(
+			'ssh', *options, host, self.owner.cmd,
+			stdin=asyncio.subprocess.DEVNULL,
+			stdout=asyncio.subprocess.PIPE,
+			stderr=asyncio.subprocess.STDOUT)
+
+		output = []
+		reader = asyncio.ensure_future(self.collect(proc.stdout, output))
+		if timeout is None:
+			await proc.wait()
+		else:
+			try:
+				await asyncio.wait_for(proc.wait(), max(0,
+					timeout - (time.time() - start)))
+			except asyncio.TimeoutError:
+				proc.terminate()
+				await proc.wait()
+
+		# Anything the ssh left running (e.g. a ControlMaster)
+		# can keep the pipe open, only give it a moment to
+		# flush.
+
+		await asyncio.wait([ reader ], timeout=ProbeTimeout)
+		reader.cancel()
+
+		return b''.join(output).strip()
+
+	async def collect(self, stream, output):
+		while True:
+			data = await stream.read(65536)
+			if not data:
+				break
+			output.append(data)
+
+	def report(self, host, output):
+		if isinstance(output, bytes):
+			output = output.decode(errors='replace')
+
+		if not self.owner.collate:
+			if output:
+				print(output)
+				sys.stdout.flush()
+		elif self.incremental:
+			colors = self.owner.colors
+			if not self.header:
+				print('%s%s%s %s%s%s' % (
+					colors['bold']['code'], 'HOST'.ljust(self.width),
+					colors['reset']['code'], colors['bold']['code'],
+					'OUTPUT', colors['reset']['code']))
+				self.header = True
+			for line in output.split('\n'):
+				print('%s %s' % (host.ljust(self.width), line))
+			sys.stdout.flush()
+		else:
+			for line in output.split('\n'):
+				self.owner.addOutput(host, line)
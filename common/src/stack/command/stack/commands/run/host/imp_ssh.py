@@ -5,6 +5,7 @@
 # @copyright@
 
 import stack.commands
+import stack.commands.run.host
 import threading
 import socket
 import time
@@ -150,7 +151,19 @@ class Parallel(threading.Thread):
 		# as if this were the output of running the command on
 		# the command line.
 		if online:
-			proc = subprocess.Popen([ 'ssh', self.host, self.cmd ],
+
+			# Use the pooled connection of the host if there is
+			# one, run host does not start (and leave behind) a
+			# master for every host.
+
+			start_time = time.time()
+			pool	   = stack.commands.run.host.pool
+			options	   = []
+			if pool.connect(self.host, start=False,
+					timeout=self.timeout or None):
+				options = pool.options(self.host)
+			proc = subprocess.Popen([ 'ssh' ] + options +
+						[ self.host, self.cmd ],
 						stdin=None,
 						stdout=subprocess.PIPE,
 						stderr=subprocess.STDOUT)
@@ -161,7 +174,6 @@ class Parallel(threading.Thread):
 				retval = proc.wait()
 			else:
 				hit_timeout = False
-				start_time = time.time()
 				while hit_timeout is False:
 					# Check if process is done
 					retval = proc.poll()
@@ -11,14 +11,89 @@
 # @rocks@
 
 import stack.commands
+import stack.ssh
 import threading
 import subprocess
+import concurrent.futures
 import time
 import os
 
 max_threading = 512
 timeout	= 30
 
+# Shared SSH connections, the sync commands of a host reuse the same
+# connection (see stack.ssh.ControlPool).
+
+pool = stack.ssh.ControlPool()
+
+
+def ssh(host, pooled=True):
+	"""
+	Returns the ssh command line for HOST, the ssh runs over the
+	pooled connection of the host unless POOLED is False.
+	"""
+	if pooled:
+		options = pool.options(host)
+	else:
+		options = []
+	return ' '.join([ 'ssh' ] + options + [ '-T', '-x', host ])
+
+
+def Execute(host, script, local=False):
+	"""
+	Runs the shell SCRIPT on HOST, or on this machine if LOCAL is
+	set.  Returns a dictionary with the 'rc', 'output', 'error' and
+	'duration' of the script.
+	"""
+	if local:
+		cmd = [ 'bash' ]
+	elif pool.connect(host):
+		cmd = [ 'ssh' ] + pool.options(host) + [ '-T', '-x', host, 'bash' ]
+	else:
+		cmd = [ 'ssh', '-T', '-x', host, 'bash' ]
+
+	result = { 'rc': -1, 'output': '', 'error': '', 'duration': 0 }
+	start  = time.time()
+	try:
+		p = subprocess.run(cmd, input=script.encode(),
+				   stdout=subprocess.PIPE,
+				   stderr=subprocess.PIPE,
+				   timeout=timeout)
+		result['rc']     = p.returncode
+		result['output'] = p.stdout.decode(errors='replace')
+		result['error']  = p.stderr.decode(errors='replace')
+	except subprocess.TimeoutExpired:
+		result['error'] = 'timeout after %d seconds' % timeout
+	except OSError as e:
+		result['error'] = str(e)
+	result['duration'] = time.time() - start
+
+	return result
+
+
+def Run(scripts, me=None):
+	"""
+	Runs the SCRIPTS, a dictionary of host names to shell scripts,
+	on their hosts with at most max_threading hosts at a time.  The
+	script of ME runs on this machine.  Returns a dictionary of host
+	names to the results of Execute.
+	"""
+	results = {}
+	if not scripts:
+		return results
+
+	workers = min(max_threading, len(scripts))
+	with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+		futures = {}
+		for host in scripts:
+			futures[host] = executor.submit(Execute, host,
+							scripts[host],
+							host == me)
+		for host in futures:
+			results[host] = futures[host].result()
+
+	return results
+
 
 class command(stack.commands.HostArgumentProcessor,
 	stack.commands.sync.command):
@@ -26,8 +101,9 @@ class command(stack.commands.HostArgumentProcessor,
 
 
 class Parallel(threading.Thread):
-	def __init__(self, cmd, out=None):
+	def __init__(self, cmd, out=None, host=None):
 		self.cmd = cmd
+		self.host = host
 		if not out:
 			self.out = {"output": "", "error": "", "rc": 0}
 		else:
@@ -37,6 +113,13 @@ class Parallel(threading.Thread):
 		threading.Thread.__init__(self)
 
 	def run(self):
+
+		# Without a master the ssh in the command makes its own
+		# connection.
+
+		if self.host and not pool.connect(self.host):
+			self.cmd = self.cmd.replace(ssh(self.host),
+						    ssh(self.host, pooled=False))
 		p = subprocess.Popen(self.cmd,
 			stdout=subprocess.PIPE,
 			stderr=subprocess.STDOUT,
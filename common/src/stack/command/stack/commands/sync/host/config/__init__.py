@@ -23,12 +23,7 @@ class Command(stack.commands.sync.host.command,
 		self.notify('Sync Host Config\n')
 
 		hosts = self.getHostnames(args)
-		attrs = {}
-
-		for host in self.getHostnames(args):
-			attrs[host] = {}
-		for row in self.call('list.host.attr', hosts):
-			attrs[row['host']][row['attr']] = row['value']
+		attrs = self.getHostAttrs(hosts)
 
 		self.runPlugins({ 'hosts': hosts,
 				  'attrs': attrs })
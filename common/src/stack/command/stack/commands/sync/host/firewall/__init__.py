@@ -13,6 +13,7 @@
 import stack.commands
 from stack.commands.sync.host import Parallel
 from stack.commands.sync.host import timeout
+from stack.commands.sync.host import ssh
 
 
 class Command(stack.commands.sync.host.command):
@@ -38,6 +39,8 @@ class Command(stack.commands.sync.host.command):
 
 		me = self.db.getHostname('localhost')
 
+		hostAttrs = self.getHostAttrs(hosts)
+
 		threads = []
 		out = {}
 		host_output = {}
@@ -45,9 +48,7 @@ class Command(stack.commands.sync.host.command):
 
 			host_output[host] = {"output": "", "error": "", "rc": 0}
 			out[host] = ""
-			attrs = {}
-			for row in self.call('list.host.attr', [ host ]):
-				attrs[row['attr']] = row['value']
+			attrs = hostAttrs[host]
 
 			if self.str2bool(attrs.get('firewall')) is not True:
 				continue
@@ -57,10 +58,11 @@ class Command(stack.commands.sync.host.command):
 			cmd += '/opt/stack/bin/stack report script '
 			cmd += 'attrs="%s" | ' % attrs
 			if me != host:
-				cmd += 'ssh -T -x %s ' % host
+				cmd += '%s ' % ssh(host)
 			cmd += 'bash > /dev/null 2>&1 '
 
-			p = Parallel(cmd, host_output[host])
+			p = Parallel(cmd, host_output[host],
+				     host if me != host else None)
 			threads.append(p)
 			p.start()
 		#
@@ -82,9 +84,10 @@ class Command(stack.commands.sync.host.command):
 					cmd = '/sbin/service iptables restart'
 
 				if me != host:
-					cmd = 'ssh -T -x %s "%s"' % (host, cmd)
+					cmd = '%s "%s"' % (ssh(host), cmd)
 				host_output[host] = {"output": "", "error": "", "rc": 0}
-				p = Parallel(cmd, host_output[host])
+				p = Parallel(cmd, host_output[host],
+					     host if me != host else None)
 				threads.append(p)
 				p.start()
 
@@ -12,14 +12,17 @@
 
 import os
 import stack.commands
-from stack.commands.sync.host import Parallel
-from stack.commands.sync.host import timeout
+import stack.commands.report.script
+from stack.commands.sync.host import Run
 
 
 class Command(stack.commands.sync.host.command):
 	"""
 	Reconfigure and optionally restart the network for the named hosts.
 
+	For every host the output is the return code, the error output
+	and the duration (in seconds) of the network configuration script.
+
 	<param type='boolean' name='restart'>
 	If "yes", then restart the network after the configuration files are
 	applied on the host.
@@ -40,46 +43,38 @@ class Command(stack.commands.sync.host.command):
 
 		me = self.db.getHostname('localhost')
 
-		threads = []
-		for host in hosts:
-
-			attrs = {}
-			for row in self.call('list.host.attr', [ host ]):
-				attrs[row['attr']] = row['value']
-
-			cmd = '/opt/stack/bin/stack report host interface '
-			cmd += '%s | ' % host
-			cmd += '/opt/stack/bin/stack report script '
-			cmd += 'attrs="%s" | ' % attrs
-			if host != me:
-				cmd += 'ssh -T -x %s ' % host
-			cmd += 'bash > /dev/null 2>&1 '
-
-			cmd += '; /opt/stack/bin/stack report host network '
-			cmd += '%s | ' % host
-			cmd += '/opt/stack/bin/stack report script '
-			cmd += 'attrs="%s" | ' % attrs
-			if host != me:
-				cmd += 'ssh -T -x %s ' % host
-			cmd += 'bash > /dev/null 2>&1 '
-
-			cmd += '; /opt/stack/bin/stack report host route '
-			cmd += '%s | ' % host
-			cmd += '/opt/stack/bin/stack report script '
-			cmd += 'attrs="%s" | ' % attrs
-			if host != me:
-				cmd += 'ssh -T -x %s ' % host
-			cmd += 'bash > /dev/null 2>&1 '
-
-			p = Parallel(cmd)
-			threads.append(p)
-			p.start()
+		hostAttrs = self.getHostAttrs(hosts)
 
 		#
-		# collect the threads
+		# the interface, network and route reports of all the
+		# hosts are made in one pass, and each host gets a single
+		# script with all three
 		#
-		for thread in threads:
-			thread.join(timeout)
+		xml = {}
+		for host in hosts:
+			xml[host] = ''
+
+		reports = [ 'report.host.interface',
+			    'report.host.network',
+			    'report.host.route' ]
+		if not hosts:
+			reports = []
+		for report in reports:
+			for row in self.call(report, hosts):
+				if row['col-0'] in xml:
+					xml[row['col-0']] += '%s\n' % row['col-1']
+
+		scripts = {}
+		results = {}
+		for host in hosts:
+			try:
+				scripts[host] = stack.commands.report.script.Script(
+					self, self.os, hostAttrs[host], xml[host])
+			except Exception as e:
+				results[host] = { 'rc': -1, 'error': str(e),
+						  'duration': 0 }
+
+		results.update(Run(scripts, me))
 
 		self.command('sync.host.firewall',
 			[ 'restart=%s' % restart ] + hosts)
@@ -91,24 +86,13 @@ class Command(stack.commands.sync.host.command):
 			# after all the configuration files have been rewritten,
 			# restart the network
 			#
-			threads = []
+			scripts = {}
 			for host in hosts:
-				cmd = '/sbin/service network restart '
-				cmd += '> /dev/null 2>&1 ; '
-				cmd += '/sbin/service ipmi restart > '
-				cmd += '/dev/null 2>&1'
-				if host != me:
-					cmd = 'ssh %s "%s"' % (host, cmd)
-
-				p = Parallel(cmd)
-				threads.append(p)
-				p.start()
-
-			#
-			# collect the threads
-			#
-			for thread in threads:
-				thread.join(timeout)
+				scripts[host] = '/sbin/service network restart '
+				scripts[host] += '> /dev/null 2>&1 ; '
+				scripts[host] += '/sbin/service ipmi restart > '
+				scripts[host] += '/dev/null 2>&1\n'
+			Run(scripts, me)
 
 		#
 		# if IP addresses change, we'll need to sync the config (e.g.,
@@ -122,3 +106,12 @@ class Command(stack.commands.sync.host.command):
 		if me in hosts and os.path.exists('/etc/ganglia/gmond.conf'):
 			os.system('service gmond restart > /dev/null 2>&1')
 
+		self.beginOutput()
+		for host in hosts:
+			result = results[host]
+			self.addOutput(host, [ result['rc'],
+					       result['error'].strip(),
+					       '%.2f' % result['duration'] ])
+		self.endOutput(header=[ 'host', 'rc', 'error', 'duration' ],
+			       trimOwner=False)
+
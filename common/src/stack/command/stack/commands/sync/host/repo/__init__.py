@@ -10,6 +10,7 @@ import sys
 import stack.commands
 from stack.commands.sync.host import Parallel
 from stack.commands.sync.host import timeout
+from stack.commands.sync.host import ssh
 
 
 class Command(stack.commands.sync.host.command):
@@ -54,19 +55,15 @@ class Command(stack.commands.sync.host.command):
 		threads = []
 		for host in hosts:
 
-			attrs = {}
-			for row in self.call('list.host.attr', [ host ]):
-				attrs[row['attr']] = row['value']
-
 			cmd = '/opt/stack/bin/stack report host repo %s | ' % host
 			cmd += '/opt/stack/bin/stack report script | '
 
 			if me != host:
-				cmd += 'ssh -T -x %s ' % host
+				cmd += '%s ' % ssh(host)
 			cmd += 'bash > /dev/null 2>&1 '
 
 			try:
-				p = Parallel(cmd)
+				p = Parallel(cmd, host=host if me != host else None)
 				p.start()
 				threads.append(p)
 			except:
@@ -84,3 +84,4 @@ class Command(stack.commands.CartArgumentProcessor,
 		cart = args[0]
 		self.addCart(cart)
 		self.unpackCart(cart,cartfile,cartsdir)
+		self.command('compile.cart', [ cart ])
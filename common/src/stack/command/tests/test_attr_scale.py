@@ -0,0 +1,118 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import time
+import tempfile
+import contextlib
+import stack.api
+from stack.api import Call, ReturnCode
+from . import legacy_attr
+
+SIZES = [ 100, 1000, 10000 ]
+RACK  = 1000
+
+
+def hostname(n):
+	return 'backend-%d-%d' % (RACK, n)
+
+
+def loadHosts(first, last):
+	"""
+	Add hosts FIRST through LAST-1 using a single hostfile so
+	the benchmark setup does not take longer than the benchmark.
+	"""
+
+	fd, csv = tempfile.mkstemp(suffix='.csv')
+	with os.fdopen(fd, 'w') as fout:
+		fout.write('name,appliance,rack,rank,ip,mac,interface,network\n')
+		for n in range(first, last):
+			fout.write('%s,backend,%d,%d,,%s,eth0,\n' % (
+				hostname(n), RACK, n,
+				'02:00:%02x:%02x:%02x:%02x' % (
+					(n >> 24) & 0xff, (n >> 16) & 0xff,
+					(n >> 8) & 0xff, n & 0xff)))
+	Call('load hostfile', [ 'file=%s' % csv ])
+	os.unlink(csv)
+	assert ReturnCode() == 0
+
+
+def teardown_module(module):
+	hosts = [ hostname(n) for n in range(0, max(SIZES)) ]
+	for i in range(0, len(hosts), 500):
+		Call('remove host', hosts[i:i + 500])
+
+
+def timeit(cmd, args):
+	t0 = time.time()
+	result = Call(cmd, args)
+	t1 = time.time()
+	assert ReturnCode() == 0
+	return (t1 - t0, result)
+
+
+@contextlib.contextmanager
+def legacy():
+	"""
+	Runs 'list attr' with the implementation the attribute
+	resolver replaced.
+	"""
+
+	key = ('list', 'attr')
+	saved = stack.api.Commands.get(key)
+	stack.api.Commands[key] = ('list attr', legacy_attr.Command, 2)
+	try:
+		yield
+	finally:
+		if saved:
+			stack.api.Commands[key] = saved
+		else:
+			stack.api.Commands.pop(key, None)
+
+
+def compare(size, args):
+	"""
+	Runs 'list attr scope=host ARGS' (what 'list host attr' runs)
+	with the old and the new implementation, both must produce
+	the same rows.
+	"""
+
+	with legacy():
+		(old, expected) = timeit('list attr', args + [ 'scope=host' ])
+	(new, result) = timeit('list attr', args + [ 'scope=host' ])
+	assert result == expected
+
+	print('%6d hosts: list host attr %-30s old %.3fs new %.3fs (%.1fx)' %
+	      (size, ' '.join(args), old, new, old / max(new, 0.001)))
+	return (old, new, result)
+
+
+def test_attr_scale():
+	"""
+	Benchmark the attribute resolver against the implementation it
+	replaced, for a single attribute of a single host, every
+	attribute of a single host, and every attribute of every host.
+	"""
+
+	print('...')
+	count = 0
+	for size in SIZES:
+		loadHosts(count, size)
+		count = size
+
+		(old, new, result) = compare(size, [ hostname(0), 'attr=managed' ])
+		assert len(result) == 1
+
+		(old, new, result) = compare(size, [ hostname(0) ])
+		assert result
+
+		# a single host no longer pays for every host
+
+		if size >= 1000:
+			assert new < old
+
+		(old, new, result) = compare(size, [ ])
+		assert len(result) > size
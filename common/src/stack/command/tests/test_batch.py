@@ -0,0 +1,68 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import sys
+import subprocess
+import stack.api
+
+BATCH = """#!/bin/bash
+/opt/stack/bin/stack report \\
+	version
+stack list bogus
+report version
+"""
+
+
+def batch(tmpdir, *flags):
+	path = tmpdir.join('batch')
+	path.write(BATCH)
+	p = subprocess.run([ sys.executable, stack.api.__stack__, '--batch' ] +
+			   list(flags) + [ str(path) ],
+			   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	return (p.returncode, p.stdout.decode(), p.stderr.decode())
+
+
+def test_batch(tmpdir):
+	"""
+	A batch stops at the first failed command unless asked to
+	continue, the summary lists the failed lines.
+	"""
+
+	(rc, out, err) = batch(tmpdir)
+	assert rc != 0
+	assert len(out.splitlines()) == 1
+	assert 'batch: 2 commands, 1 failed' in err
+	assert 'line 4: list bogus' in err
+
+	(rc, out, err) = batch(tmpdir, '--continue')
+	assert rc != 0
+	assert len(out.splitlines()) == 2
+	assert 'batch: 3 commands, 1 failed' in err
+
+
+def test_exit(tmpdir):
+	"""
+	A command that exits fails, the batch goes on with --continue and
+	still writes its summary.
+	"""
+
+	driver = tmpdir.join('driver.py')
+	driver.write("""
+import sys
+import runpy
+import stack.commands.report.version
+
+stack.commands.report.version.Command.run = lambda self, params, args: sys.exit(-1)
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+""")
+	path = tmpdir.join('batch')
+	path.write(BATCH)
+	p = subprocess.run([ sys.executable, str(driver), stack.api.__stack__,
+			     '--batch', '--continue', str(path) ],
+			   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	assert p.returncode != 0
+	assert 'batch: 3 commands, 3 failed' in p.stderr.decode()
@@ -0,0 +1,58 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import marshal
+import stack.commands
+import stack.commands.list.attr
+from .stubdb import Connection
+
+ATTRS = 500
+CALLS = 200
+
+
+def rows(command):
+	if command.startswith('select command, groupid from access'):
+		return [ ('*', os.getgid()) ]
+	if "a.scope = 'global'" in command:
+		return [ ('global', 'attr.%d' % i, 'value.%d' % i, None)
+			 for i in range(0, ATTRS) ]
+	return []
+
+
+def legacy(connection, args):
+	"""
+	The previous Command.call() path: a new command with its own
+	DatabaseConnection (and empty cache) whose output is marshalled
+	and then parsed back.
+	"""
+	o = stack.commands.list.attr.Command(connection)
+	o.runWrapper('list attr', args + [ 'output-format=binary' ], 1)
+	return marshal.loads(o.getText())
+
+
+def test_call(monkeypatch):
+	monkeypatch.delenv('STACKSHAREDCACHE', raising=False)
+
+	connection = Connection(rows)
+	parent     = stack.commands.Command(connection)
+
+	assert parent.call('list.attr', [ 'const=false' ]) == \
+		legacy(connection, [ 'const=false' ])
+
+	# Every legacy call starts with an empty cache, the in-process
+	# calls share the parent's and after the first one are answered
+	# without going to the database.
+
+	count = connection.queries
+	for i in range(0, CALLS):
+		legacy(connection, [ 'const=false' ])
+	assert connection.queries - count >= CALLS
+
+	count = connection.queries
+	for i in range(0, CALLS):
+		assert parent.call('list.attr', [ 'const=false' ])
+	assert connection.queries == count
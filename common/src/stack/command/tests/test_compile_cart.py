@@ -0,0 +1,109 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import re
+import grp
+import stack.lock
+import stack.commands.compile.cart
+import stack.commands.add.cart
+import stack.commands.enable.cart
+import stack.commands.unpack.cart
+from .stubdb import Connection
+
+
+def test_compile(tmp_path, monkeypatch):
+	"""
+	A cart is compiled when a file changes, once, and not while
+	someone holds its mutex.
+	"""
+
+	cart = stack.commands.compile.cart
+	monkeypatch.setattr(cart, 'CartDir', str(tmp_path / 'carts'))
+	monkeypatch.setattr(cart, 'MutexFile', str(tmp_path / 'cart.%s.mutex'))
+	compiles = []
+	monkeypatch.setattr(cart.subprocess, 'Popen',
+		lambda args, **kwargs: compiles.append(args))
+
+	# a compiled cart, same as after 'compile cart'
+
+	cartpath = tmp_path / 'carts' / 'site'
+	(cartpath / 'RPMS').mkdir(parents=True)
+	(cartpath / 'repodata').mkdir()
+	rpm = cartpath / 'RPMS' / 'site-1.0.rpm'
+	rpm.write_bytes(b'rpm')
+
+	def compiled():
+		finger = cart.Fingerprint(str(cartpath))
+		with open(str(cartpath / 'fingerprint'), 'w') as fout:
+			for (filename, f) in finger.items():
+				fout.write('%s %s %s\n' % (filename, f['size'], f['mtime']))
+	compiled()
+
+	assert not cart.Changed('site')
+	assert not cart.Compile('site')
+	assert compiles == []
+
+	# a touched file forks off one compile
+
+	mtime = os.stat(str(rpm)).st_mtime + 10
+	os.utime(str(rpm), (mtime, mtime))
+	assert cart.Changed('site')
+	assert cart.Compile('site')
+	assert compiles == [ [ '/opt/stack/bin/stack', 'compile', 'cart', 'site' ] ]
+
+	# nothing while the cart is being compiled
+
+	mutex = stack.lock.Mutex(cart.MutexFile % 'site')
+	mutex.acquire()
+	assert cart.Compiling('site')
+	assert not cart.Compile('site')
+	mutex.release()
+	assert not cart.Compiling('site')
+	assert len(compiles) == 1
+
+	compiled()
+	assert not cart.Compile('site')
+	assert len(compiles) == 1
+
+
+def carts(command):
+	if re.match(r'select\s+\*\s+from\s+boxes', command):
+		return [ (1, 'default') ]
+	if re.match(r'select\s+name\s+from\s+carts', command):
+		return [ ('site', ) ]
+	return []
+
+
+def test_commands(tmp_path, monkeypatch):
+	"""
+	Adding, enabling, and unpacking a cart compile it.
+	"""
+
+	monkeypatch.setattr(os, 'system', lambda command: 0)
+	monkeypatch.setattr(grp, 'getgrnam',
+		lambda name: (name, '', os.getgid(), []))
+
+	class Tree:
+		def __init__(self, root):
+			pass
+		def getDirs(self):
+			return [ 'site' ]
+		def getRoot(self):
+			return str(tmp_path)
+	monkeypatch.setattr(stack.commands.add.cart.stack.file, 'Tree', Tree)
+
+	for (module, rows, params) in [
+			(stack.commands.add.cart, lambda command: [], {}),
+			(stack.commands.enable.cart, carts, {}),
+			(stack.commands.unpack.cart, carts, { 'file': 'site.tgz' }) ]:
+		o = module.Command(Connection(rows))
+		o._params = params
+		calls = []
+		o.command = lambda command, args=[]: calls.append((command, args))
+		o.unpackCart = lambda cart, cartfile, cartsdir: None
+		o.run(params, [ 'site' ])
+		assert calls[-1] == ('compile.cart', [ 'site' ])
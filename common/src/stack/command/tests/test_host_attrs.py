@@ -0,0 +1,42 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+from .stubdb import Connection
+
+
+def queries(count, attrs):
+	connection = Connection()
+	command	   = stack.commands.Command(connection)
+	hosts	   = [ 'backend-0-%d' % i for i in range(0, count) ]
+
+	# every name is resolved by the one query, none one at a time
+
+	command.db.getHostname = None
+
+	result = command.getHostAttrs(hosts, attrs)
+	assert sorted(result.keys()) == sorted(hosts)
+
+	# the placement (appliance, os, box) of each host was loaded
+
+	if attrs is None:
+		for host in hosts:
+			assert result[host]['appliance'] == 'backend'
+			assert result[host]['os'] == 'redhat'
+
+	return connection.queries
+
+
+def test_host_attrs_queries(monkeypatch):
+	"""
+	The number of SQL round-trips made by getHostAttrs must not
+	depend on the number of hosts.
+	"""
+
+	monkeypatch.delenv('STACKSHAREDCACHE', raising=False)
+
+	for attrs in [ [ 'kickstartable' ], [ 'pallets', 'group.*' ], None ]:
+		assert queries(1, attrs) == queries(10, attrs) == queries(1000, attrs)
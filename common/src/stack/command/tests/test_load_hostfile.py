@@ -0,0 +1,191 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import re
+import time
+import pytest
+import stack.commands
+import stack.commands.load.hostfile
+from stack.exception import CommandError
+from .stubdb import Connection
+
+HOSTS = 10000
+
+
+class Database(Connection):
+	"""
+	Just enough of the cluster database for loading a hostfile,
+	nodes and groups remember what was inserted.
+	"""
+
+	def __init__(self):
+		Connection.__init__(self)
+		self.nodes	= { 'frontend-0-0': 1 }
+		self.groups	= {}
+		self.statements = []
+		self.commands	= []
+
+	def rows(self, command):
+		command = ' '.join(command.split())
+		self.statements.append(command.split()[0])
+		self.commands.append(command)
+
+		if command.startswith('insert into nodes'):
+			for name in re.findall(r"\('([^']*)'", command):
+				self.nodes[name] = len(self.nodes) + 1
+		elif command.startswith('insert into groups'):
+			for name in re.findall(r"\('([^']*)'\)", command):
+				self.groups[name] = len(self.groups) + 1
+
+		if command == 'select id, name from nodes':
+			return [ (id, name) for (name, id) in self.nodes.items() ]
+		if command == 'select id, name from groups':
+			return [ (id, name) for (name, id) in self.groups.items() ]
+		if command == 'select id, name from appliances':
+			return [ (1, 'frontend'), (2, 'backend') ]
+		if command.startswith('select name from appliances'):
+			return [ ('frontend', ), ('backend', ) ]
+		if command.startswith('select name from boxes'):
+			return [ ('default', ) ]
+		if command == 'select id, name, os from boxes':
+			return [ (1, 'default', 1) ]
+		if command == 'select id, name from oses':
+			return [ (1, 'redhat') ]
+		if command == 'select id, name from subnets':
+			return [ (1, 'private') ]
+		if command == 'select id, name, type from bootnames':
+			return [ (1, 'default', 'install'), (2, 'default', 'os') ]
+		if command.startswith('select b.id, b.type, ba.os'):
+			return [ (1, 'install', 0), (2, 'os', 0) ]
+		return []
+
+
+def hostfile(tmpdir, hosts, duplicate=False):
+	csv = tmpdir.join('hosts.csv')
+	with open(str(csv), 'w') as fout:
+		fout.write('name,appliance,rack,rank,ip,mac,interface,network,groups\n')
+		for n in range(0, hosts):
+			if duplicate and n == hosts - 1:
+				n = 0
+			fout.write('backend-%d-%d,backend,%d,%d,10.%d.%d.%d,%s,eth0,private,rack%d\n' % (
+				n // 100, n % 100, n // 100, n % 100,
+				(n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff,
+				'02:00:00:%02x:%02x:%02x' % (
+					(n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff),
+				n // 100))
+	return str(csv)
+
+
+def load(database, csv, removed=[]):
+	o = stack.commands.load.hostfile.Command(database)
+	o.db.getHostname = lambda host: 'frontend-0-0'
+
+	def call(command, args=[]):
+		o.calls.append((command, args, len(database.statements)))
+		return {
+			'list.network': [ { 'network': 'private',
+					    'address': '10.0.0.0',
+					    'mask': '255.0.0.0' } ],
+			'list.bootaction': [ { 'bootaction': 'default' } ]
+			}.get(command, [])
+
+	o.call	     = call
+	o.calls	     = []
+	o.hosts      = {}
+	o.interfaces = {}
+	o.removed    = list(removed)
+	o.runImplementation('load_default', (csv, ))
+	o.runPlugins((o.hosts, o.interfaces))
+	return o
+
+
+def test_load_hostfile(tmpdir):
+	"""
+	Load a synthetic 10,000 host spreadsheet, the database work is
+	a handful of multi-row statements in one transaction.
+	"""
+
+	database = Database()
+	csv	 = hostfile(tmpdir, HOSTS)
+
+	t0 = time.time()
+	o  = load(database, csv)
+	t1 = time.time()
+
+	print('...')
+	print('load hostfile %d hosts (%.3fs, %d statements)' %
+	      (HOSTS, t1 - t0, database.queries))
+
+	assert len(o.hosts) == HOSTS
+	assert len(database.nodes) == HOSTS + 1
+	assert len(database.groups) == HOSTS // 100
+	assert database.queries < 100
+	assert database.statements.count('start') == 1
+	assert database.statements.count('commit') == 1
+
+
+def test_load_hostfile_duplicate(tmpdir):
+	database = Database()
+	with pytest.raises(CommandError):
+		load(database, hostfile(tmpdir, 10, duplicate=True))
+	assert 'insert' not in database.statements
+
+
+def test_load_hostfile_values(tmpdir):
+	"""
+	Values are passed as query parameters, new hosts get their rack
+	and rank from the name the same way as with 'add host', and the
+	hosts of other frontends are removed inside the transaction.
+	"""
+
+	csv = tmpdir.join('hosts.csv')
+	with open(str(csv), 'w') as fout:
+		fout.write('name,appliance,rack,rank,ip,mac,interface,network,'
+			   'interface hostname,comment\n')
+		fout.write("backend-3-4,backend,,,10.0.0.1,02:00:00:00:00:01,"
+			   "eth0,private,null,it's new\n")
+
+	database = Database()
+	o = load(database, str(csv), removed=[ 'backend-9-9' ])
+
+	nodes = [ c for c in database.commands
+		  if c.startswith('insert into nodes') ]
+	assert nodes == [ "insert into nodes (name, appliance, box, rack, "
+			  "rank, osaction, installaction, comment) values "
+			  "('backend-3-4', 2, 1, '3', '4', 2, 1, 'it\\'s new')" ]
+	networks = [ c for c in database.commands
+		     if c.startswith('insert into networks') ]
+	assert "'10.0.0.1', 'backend-3-4', 'eth0'" in networks[0]
+
+	start  = database.statements.index('start')
+	commit = database.statements.index('commit')
+	[ (n, args) ] = [ (n, args) for (command, args, n) in o.calls
+			  if command == 'remove.host' ]
+	assert args == [ 'backend-9-9', 'sync=false' ]
+	assert start < n <= commit
+
+	# the rack and rank come from any three-part name, the
+	# appliance only from a basename that is one
+
+	with open(str(csv), 'w') as fout:
+		fout.write('name,appliance,rack,rank,ip,mac,interface,network\n')
+		fout.write('compute-1-2,backend,,,10.0.0.2,02:00:00:00:00:02,'
+			   'eth0,private\n')
+	database = Database()
+	load(database, str(csv))
+	nodes = [ c for c in database.commands
+		  if c.startswith('insert into nodes') ]
+	assert "('compute-1-2', 2, 1, '1', '2', 2, 1, NULL)" in nodes[0]
+
+	with open(str(csv), 'w') as fout:
+		fout.write('name,appliance,rack,rank,ip,mac,interface,network\n')
+		fout.write('compute,backend,,,10.0.0.2,02:00:00:00:00:02,'
+			   'eth0,private\n')
+	database = Database()
+	with pytest.raises(CommandError):
+		load(database, str(csv))
+	assert 'insert' not in database.statements
+	assert 'rollback' in database.statements
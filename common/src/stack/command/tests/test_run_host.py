@@ -0,0 +1,161 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import time
+import types
+import socket
+import threading
+import stack.ssh
+import stack.commands
+import stack.commands.run.host
+import stack.commands.run.host.imp_ssh
+import stack.commands.run.host.imp_async
+from .stubdb import Connection
+
+HOSTS = 1000
+
+# Fake ssh: the command is the number of seconds to sleep before
+# answering with the name of the host.  Like ssh it takes everything
+# down with it when terminated.
+
+SSH = """#!/bin/sh
+trap 'kill $!; exit 143' TERM
+sleep $2 &
+wait $!
+echo "$1"
+echo "stderr $1" 1>&2
+"""
+
+
+def sshd(server):
+	"""
+	Answers every connection with an SSH banner.
+	"""
+	while True:
+		try:
+			(conn, addr) = server.accept()
+		except OSError:
+			return
+		conn.sendall(b'SSH-2.0-OpenSSH_7.4\r\n')
+		conn.close()
+
+
+def command(hosts, cmd, timeout=0, threads=0, method='async', format='json'):
+	o = stack.commands.run.host.Command(Connection(lambda c: []))
+	o._params    = { 'output-format': format }
+	o.hosts      = hosts
+	o.cmd        = cmd
+	o.timeout    = timeout
+	o.numthreads = threads
+	o.delay      = 0
+	o.collate    = True
+	o.beginOutput()
+	o.runImplementation(method, [ hosts, cmd ])
+	return o
+
+
+def collated(o):
+	output = {}
+	for (host, line) in o.output:
+		output.setdefault(host, []).append(line)
+	for host in output:
+		output[host].sort()
+	return output
+
+
+class Socket(socket.socket):
+	"""
+	imp_ssh always probes port 22, send it to the fake sshd.
+	"""
+
+	port = None
+
+	def connect(self, address):
+		socket.socket.connect(self, (address[0], self.port))
+
+
+def test_async(tmpdir, monkeypatch, capsys):
+	ssh = tmpdir.join('ssh')
+	ssh.write(SSH)
+	ssh.chmod(0o755)
+	monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+
+	server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server.bind(('0.0.0.0', 0))
+	server.listen(1024)
+	threading.Thread(target=sshd, args=(server,), daemon=True).start()
+	monkeypatch.setattr(stack.commands.run.host.imp_async, 'Port',
+			    server.getsockname()[1])
+	monkeypatch.setattr(stack.commands.run.host, 'pool',
+			    stack.ssh.ControlPool(None))
+
+	# Every address of 127.0.0.0/8 is the loopback.
+
+	hosts = [ '127.0.%d.%d' % (i // 250, i % 250 + 1) for i in range(0, HOSTS) ]
+
+	t0 = time.time()
+	o  = command(hosts, '0.1', threads=256)
+	t1 = time.time()
+
+	output = collated(o)
+	assert len(output) == HOSTS
+	for host in hosts:
+		assert output[host] == sorted([ host, 'stderr %s' % host ])
+
+	# 1000 hosts sleeping 0.1s, 256 at a time.
+
+	assert t1 - t0 < 10
+
+	# The thread per host implementation gives the same output.
+
+	Socket.port = server.getsockname()[1]
+	monkeypatch.setattr(stack.commands.run.host.imp_ssh, 'socket',
+			    types.SimpleNamespace(socket=Socket,
+						  AF_INET=socket.AF_INET,
+						  SOCK_STREAM=socket.SOCK_STREAM,
+						  gethostname=socket.gethostname))
+	t2 = time.time()
+	o  = command(hosts, '0.1', threads=256, method='ssh')
+	t3 = time.time()
+	assert collated(o) == output
+
+	print('run host %d hosts: ssh %.3fs async %.3fs' %
+	      (HOSTS, t3 - t2, t1 - t0))
+
+	# Collated text is printed as each host finishes, lined up
+	# the same as the table.
+
+	capsys.readouterr()
+	o = command(hosts[:2] + [ 'localhost.localdomain' ], '0', format='text')
+	assert o.output == []
+	lines = capsys.readouterr().out.split('\n')
+	assert lines[0].split() == [ 'HOST', 'OUTPUT' ]
+	assert '%s %s' % ('127.0.0.1'.ljust(21), '127.0.0.1') in lines
+
+	# A host that cannot be started is an error, not missing.
+
+	def connect(host, *args):
+		raise OSError('no control master')
+	monkeypatch.setattr(stack.commands.run.host.pool, 'connect', connect)
+	o = command(hosts[:2], '0')
+	assert o.output == [ [ h, 'error - no control master' ]
+			     for h in hosts[:2] ]
+
+	# The ssh is terminated at the timeout.
+
+	t0 = time.time()
+	o  = command(hosts[:10], '60', timeout=1)
+	t1 = time.time()
+	assert t1 - t0 < 5
+	assert len(o.output) == 10
+
+	# Without sshd the hosts are down.
+
+	server.shutdown(socket.SHUT_RDWR)
+	server.close()
+	o = command(hosts[:10], '0')
+	assert [ line for (host, line) in o.output ] == [ 'down' ] * 10
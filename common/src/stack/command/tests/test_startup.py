@@ -0,0 +1,74 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+import stack
+import stack.commandindex
+
+RUNS = 10
+
+
+def install(root):
+	"""
+	Installs the command line and the commands under ROOT, with a
+	command index, the same way the Makefile does.  The rest of
+	the stack package comes from the source tree.
+	"""
+
+	source = os.path.dirname(stack.__file__)
+	shutil.copy(os.path.join(source, '..', 'stack.py'), root)
+	shutil.copytree(os.path.join(source, 'commands'),
+			os.path.join(root, 'stack', 'commands'))
+	with open(os.path.join(source, '__init__.py'), 'r') as fin:
+		init = fin.read()
+	with open(os.path.join(root, 'stack', '__init__.py'), 'w') as fout:
+		fout.write(init)
+		fout.write('__path__.append(%r)\n' % source)
+		for path in stack.__path__[1:]:
+			fout.write('__path__.append(%r)\n' % os.path.abspath(path))
+	stack.commandindex.Write(os.path.join(root, 'stack', 'commands'))
+	return os.path.join(root, 'stack.py')
+
+
+def test_startup(tmp_path):
+	"""
+	Startup cost of the stack command line (warm cache): the wall
+	time of 'stack list host' and the slowest imports.
+	"""
+
+	command = install(str(tmp_path))
+
+	def run(*flags):
+		return subprocess.run([ sys.executable ] + list(flags) +
+				      [ command, 'list', 'host' ],
+				      stdout=subprocess.PIPE,
+				      stderr=subprocess.PIPE)
+
+	run()
+	t0 = time.time()
+	for i in range(0, RUNS):
+		run()
+	t1 = time.time()
+
+	imports = []
+	for line in run('-X', 'importtime').stderr.decode().splitlines():
+		if not line.startswith('import time:'):
+			continue
+		(self, total, name) = line[12:].split('|')
+		if total.strip().isdigit():
+			imports.append((int(total), name.rstrip()))
+
+	print('...')
+	print('stack list host (%.3fs)' % ((t1 - t0) / RUNS))
+	for (usec, name) in sorted(imports, reverse=True)[:10]:
+		print('%8.3fs %s' % (usec / 1000000.0, name))
+
+	assert 'stack.commands.list.host' in [ n.strip() for (u, n) in imports ]
+	assert 'xml.sax.saxutils' not in [ n.strip() for (u, n) in imports ]
@@ -0,0 +1,104 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import io
+import os
+import json
+import marshal
+import stack.commands
+import stack.commands.list.attr
+from .stubdb import Connection
+
+ATTRS = 2500
+
+
+def rows(command):
+	if command.startswith('select command, groupid from access'):
+		return [ ('*', os.getgid()) ]
+	if "a.scope = 'global'" in command:
+		return [ ('global', 'attr.%d' % i, 'value.%d' % i, None)
+			 for i in range(0, ATTRS) ]
+	return []
+
+
+class Stream(io.BytesIO):
+	"""
+	Remembers how many rows the command had buffered at each write.
+	"""
+
+	def __init__(self, command=None):
+		io.BytesIO.__init__(self)
+		self.command  = command
+		self.buffered = []
+
+	def write(self, data):
+		if self.command:
+			self.buffered.append(len(self.command.output))
+		return io.BytesIO.write(self, data)
+
+
+def run(args, stream=None):
+	o = stack.commands.list.attr.Command(Connection(rows))
+	o.stream = stream
+	if stream is not None:
+		stream.command = o
+	o.runWrapper('list attr', args)
+	return o.getText()
+
+
+def test_stream():
+	for format in [ 'text', 'json', 'binary' ]:
+		stream = Stream()
+		assert not run([ 'output-format=%s' % format ], stream)
+		text   = run([ 'output-format=%s' % format ])
+
+		# rows are written as they are added, not buffered
+
+		if format != 'text':
+			assert stream.buffered and not max(stream.buffered)
+
+		if format == 'text':
+			assert stream.getvalue().decode() == text
+
+		# json is one row per line
+
+		elif format == 'json':
+			lines = stream.getvalue().decode().splitlines()
+			assert len(lines) >= ATTRS
+			assert [ json.loads(line) for line in lines ] == json.loads(text)
+
+		# binary is a series of marshalled chunks of rows
+
+		else:
+			stream.seek(0)
+			result = []
+			while True:
+				try:
+					result.extend(marshal.load(stream))
+				except EOFError:
+					break
+			assert result == marshal.loads(text)
+
+
+def test_stream_buffered():
+	"""
+	Commands that only give their header to endOutput still stream
+	the same rows.
+	"""
+
+	for format in [ 'json', 'binary' ]:
+		o = stack.commands.Command(Connection())
+		o._params = { 'output-format': format }
+		o.stream  = io.BytesIO()
+		o.beginOutput()
+		o.addOutput('backend-0-0', 'up')
+		o.endOutput(header=[ 'host', 'status' ])
+
+		row = { 'host': 'backend-0-0', 'status': 'up' }
+		if format == 'json':
+			assert json.loads(o.stream.getvalue().decode()) == row
+		else:
+			assert marshal.loads(o.stream.getvalue()) == [ row ]
@@ -0,0 +1,38 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.commands.sync.host
+import stack.commands.report.script
+from .stubdb import Connection
+
+
+def test_run(monkeypatch):
+	monkeypatch.setattr(stack.commands.sync.host, 'timeout', 1)
+
+	results = stack.commands.sync.host.Run({
+		'backend-0-0': 'echo out; echo err 1>&2; exit 3' },
+		me='backend-0-0')
+
+	assert results['backend-0-0']['rc'] == 3
+	assert results['backend-0-0']['output'] == 'out\n'
+	assert results['backend-0-0']['error'] == 'err\n'
+
+	results = stack.commands.sync.host.Run({
+		'backend-0-0': 'sleep 10' }, me='backend-0-0')
+
+	assert results['backend-0-0']['rc'] == -1
+	assert results['backend-0-0']['duration'] < 5
+
+
+def test_script():
+	owner  = stack.commands.Command(Connection(lambda command: []))
+	script = stack.commands.report.script.Script(owner, 'redhat',
+		{ 'mtu': '9000' },
+		'<stack:file stack:name="/tmp/ifcfg-eth0">\nMTU=&mtu;\n</stack:file>\n')
+
+	assert script.startswith('#! /bin/bash')
+	assert 'MTU=9000\n' in script
@@ -0,0 +1,64 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.querycache
+from .stubdb import Connection
+
+
+def test_transaction(tmp_path, monkeypatch):
+	"""
+	A select cached by another process while a transaction is open
+	reads the rows from before the transaction, it must not outlive
+	the commit (or rollback).
+	"""
+
+	monkeypatch.delenv('STACKSHAREDCACHE', raising=False)
+
+	db	  = stack.commands.DatabaseConnection(Connection())
+	db.shared = stack.querycache.QueryCache(str(tmp_path))
+	other	  = stack.querycache.QueryCache(str(tmp_path))
+	nodes	  = stack.querycache.Tables('name from nodes')
+
+	for end in [ 'commit', 'rollback' ]:
+		db.execute('start transaction')
+		db.execute("update nodes set rack=1 where name='backend-0-0'")
+
+		other.put('nodes', other.stamp(nodes), (('backend-0-0', 0), ))
+		assert other.get('nodes')
+
+		db.execute(end)
+		assert other.get('nodes') is None
+
+	# outside of a transaction the write itself invalidates
+
+	other.put('nodes', other.stamp(nodes), (('backend-0-0', 0), ))
+	db.execute("update nodes set rack=1 where name='backend-0-0'")
+	assert other.get('nodes') is None
+
+
+def test_users(tmp_path, monkeypatch):
+	"""
+	The shared cache is kept per database user, not per OS user.
+	"""
+
+	monkeypatch.setenv('STACKSHAREDCACHE', 'true')
+	monkeypatch.setattr(stack.querycache, 'CacheDir', str(tmp_path))
+
+	admin  = stack.commands.DatabaseConnection(Connection(user='apache'))
+	nobody = stack.commands.DatabaseConnection(Connection(
+		rows=lambda command: [], user='nobody'))
+	admin.database.rows = lambda command: [ ('backend-0-0', ) ]
+
+	assert admin.select('name from nodes') == (('backend-0-0', ), )
+	assert nobody.select('name from nodes') == ()
+	assert nobody.database.queries == 1
+
+	# same database user, same entries
+
+	other = stack.commands.DatabaseConnection(Connection(user='apache'))
+	assert other.select('name from nodes') == (('backend-0-0', ), )
+	assert other.database.queries == 0
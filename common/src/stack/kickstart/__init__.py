@@ -6,6 +6,20 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
+import io
+import os
+import re
+import sys
+import json
+import socket
+import stack.api
+import stack.bool
+
+# UNIX socket of the profile daemon (profiled), when it is running the
+# profile.cgi just forwards the request to it.
+
+Socket = '/var/run/stack/profiled/profile.sock'
+
 
 class ProfileBase:
 
@@ -18,3 +32,238 @@ class ProfileBase:
         def post(self, client):
                 pass
 
+
+class Client:
+	"""
+	Metadata for the calling client, this is always passed to
+	the profile-os module to generate the installer script.
+
+	The FORM and ENVIRON dictionaries are the CGI form fields and
+	environment of the request.  All output is buffered in the client
+	(see print) so the same code can run in the CGI or in the profile
+	daemon.
+	"""
+
+	def __init__(self, form, environ, **kwargs):
+		self.form	 = form
+		self.environ	 = environ
+		self.output	 = io.StringIO()
+		self.addr	 = kwargs.get('addr')
+		self.port	 = kwargs.get('port')
+		self.arch	 = kwargs.get('arch')
+		self.np		 = kwargs.get('np')
+		self.os		 = kwargs.get('os')
+		self.interactive = kwargs.get('interactive', 0)
+		self.profile	 = None
+
+
+	def print(self, *args, **kwargs):
+		"""
+		Same as the print() builtin but writes to the
+		response buffer.
+		"""
+		kwargs['file'] = self.output
+		print(*args, **kwargs)
+
+	def getOutput(self):
+		return self.output.getvalue()
+
+	def error(self, message):
+		self.print("Content-type: text/html")
+		self.print("Status: 500 Internal Error\n")
+		self.print("<h1>%s</h1>" % message)
+		self.status('install profile.cgi error (%s)' % message)
+		sys.exit(1)
+
+	def call(self, cmd, args=[]):
+		"""
+		Runs the stack command CMD and returns the result as
+		stack.api.Call does.
+		"""
+		return stack.api.Call(cmd, args)
+
+	def report(self, cmd, args=[]):
+		"""
+		Runs the stack command CMD and returns the list of
+		output lines.
+		"""
+		report = []
+		cmd = '/opt/stack/bin/stack %s %s' % (cmd, ' '.join(args))
+		for line in os.popen(cmd).readlines():
+			report.append(line[:-1])
+		return report
+
+
+	def load(self):
+		"""
+		Validates the request and loads the profile-os module.
+		"""
+		if self.addr is None:
+			self.addr = self.environ['REMOTE_ADDR']
+		if self.port is None:
+			self.port = int(self.environ['REMOTE_PORT'])
+
+		if not self.arch:
+			self.arch = self.form.get('arch')
+			if not self.arch or re.search('[^a-zA-Z0-9_]+', self.arch):
+				self.error('Invalid arch field')
+
+		if not self.np:
+			self.np = self.form.get('np')
+			if not self.np or re.search('[^0-9]+', self.np):
+				self.error('Invalid np field')
+
+		if not self.os:
+			self.os = self.form.get('os')
+			if not self.os or re.search('[^a-zA-Z0-9_]+', self.os):
+				self.error('Invalid os field')
+
+		try:
+			osModule     = __import__('profile.%s' % self.os)
+			osClass	     = getattr(osModule, self.os).Profile
+			self.profile = osClass()
+		except ImportError:
+			self.profile = None
+
+	def pre(self):
+		"""
+		Run the OS-specific pre-semaphore code.
+		"""
+		if self.profile:
+			self.profile.pre(self)
+
+	def update(self):
+		"""
+		Set some values in the database based on the web request.
+		"""
+		self.call('set host attr', [ self.addr, 'attr=arch', 'value=%s' % self.arch ])
+		self.call('set host attr', [ self.addr, 'attr=cpus', 'value=%s' % self.np ])
+
+		#
+		# update the MAC info in the database
+		#
+		# but there are certain cases in which you don't want the MACs
+		# updated -- in that case, set the attribute
+		# 'profile.update_macs' to 'false'.
+		#
+		output = self.call('list host attr',
+			[ self.addr, 'attr=profile.update_macs' ])
+
+		if output:
+			row = output[0]
+			if not stack.bool.str2bool(row['value']):
+				return
+
+		#
+		# add all the detected network interfaces to the database
+		#
+		ifaces = []
+		macs = []
+		modules = []
+		flags = []
+
+		for i in self.environ:
+			if re.match('HTTP_X_RHN_PROVISIONING_MAC_[0-9]+', i):
+				devinfo = self.environ[i].split()
+				iface	= devinfo[0]
+				macaddr = devinfo[1].lower()
+				module	= ''
+				if len(devinfo) > 2:
+					module = devinfo[2]
+
+				ks = ''
+				if len(devinfo) > 3:
+					ks = 'ks'
+
+				ifaces.append(iface)
+				macs.append(macaddr)
+				modules.append(module)
+				flags.append(ks)
+
+		params = []
+		if len(ifaces) > 0 and len(macs) > 0:
+			params.append('interface=%s' % ','.join(ifaces))
+			params.append('mac=%s' % ','.join(macs))
+
+			if len(modules) > 0:
+				params.append('module=%s' % (','.join(modules)))
+			if len(flags) > 0:
+				params.append('flag=%s' % (','.join(flags)))
+
+			self.call('config host interface', [ self.addr ] + params)
+
+	def main(self):
+		"""
+		Run the OS-specific profile generator.
+		"""
+		if self.profile:
+			self.profile.main(self)
+
+	def post(self):
+		"""
+		Run the OS-specific post-semaphore code.
+		"""
+		if self.profile:
+			self.profile.post(self)
+		else:
+			self.print("Content-type: text/html")
+			self.print("Status: 500 Internal Error\n")
+			self.print("<h1>Unsupported OS</h1>")
+
+	def busy(self):
+		"""
+		Out of resources force the client to retry.
+		"""
+		self.print("Content-type: text/html")
+		self.print("Status: 503 Service Busy")
+		self.print("Retry-After: 15")
+		self.print()
+		self.print("<h1>Service is Busy</h1>")
+		self.status('install profile.cgi retry')
+
+	def status(self, message):
+		if self.interactive == 1:
+			return
+
+		msg = { 'source' : self.addr, 'channel' : 'health',
+			'message' : message }
+		m = json.dumps(msg)
+
+		tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		tx.sendto(m.encode(), ('127.0.0.1', 5000))
+		tx.close()
+
+
+def Forward(form, environ):
+	"""
+	Sends the request to the profile daemon and returns the
+	response, or None if the daemon is not running.
+	"""
+
+	request = { 'form': form, 'environ': {} }
+	for key in environ:
+		if key in [ 'REMOTE_ADDR', 'REMOTE_PORT' ] or \
+			key.startswith('HTTP_X_RHN_PROVISIONING_MAC_'):
+			request['environ'][key] = environ[key]
+
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		s.connect(Socket)
+	except OSError:
+		s.close()
+		return None
+
+	response = b''
+	try:
+		s.sendall(json.dumps(request).encode() + b'\n')
+		while True:
+			data = s.recv(65536)
+			if not data:
+				break
+			response += data
+	finally:
+		s.close()
+
+	if not response:
+		return None
+	return response
@@ -0,0 +1,244 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Profile daemon.  Generates the installation profiles for profile.cgi
+# without starting a new interpreter (and database connection) for
+# every command of every request.  The command modules stay loaded and
+# the database connections are kept in a pool.
+
+import io
+import os
+import sys
+import pwd
+import json
+import queue
+import signal
+import syslog
+import threading
+import socketserver
+import pymysql
+import stack
+import stack.commands
+
+sys.path.insert(0, '/export/stack/sbin')
+import profile
+
+
+class Database:
+	"""
+	Pool of database connections, one for each profile generator
+	that can run at a time.
+	"""
+
+	def __init__(self, size):
+		self.pool = queue.Queue()
+		for i in range(0, size):
+			self.pool.put(None)
+
+	def connect(self):
+		passwd = ''
+		try:
+			with open('/opt/stack/etc/my.cnf', 'r') as fin:
+				for line in fin.readlines():
+					if line.startswith('password'):
+						passwd = line.split('=')[1].strip()
+						break
+		except:
+			pass
+
+		if os.path.exists('/var/opt/stack/mysql/mysql.sock'):
+			return pymysql.connect(db='cluster',
+				host='localhost',
+				user='apache',
+				passwd='%s' % passwd,
+				unix_socket='/var/opt/stack/mysql/mysql.sock',
+				autocommit=True)
+
+		try:
+			host = stack.DatabaseHost
+		except:
+			host = 'localhost'
+		return pymysql.connect(db='cluster',
+			host='%s' % host,
+			user='apache',
+			passwd='%s' % passwd,
+			port=40000,
+			autocommit=True)
+
+	def get(self):
+		link = self.pool.get()
+		try:
+			if link:
+				link.ping(reconnect=True)
+			else:
+				link = self.connect()
+		except pymysql.err.Error:
+			self.pool.put(None)
+			raise
+		return link
+
+	def put(self, link):
+		self.pool.put(link)
+
+
+class Client(profile.Client):
+	"""
+	Runs the stack commands in-process, all the commands of a
+	request share one database connection (and select cache).
+	"""
+
+	def call(self, cmd, args=[]):
+		cmd = '.'.join(cmd.split())
+		if cmd.split('.')[0] == 'list':
+			return self.command.call(cmd, args)
+		return self.report(cmd, args)
+
+	def report(self, cmd, args=[]):
+		text = self.command.command('.'.join(cmd.split()), args)
+		if isinstance(text, bytes):
+			text = text.decode()
+		return text.splitlines()
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+	timeout = 60
+
+	def handle(self):
+		try:
+			request = json.loads(self.rfile.readline().decode())
+		except (OSError, ValueError):
+			return
+
+		client = Client(request.get('form', {}),
+				request.get('environ', {}))
+		try:
+			self.server.generate(client)
+		except SystemExit:
+			pass
+		except Exception as e:
+			syslog.syslog(syslog.LOG_ERR, 'request %s failed: %s' %
+				      (client.addr, e))
+			client.output = io.StringIO()
+			try:
+				client.error('Internal Error')
+			except SystemExit:
+				pass
+
+		self.wfile.write(client.getOutput().encode())
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+	daemon_threads = True
+
+	def __init__(self, path, count):
+		if os.path.exists(path):
+			os.unlink(path)
+		socketserver.UnixStreamServer.__init__(self, path, Handler)
+
+		# Only apache (profile.cgi), which we are running as, can
+		# talk to us.
+
+		os.chmod(path, 0o600)
+
+		# Replaces the profile.semaphore file, restrict the
+		# number of concurrent profile generators to the number
+		# of CPUs.
+
+		self.limiter  = threading.BoundedSemaphore(count)
+		self.database = Database(count)
+
+	def generate(self, client):
+		client.load()
+		client.status('install profile.cgi started')
+		syslog.syslog(syslog.LOG_DEBUG, 'request %s:%s' %
+			      (client.addr, client.port))
+		client.pre()
+
+		if not self.limiter.acquire(blocking=False):
+			syslog.syslog(syslog.LOG_DEBUG, 'limiter full')
+			client.busy()
+			return
+
+		try:
+			link = self.database.get()
+			try:
+				client.command = stack.commands.Command(link)
+				client.update()
+
+				#
+				# Generate the system profile
+				#
+				client.main()
+			finally:
+				self.database.put(link)
+		finally:
+			self.limiter.release()
+
+		client.post()
+		client.status('install profile.cgi profile sent')
+
+
+def Apache():
+	"""
+	Makes the run directory (the socket and pid file) belong to
+	apache, then runs the rest of the daemon as apache.  Profiles
+	run the <stack:eval> shell of the node XML, they must not run
+	as root.
+	"""
+
+	rundir = os.path.dirname(Socket)
+	os.makedirs(rundir, exist_ok=True)
+	if os.geteuid() != 0:
+		return None
+
+	pw = pwd.getpwnam('apache')
+	os.chown(rundir, pw.pw_uid, pw.pw_gid)
+	os.chmod(rundir, 0o700)
+
+	return pw
+
+
+def Drop(pw):
+	if pw:
+		os.setgroups([])
+		os.setgid(pw.pw_gid)
+		os.setuid(pw.pw_uid)
+
+
+Socket	= profile.Socket
+PIDFile = os.path.join(os.path.dirname(Socket), 'profiled.pid')
+
+
+##
+## MAIN
+##
+
+if __name__ == '__main__':
+	pw = Apache()
+
+	if 'STACKDEBUG' not in os.environ:
+		import daemon
+		import lockfile.pidlockfile
+
+		lock = lockfile.pidlockfile.PIDLockFile(PIDFile)
+		daemon.DaemonContext(pidfile=lock).open()
+
+	Drop(pw)
+
+	syslog.openlog('profiled', syslog.LOG_PID, syslog.LOG_LOCAL0)
+
+	count  = int(os.environ.get('STACKPROFILES', os.cpu_count() or 8))
+	server = Server(Socket, count)
+
+	signal.signal(signal.SIGTERM, lambda signal, frame: sys.exit(0))
+	try:
+		server.serve_forever()
+	finally:
+		os.unlink(Socket)
@@ -8,9 +8,7 @@
 
 
 from __future__ import print_function
-import os
 import sys
-import stack.api
 import profile
 
 
@@ -22,24 +20,21 @@ class Profile(profile.ProfileBase):
 		# This means only a root user can request a kickstart file
 
 		if client.port > 1023:
-			print("Content-type: text/html")
-			print("Status: 401 Unauthorized\n")
-			print("<h1>Unauthorized</h1>")
+			client.print("Content-type: text/html")
+			client.print("Status: 401 Unauthorized\n")
+			client.print("<h1>Unauthorized</h1>")
 			sys.exit(1)
 
 
 	def main(self, client):
 
-		report = []
-		cmd = '/opt/stack/bin/stack list host xml %s' % client.addr
-		for line in os.popen(cmd).readlines():
-			report.append(line[:-1])
+		report = client.report('list host xml', [ client.addr ])
 
 		#
 		# get the avalanche attributes
 		#
 
-		result = stack.api.Call('list host attr', [ client.addr ])
+		result = client.call('list host attr', [ client.addr ])
 		attrs  = {}
 		for dict in result:
 			if dict['attr'] in [
@@ -59,10 +54,10 @@ class Profile(profile.ProfileBase):
 
 		if report:
 			out = '\n'.join(report)
-			print('Content-type: application/octet-stream')
-			print('Content-length: %d' % (len(out)))
-			print('X-Avalanche-Trackers: %s' % (attrs['trackers']))
-			print('X-Avalanche-Pkg-Servers: %s' % (attrs['pkgservers']))
-			print('')
-			print(out)
+			client.print('Content-type: application/octet-stream')
+			client.print('Content-length: %d' % (len(out)))
+			client.print('X-Avalanche-Trackers: %s' % (attrs['trackers']))
+			client.print('X-Avalanche-Pkg-Servers: %s' % (attrs['pkgservers']))
+			client.print('')
+			client.print(out)
 		
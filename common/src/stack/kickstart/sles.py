@@ -6,7 +6,6 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
-import os
 import profile
 
 
@@ -14,15 +13,12 @@ class Profile(profile.ProfileBase):
 
 	def main(self, client):
 
-		report = []
-		cmd = '/opt/stack/bin/stack list host xml %s' % client.addr
-		for line in os.popen(cmd).readlines():
-			report.append(line[:-1])
+		report = client.report('list host xml', [ client.addr ])
 
 		if report:
 			out = '\n'.join(report)
-			print('Content-type: application/octet-stream')
-			print('Content-length: %d' % len(out))
-			print('')
-			print(out)
+			client.print('Content-type: application/octet-stream')
+			client.print('Content-length: %d' % len(out))
+			client.print('')
+			client.print(out)
 		
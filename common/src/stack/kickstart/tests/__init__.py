@@ -0,0 +1,32 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# The kickstart sources are installed as the profile package (next to
+# profile.cgi) and the profiled script, load them from the source tree
+# under the same names.
+
+import os
+import sys
+import importlib.util
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, path, package=False):
+	if package:
+		spec = importlib.util.spec_from_file_location(name, path,
+			submodule_search_locations=[ os.path.dirname(path) ])
+	else:
+		spec = importlib.util.spec_from_file_location(name, path)
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
+
+
+if 'profiled' not in sys.modules:
+	load('profile', os.path.join(Root, '__init__.py'), package=True)
+	load('profiled', os.path.join(Root, 'profiled.py'))
@@ -0,0 +1,58 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import threading
+import stack
+import stack.commands
+import profile
+import profiled
+
+
+class Database:
+
+	def get(self):
+		return None
+
+	def put(self, link):
+		pass
+
+
+class Server(profiled.Server):
+	"""
+	Answers every request with the output of 'report version' run
+	through the daemon's Client.
+	"""
+
+	def generate(self, client):
+		client.command = stack.commands.Command(self.database.get())
+		client.print('Content-type: text/plain\n')
+		for line in client.call('report version'):
+			client.print(line)
+
+
+def test_profiled(tmp_path, monkeypatch):
+	socket = str(tmp_path / 'profile.sock')
+	monkeypatch.setattr(profile, 'Socket', socket)
+
+	# without the daemon the cgi generates the profile itself
+
+	assert profile.Forward({}, {}) is None
+
+	server = Server(socket, 2)
+	server.database = Database()
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	try:
+		response = profile.Forward({ 'os': 'redhat' },
+					   { 'REMOTE_ADDR': '127.0.0.1',
+					     'REMOTE_PORT': '1000' })
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	assert response.decode() == 'Content-type: text/plain\n\n%s\n' % \
+		stack.version
@@ -1,17 +1,17 @@
 #!/opt/stack/bin/python3
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect
-from urllib.request import unquote
+from aiohttp import web
+import aiohttp
+import asyncio
 import os
-import requests
 import hashlib
-import subprocess
+import tempfile
 import click
 import logging
 from logging import FileHandler
 
 
-app = Flask(__name__)
+log = logging.getLogger('ludicrous-client')
 
 tracker_settings = {
 	'TRACKER' : '',
@@ -28,8 +28,35 @@ client_settings = {
 
 timed_out_hosts = []
 
+CHUNK_SIZE = 1024 * 1024
+
+# Files at least RANGE_SIZE bytes are fetched by byte range from up to
+# MAX_RANGES peers at once.
+
+RANGE_SIZE = 32 * 1024 * 1024
+MAX_RANGES = 4
+
+# Files fetched from peers or the frontend at the same time, more
+# requests for missing files wait their turn.
+
+MAX_FETCHES = 8
+
+# The read timeout is per chunk, large files can take as long as they
+# need.
+
+CONNECT_TIMEOUT = 0.1
+READ_TIMEOUT	= 5
+
+# Downloads in flight, maps the local file to the task fetching it so
+# concurrent requests for the same file share one download.
+
+fetches = {}
+
+
+class DownloadError(Exception):
+	pass
+
 
-@app.errorhandler(404)
 def four_o_four(error=None):
         error_message = error if type(error) is str else "File not found."
         message = {
@@ -37,10 +64,7 @@ def four_o_four(error=None):
                 'message': error_message
         }
 
-        resp = jsonify(message)
-        resp.status_code = 404
-
-        return resp
+        return web.json_response(message, status=404)
 
 
 def hashit(filename):
@@ -49,10 +73,46 @@ def hashit(filename):
 	return hashcode.hexdigest()
 
 
-def save_file(content, location, filename):
-	subprocess.call(['mkdir', '-p', location])
-	with open(location + filename, 'wb') as f:
-		f.write(content)
+def temp_file(location, filename):
+	"""
+	Returns an open temp file next to LOCATION/FILENAME.  The file
+	is renamed into place once it is complete and verified, so a
+	partial download is never served.
+	"""
+	os.makedirs(location, exist_ok=True)
+	return tempfile.mkstemp(dir=location, prefix='.%s.' % filename)
+
+
+def checksum_file(path):
+	sha = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+
+def verify(length, digest, size, checksum):
+	if size is not None and length != int(size):
+		raise DownloadError('size is %d, expected %s' % (length, size))
+	if checksum and digest != checksum:
+		raise DownloadError('checksum mismatch')
+
+
+def install_file(tmp, location, filename):
+	os.chmod(tmp, 0o644)
+	os.rename(tmp, os.path.join(location, filename))
+
+
+def local_path(*parts):
+	"""
+	Returns the path of a file below LOCAL_SAVE_LOCATION, never
+	anything outside of it.
+	"""
+	root = os.path.normpath(client_settings['LOCAL_SAVE_LOCATION'] or '/')
+	path = os.path.normpath(os.path.join(root, *parts))
+	if path != root and not path.startswith(root.rstrip('/') + '/'):
+		raise web.HTTPNotFound()
+	return path
 
 
 def file_exists(local_file):
@@ -63,164 +123,299 @@ def tracker():
 	return "%s:%s" % (tracker_settings['TRACKER'], tracker_settings['PORT'])
 
 
-def lookup_file(hashcode):
-	try:
-		res = requests.get('http://%s/avalanche/lookup/%s' % (tracker(), hashcode), timeout=(0.1, 5))
-	except:
-		raise
-	return res
-
+async def lookup_file(session, hashcode, remote_file):
+	async with session.get('http://%s/avalanche/lookup/%s' % (tracker(), hashcode),
+			       params={'path': remote_file}) as res:
+		payload = await res.json()
+		payload['success'] = res.status == 200 and payload['success']
+	return payload
 
-def get_file(peer, remote_file):
-	try:
-		res = requests.get('http://%s%s' % (peer, remote_file), timeout=(0.1, 5))
-	except:
-		raise
 
-	return res
+def get_file(session, peer, remote_file, headers=None):
+	return session.get('http://%s%s' % (peer, remote_file), headers=headers)
 
 
-def register_file(port, hashcode):
-	try:
-		res = requests.post('http://%s/avalanche/register/%s/%s' % (
-									tracker(), 
+async def register_file(session, port, hashcode):
+	async with session.post('http://%s/avalanche/register/%s/%s' % (
+									tracker(),
 									port,
-									hashcode)
-									, timeout=(0.1, 5))
-	except:
-		raise
+									hashcode)) as res:
+		pass
 
 
-def unregister_file(hashcode, params):
-	try:
-		res = requests.delete('http://%s/avalanche/unregister/hashcode/%s' % (
+async def unregister_file(session, hashcode, params):
+	async with session.delete('http://%s/avalanche/unregister/hashcode/%s' % (
 									tracker(),
 									hashcode),
-									params=params
-									, timeout=(0.1, 5))
+									params=params) as res:
+		pass
+
+
+async def fetch_file(session, host, remote_file, location, filename, size=None, checksum=None):
+	"""
+	Streams REMOTE_FILE from HOST into LOCATION/FILENAME.  Returns
+	the size and sha256 checksum of the file.
+	"""
+	fd, tmp = temp_file(location, filename)
+	try:
+		sha    = hashlib.sha256()
+		length = 0
+		async with get_file(session, host, remote_file) as res:
+			if res.status != 200:
+				raise DownloadError('status %d' % res.status)
+			with os.fdopen(fd, 'wb') as f:
+				fd = None
+				async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+					f.write(chunk)
+					sha.update(chunk)
+					length += len(chunk)
+			if size is None and 'Content-Encoding' not in res.headers:
+				size = res.headers.get('Content-Length')
+
+		digest = sha.hexdigest()
+		verify(length, digest, size, checksum)
+		install_file(tmp, location, filename)
 	except:
+		if fd is not None:
+			os.close(fd)
+		os.unlink(tmp)
 		raise
 
-def unregister_host(host):
+	return (length, digest)
+
+
+async def fetch_range(session, fd, host, remote_file, start, end):
+	headers = { 'Range': 'bytes=%d-%d' % (start, end) }
+	async with get_file(session, host, remote_file, headers) as res:
+		if res.status != 206:
+			raise DownloadError('status %d' % res.status)
+		offset = start
+		async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+			os.pwrite(fd, chunk, offset)
+			offset += len(chunk)
+	if offset != end + 1:
+		raise DownloadError('short range %d-%d' % (start, end))
+
+
+async def fetch_ranges(session, peers, remote_file, location, filename, size, checksum):
+	"""
+	Fetches REMOTE_FILE from several PEERS at once, each one sends a
+	byte range.  A range that fails is fetched from the frontend.
+	Returns the size and checksum of the file and the peers that
+	failed.
+	"""
+	peers  = peers[:MAX_RANGES]
+	step   = (size + len(peers) - 1) // len(peers)
+	ranges = [ (peers[i], i * step, min(size, (i + 1) * step) - 1)
+		   for i in range(0, len(peers)) ]
+
+	failed = []
+	fd, tmp = temp_file(location, filename)
 	try:
-		res = requests.delete('http://%s/avalanche/unregister/host/%s' % (tracker(), host), timeout=(0.1, 5))
+		os.ftruncate(fd, size)
+		results = await asyncio.gather(*[
+			fetch_range(session, fd, peer, remote_file, start, end)
+			for (peer, start, end) in ranges ], return_exceptions=True)
+		for ((peer, start, end), e) in zip(ranges, results):
+			if isinstance(e, Exception):
+				log.info("  %s bytes %d-%d from %s was unsuccessful: %s",
+					filename, start, end, peer, e)
+				failed.append((peer, start, end))
+
+		for (peer, start, end) in failed:
+			await fetch_range(session, fd, tracker_settings['TRACKER'],
+				remote_file, start, end)
+		os.close(fd)
+		fd = None
+
+		digest = await asyncio.get_event_loop().run_in_executor(None,
+			checksum_file, tmp)
+		verify(os.path.getsize(tmp), digest, size, checksum)
+		install_file(tmp, location, filename)
 	except:
+		if fd is not None:
+			os.close(fd)
+		os.unlink(tmp)
 		raise
 
-
-def stream_it(response, content):
-	response.write(content)
+	return (size, digest, [ peer for (peer, start, end) in failed ])
 
 
-@app.route('/install/<path:path>/<filename>')
-def get_file_locally(path, filename):
-	save_location = client_settings['LOCAL_SAVE_LOCATION']
-	file_location = '%s/install/%s' % (save_location, path)
-	local_file = '%s/%s' % (file_location, filename)
-	remote_file = '/install/%s/%s' % (path, filename)
+async def download(app, remote_file, file_location, filename, im_the_requester):
+	"""
+	Gets REMOTE_FILE from the peers the tracker knows about, or the
+	frontend.  At most MAX_FETCHES downloads run at once.
+	"""
+	session = app['session']
+	local_file = os.path.join(file_location, filename)
 	hashcode = hashit(remote_file)
-	im_the_requester = request.remote_addr == "127.0.0.1"
-	environment = client_settings['ENVIRONMENT']
-	port = client_settings['PORT'] 
+	port = client_settings['PORT']
 
-	if not client_settings['SAVE_FILES']:
-		return redirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file))
-
-	# check if file is local
-	if client_settings['SAVE_FILES'] and im_the_requester and not file_exists(local_file):
-		
-		params = {'port': port, 'hashcode': hashcode}
-		res = lookup_file(hashcode)
-		payload = res.json()
-		successful = res.status_code == 200 and payload['success']
-
-		if successful and payload['peers']:
-			peers = set(payload['peers'])
-			for peer in peers.difference(timed_out_hosts):
-				peer_ip = peer.split(":")[0]
-				app.logger.info("requesting file: %s from peer: %s", filename, peer)
+	size = None
+	checksum = None
+
+	async with app['fetches']:
+		if file_exists(local_file):
+			return
+
+		# check if file is local
+		if im_the_requester:
+			params = {'port': port, 'hashcode': hashcode}
+			payload = await lookup_file(session, hashcode, remote_file)
+			size = payload.get('size')
+			checksum = payload.get('checksum')
+
+			peers = []
+			if payload['success'] and payload['peers']:
+				peers = [ peer for peer in set(payload['peers'])
+					  if peer not in timed_out_hosts ]
+
+			# Large files come from several peers at once, a
+			# byte range each.  Without a checksum we could not
+			# tell if the pieces belong together.
+
+			if len(peers) > 1 and size and checksum and size >= RANGE_SIZE:
+				log.info("requesting file: %s from peers: %s", filename, ', '.join(peers))
+				try:
+					(size, checksum, failed) = await fetch_ranges(session, peers,
+						remote_file, file_location, filename, size, checksum)
+					log.info("  %s from %s was successful", filename, ', '.join(peers))
+					await register_file(session, port, hashcode)
+					peers = []
+				except Exception as e:
+					log.info("  %s from %s was unsuccessful", filename, ', '.join(peers))
+					log.info("    %s", e)
+					failed = []
+				for peer in failed:
+					unregister_params = params.copy()
+					unregister_params["peer"] = peer.split(":")[0]
+					await unregister_file(session, hashcode, unregister_params)
+
+			for peer in peers:
+				if file_exists(local_file):
+					break
+				log.info("requesting file: %s from peer: %s", filename, peer)
 				try:
-					peer_res = get_file(peer, remote_file)
-					if peer_res.status_code == 200:
-						app.logger.info("  %s from %s was successful", filename, peer)
-						save_file(peer_res.content, '%s/' % (file_location), filename)
-						register_file(port, hashcode)
-						break
-					else:
-						app.logger.info("  %s from %s was unsuccessful", filename, peer)
-						#unregister_host(peer_ip)
-						unregister_params = params.copy()
-						unregister_params["peer"] = peer.split(":")[0]
-						unregister_file(hashcode, unregister_params)
-				#except Timeout:
-				#	timed_out_hosts.append(peer)
+					(size, checksum) = await fetch_file(session, peer, remote_file,
+						file_location, filename, size, checksum)
+					log.info("  %s from %s was successful", filename, peer)
+					await register_file(session, port, hashcode)
+					break
 				except Exception as e:
-					app.logger.info("  %s from %s was unsuccessful", filename, peer)
-					app.logger.info("    %s", e)
-					#unregister_host(peer_ip)
+					log.info("  %s from %s was unsuccessful", filename, peer)
+					log.info("    %s", e)
 					unregister_params = params.copy()
 					unregister_params["peer"] = peer.split(":")[0]
-					unregister_file(hashcode, unregister_params)
+					await unregister_file(session, hashcode, unregister_params)
 
+		if not file_exists(local_file):
+			log.info("requesting %s from frontend", filename)
+			(size, checksum) = await fetch_file(session, tracker_settings['TRACKER'],
+				remote_file, file_location, filename, size, checksum)
+			await register_file(session, port, hashcode)
+
+
+async def get_file_locally(request):
+	path = request.match_info['path']
+	filename = request.match_info['filename']
+	file_location = local_path('install', path)
+	local_file = local_path('install', path, filename)
+	remote_file = '/install/%s/%s' % (path, filename)
+	im_the_requester = request.remote == "127.0.0.1"
+
+	if not client_settings['SAVE_FILES']:
+		raise web.HTTPFound('http://%s%s' % (tracker_settings['TRACKER'], remote_file))
+
+	if os.path.isdir(local_file):
+		raise web.HTTPMovedPermanently('%s/' % request.path)
+
+	# one download per file, everyone else asking for the file
+	# waits for it
 	if not file_exists(local_file):
-		app.logger.info("requesting %s from frontend", filename)
+		task = fetches.get(local_file)
+		if not task:
+			task = asyncio.ensure_future(download(request.app,
+				remote_file, file_location, filename,
+				im_the_requester))
+			fetches[local_file] = task
+			task.add_done_callback(lambda t: fetches.pop(local_file, None))
 		try:
-			tracker_res = requests.get('http://%s%s' % (tracker_settings['TRACKER'], remote_file), timeout=(0.1, 5))
-			if tracker_res.status_code == 200:
-				save_file(tracker_res.content, '%s/' % (file_location), filename)
-				if client_settings['SAVE_FILES']:
-					register_file(port, hashcode)
+			await asyncio.shield(task)
 		except Exception as e:
-			app.logger.info("error requesting from frontend")
-			app.logger.info("%s", (e))
+			log.info("error requesting %s", filename)
+			log.info("%s", (e))
 
 	if file_exists(local_file):
-		app.logger.info("%s is saved locally", (filename))
-		return send_from_directory(unquote(file_location), unquote(filename))
+		log.info("%s is saved locally", (filename))
+		return web.FileResponse(local_file, chunk_size=CHUNK_SIZE)
 	else:
-		app.logger.info("%s 404", (filename))
-		return redirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file), code=307)
+		log.info("%s 404", (filename))
+		raise web.HTTPTemporaryRedirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file))
 
 
 # catch all for returning static files
 # if the request is a directory, the the request will be redirected
-@app.route('/<path:path>/<filename>')
-def get_file_route(path, filename):
-	path = path.replace('//', '/')
-	save_location = client_settings['LOCAL_SAVE_LOCATION']
-	file_location = '%s/%s' % (save_location, path)
-	response_file = '%s/%s' % (file_location, filename)
+async def get_file_route(request):
+	response_file = local_path(request.match_info['path'],
+		request.match_info['filename'])
 	if os.path.isdir(response_file):
-		return redirect('%s/' % response_file, 301)
+		raise web.HTTPMovedPermanently('%s/' % request.path)
+	elif file_exists(response_file):
+		return web.FileResponse(response_file, chunk_size=CHUNK_SIZE)
 	else:
-		return send_from_directory(unquote(file_location), unquote(filename))
+		return four_o_four()
 
 
 # return a directory listing
-@app.route('/<path:path>/<filename>/')
-def get_repodata(path, filename):
-	path = path.replace('//', '/')
-	save_location = client_settings['LOCAL_SAVE_LOCATION']
-	file_location = '%s/%s' % (save_location, path)
-	response_file = '%s/%s' % (file_location, filename)
+async def get_repodata(request):
+	import jinja2
+
+	response_file = local_path(request.match_info['path'],
+		request.match_info['filename'])
+	if not os.path.isdir(response_file):
+		return four_o_four()
 	items = [ f for f in os.listdir(response_file) if f[0] != '.' ]
-	return render_template('directory.html', items=items)
 
+	templates = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+	env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates),
+		autoescape=True)
+	return web.Response(text=env.get_template('directory.html').render(items=items),
+		content_type='text/html')
 
-@app.route('/running')
-def running():
-	return jsonify({"success": True})
 
+async def running(request):
+	return web.json_response({"success": True})
 
-@app.route('/peerdone')
-def peerdone():
-	peerdone_res = requests.delete('http://%s/avalanche/peerdone' % tracker())
-	return jsonify({"success": True})
 
+async def peerdone(request):
+	async with request.app['session'].delete('http://%s/avalanche/peerdone' % tracker()) as res:
+		pass
+	return web.json_response({"success": True})
 
-@app.errorhandler(404)
-def page_not_found(e):
-	return "", 404
+
+async def startup(app):
+	timeout = aiohttp.ClientTimeout(total=None,
+		sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+	app['session'] = aiohttp.ClientSession(timeout=timeout)
+	app['fetches'] = asyncio.Semaphore(MAX_FETCHES)
+
+
+async def cleanup(app):
+	await app['session'].close()
+
+
+def application():
+	app = web.Application()
+	app.on_startup.append(startup)
+	app.on_cleanup.append(cleanup)
+
+	app.router.add_get('/running', running)
+	app.router.add_get('/peerdone', peerdone)
+	app.router.add_get('/install/{path:.*}/{filename}', get_file_locally)
+	app.router.add_get('/{path:.*}/{filename}/', get_repodata)
+	app.router.add_get('/{path:.*}/{filename}', get_file_route)
+
+	return app
 
 
 @click.command()
@@ -231,10 +426,8 @@ def page_not_found(e):
 def main(environment, trackerfile, nosavefile, port):
 	logHandler = FileHandler('/var/log/ludicrous-client-debug.log')
 	logHandler.setLevel(logging.DEBUG)
-	app.logger.setLevel(logging.DEBUG)
-	log = logging.getLogger('werkzeug')
 	log.setLevel(logging.DEBUG)
-	app.logger.addHandler(logHandler)
+	log.addHandler(logHandler)
 	client_settings['ENVIRONMENT']	= environment
 	client_settings['SAVE_FILES']	= False if nosavefile else True
 	client_settings['PORT']	= port
@@ -244,8 +437,6 @@ def main(environment, trackerfile, nosavefile, port):
 		tracker_settings['TRACKER'] = t.split(':')[0].strip()
 		tracker_settings['PORT'] = t.split(':')[-1].strip()
 
-	#peerdone()
-
 	if environment == 'initrd':
 		pid = os.fork()
 		if pid == 0:
@@ -257,13 +448,13 @@ def main(environment, trackerfile, nosavefile, port):
 				os._exit(0)
 
 			try:
-				app.run(host='0.0.0.0', port=client_settings['PORT'])
+				web.run_app(application(), host='0.0.0.0', port=client_settings['PORT'])
 			except:
 				pass
 		else:
 			os._exit(0)
 	else:
-		app.run(host='0.0.0.0', port=client_settings['PORT'])
+		web.run_app(application(), host='0.0.0.0', port=client_settings['PORT'])
 
 
 if __name__ == "__main__":
@@ -1,123 +1,140 @@
 #!/opt/stack/bin/python3
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect
-from urllib.request import unquote
-from random import shuffle
-import os
+from aiohttp import web
+import asyncio
+import time
+import threading
 import logging
 from logging import FileHandler
-import redis
+from ludicrous_tracker import Tracker, Files
 
-ludicredis = redis.StrictRedis()
+log = logging.getLogger('ludicrous-server')
 
-app = Flask(__name__)
 
-PEERS = set()
+class Racks:
+	"""
+	Maps the address of a host to its rack attribute.  The map is
+	reloaded every REFRESH seconds, or sooner (at most once a
+	minute) when an unknown address shows up.
+	"""
 
-MAX_PEERS = 3
-ROOT_DIR = "/var/www/html"
+	REFRESH = 300
 
+	def __init__(self):
+		self.racks  = {}
+		self.loaded = 0
+		self.lock   = threading.Lock()
 
-@app.errorhandler(404)
-def four_o_four(error=None):
-	error_message = error if type(error) is str else "File not found."
-	message = {
-		'status': 404,
-		'message': error_message
-	}
+	def load(self):
+		import stack.api
 
-	resp = jsonify(message)
-	resp.status_code = 404
+		self.loaded = time.time()
+		try:
+			hosts = dict((row['host'], row['value']) for row in
+				stack.api.Call('list host attr', [ 'attr=rack' ]))
+			racks = {}
+			for row in stack.api.Call('list host interface'):
+				if row['ip'] and row['host'] in hosts:
+					racks[row['ip']] = hosts[row['host']]
+			self.racks = racks
+		except Exception as e:
+			log.info("cannot load racks: %s", e)
+
+	def __call__(self, addr):
+		age = time.time() - self.loaded
+		if age > self.REFRESH or (addr not in self.racks and age > 60):
+
+			# the other requests go on with the old map
+			if self.lock.acquire(blocking=False):
+				try:
+					self.load()
+				finally:
+					self.lock.release()
+		return self.racks.get(addr)
+
+
+# The tracker talks to Redis, the requests wait for it in a thread
+# and the server goes on with the next request.
+
+def call(method, *args):
+	loop = asyncio.get_event_loop()
+	return loop.run_in_executor(None, method, *args)
+
+
+async def lookup(request):
+	tracker = request.app['tracker']
+
+	# return the best peers with the request hash
+	res = await call(tracker.lookup, request.remote,
+		request.match_info['hashcode'], request.query.get('path'))
+	res['success'] = True
 
-	return resp
+	return web.json_response(res)
 
 
-@app.route('/avalanche/lookup/<hashcode>', methods=['GET'])
-def lookup(hashcode):
-	res = {}
-	res['success'] = True
-	ipaddr = request.remote_addr
-
-	# return list of peers with the request hash
-	res['peers'] = []
-	peers = list(ludicredis.smembers(hashcode))
-	shuffle(peers)
-	for peer in peers:
-		# only append a peer if it is not the requester
-		if ipaddr not in peer.decode():
-                        peer_port = ludicredis.smembers('%s:PORT' % ipaddr)
-                        if peer_port:
-                                res['peers'].append("%s:%s" % (peer.decode(), peer_port.pop().decode()))
-                        else:
-                                res['peers'].append("%s:%s" % (peer.decode(), '80'))		
-
-		# if array of peers is max_peers, break
-		if len(res['peers']) == MAX_PEERS:
-			break
-
-	return jsonify(res)
-
-
-@app.route('/avalanche/register/<port>/<hashcode>', methods=['POST'])
-def register(port=80, hashcode=None):
+async def register(request):
+	tracker = request.app['tracker']
 	res = {}
 	res['success'] = True
-	ipaddr = request.remote_addr
-
-	if not hashcode:
-		return four_o_four()
-
-	# check if 
-	if ipaddr not in PEERS:
-		if not ludicredis.smembers("%s:PORT" % ipaddr):
-			ludicredis.sadd("%s:PORT" % ipaddr, "%s" % port)
-			PEERS.add(ipaddr)
 
 	# Register Package
-	ludicredis.sadd(hashcode, "%s" % ipaddr)
+	await call(tracker.register, request.remote,
+		request.match_info['port'], request.match_info['hashcode'])
 
-	return jsonify(res)
+	return web.json_response(res)
 
 
-@app.route('/avalanche/unregister/hashcode/<hashcode>', methods=['DELETE'])
-def unregister(hashcode):
-	ipaddr = unquote(request.args['peer'])
+async def unregister(request):
+	tracker = request.app['tracker']
+	hashcode = request.match_info['hashcode']
+	ipaddr = request.query['peer']
 	res = {}
 	res['success'] = True
 
-	result = ludicredis.srem(hashcode, ipaddr)
-	if result:
+	if await call(tracker.unregister, request.remote, hashcode, ipaddr):
 		res['message'] = "'%s' was unregistered for hash: %s" % (ipaddr, hashcode)
 	else:
 		res['message'] = "'%s' was not registered for hash: %s" % (ipaddr, hashcode)
 
-	return jsonify(res)
+	return web.json_response(res)
 
-@app.route('/avalanche/peerdone', methods=['DELETE'])
-def peerdone():
-	ipaddr = request.remote_addr
+
+async def peerdone(request):
+	tracker = request.app['tracker']
 	res = {}
 	res['success'] = True
 
-	for package in ludicredis.scan_iter():
-		try:
-			ludicredis.srem(package, ipaddr)
-		except:
-			pass	
-		
-	return jsonify(res)
+	await call(tracker.peerdone, request.remote)
 
+	return web.json_response(res)
+
+
+async def stop_server(request):
+	return web.Response(text="-1")
+
+
+def application(tracker):
+	app = web.Application()
+	app['tracker'] = tracker
+
+	app.router.add_get('/avalanche/lookup/{hashcode}', lookup)
+	app.router.add_post('/avalanche/register/{port}/{hashcode}', register)
+	app.router.add_delete('/avalanche/unregister/hashcode/{hashcode}', unregister)
+	app.router.add_delete('/avalanche/peerdone', peerdone)
+	app.router.add_get('/avalanche/stop', stop_server)
+
+	return app
 
-@app.route('/avalanche/stop', methods=['GET'])
-def stop_server():
-	return "-1"
 
 def main():
+	import redis
+
 	logHandler = FileHandler('/var/log/ludicrous-server.log')
 	logHandler.setLevel(logging.INFO)
-	app.logger.setLevel(logging.INFO)
-	app.logger.addHandler(logHandler)
-	app.run(host='0.0.0.0', port=3825)
+	log.setLevel(logging.INFO)
+	log.addHandler(logHandler)
+	web.run_app(application(Tracker(redis.StrictRedis(), Racks(), Files())),
+		host='0.0.0.0', port=3825)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Tracker data model of ludicrous-server.  Everything is kept in Redis
+# (or the in-memory Memory stand-in):
+#
+#	<hashcode>			set of peers holding the file
+#	<hashcode>:RACK:<rack>		the same, only the peers in a rack
+#	<peer>:FILES			set of files a peer holds
+#	<peer>:UPLOADS			transfers handed to a peer, maps
+#					'<requester>:<hashcode>' to the time
+#					the transfer is considered dead
+#	<peer>:SOURCES			peers handed to a requester, maps
+#					<hashcode> to a list of peers
+#	PORTS				peer -> port
+#	RACKS				peer -> rack
+#
+# The reverse index (<peer>:FILES) makes removing a peer cost the
+# number of files it holds rather than the number of keys, and every
+# request is a fixed number of pipelined round trips.
+#
+# The size and checksum a peer verifies its download against come from
+# the file on the frontend (Files), never from another peer.
+
+import os
+import stat
+import time
+import random
+import hashlib
+import threading
+
+MAX_PEERS   = 3
+
+# Peers considered for a lookup, drawn at random from the peers in the
+# requester's rack and from all peers holding the file.
+
+SAMPLE	    = 16
+
+# A peer with MAX_UPLOADS transfers in flight is only picked when
+# there is no one else.  A transfer that has not finished (the
+# requester registers the file) after UPLOAD_TIMEOUT seconds is no
+# longer counted.
+
+MAX_UPLOADS    = 4
+UPLOAD_TIMEOUT = 120
+
+
+def decode(value):
+	if isinstance(value, bytes):
+		return value.decode()
+	return value
+
+
+class Files:
+	"""
+	Size and sha256 checksum of the files under /install the
+	frontend serves from ROOT.  The checksum is kept until the file
+	changes.
+	"""
+
+	def __init__(self, root='/var/www/html'):
+		self.root  = root
+		self.files = {}
+		self.locks = {}
+		self.lock  = threading.Lock()
+
+	def stat(self, local):
+		try:
+			st = os.stat(local)
+		except OSError:
+			return None
+		if not stat.S_ISREG(st.st_mode):
+			return None
+		return (st.st_mtime_ns, st.st_size)
+
+	def __call__(self, path):
+		"""
+		Returns (size, checksum) of the file at the URL PATH, or
+		None if there is no such file.
+		"""
+
+		path = os.path.normpath(path)
+		if not path.startswith('/install/'):
+			return None
+		local = self.root + path
+
+		# one checksum at a time for each file, everyone else
+		# asking waits for it
+
+		with self.lock:
+			lock = self.locks.setdefault(path, threading.Lock())
+		with lock:
+			key = self.stat(local)
+			if not key:
+				self.files.pop(path, None)
+				return None
+			cached = self.files.get(path)
+			if cached and cached[0] == key:
+				return cached[1]
+
+			sha = hashlib.sha256()
+			try:
+				with open(local, 'rb') as fin:
+					for chunk in iter(lambda: fin.read(1024 * 1024), b''):
+						sha.update(chunk)
+			except OSError:
+				return None
+
+			# changed while we read it
+			if self.stat(local) != key:
+				return None
+
+			info = (key[1], sha.hexdigest())
+			self.files[path] = (key, info)
+			return info
+
+
+class Tracker:
+	"""
+	Keeps track of who holds which file.  DB is a Redis client,
+	RACKS a function returning the rack of an address (or None),
+	FILES a function returning the size and checksum of the file at
+	a URL path on the frontend (or None).
+	"""
+
+	def __init__(self, db, racks=lambda addr: None, files=lambda path: None):
+		self.db	   = db
+		self.racks = racks
+		self.files = files
+
+	def register(self, addr, port, hashcode):
+		rack = self.racks(addr)
+
+		sources = self.db.hget('%s:SOURCES' % addr, hashcode)
+
+		pipe = self.db.pipeline()
+		pipe.hset('PORTS', addr, port)
+		pipe.sadd(hashcode, addr)
+		pipe.sadd('%s:FILES' % addr, hashcode)
+		if rack is not None:
+			pipe.hset('RACKS', addr, rack)
+			pipe.sadd('%s:RACK:%s' % (hashcode, rack), addr)
+
+		# the transfers to this peer are done
+		if sources:
+			pipe.hdel('%s:SOURCES' % addr, hashcode)
+			for peer in decode(sources).split(','):
+				pipe.hdel('%s:UPLOADS' % peer, '%s:%s' % (addr, hashcode))
+		pipe.execute()
+
+	def lookup(self, addr, hashcode, path=None):
+		"""
+		Returns up to MAX_PEERS 'address:port' of peers holding
+		HASHCODE for ADDR, and the size and checksum of the file
+		on the frontend if the PATH of HASHCODE is given.  Idle
+		peers in the same rack as ADDR come first.
+		"""
+
+		now  = time.time()
+		rack = self.racks(addr)
+
+		res = { 'peers': [] }
+		if path and hashlib.md5(path.encode()).hexdigest() == hashcode:
+			info = self.files(path)
+			if info:
+				(res['size'], res['checksum']) = info
+
+		pipe = self.db.pipeline()
+		pipe.srandmember(hashcode, SAMPLE)
+		if rack is not None:
+			pipe.srandmember('%s:RACK:%s' % (hashcode, rack), SAMPLE)
+		result = pipe.execute()
+
+		candidates = set()
+		for members in result:
+			candidates.update([ decode(m) for m in members ])
+		candidates.discard(addr)
+		candidates = list(candidates)
+
+		if not candidates:
+			return res
+
+		pipe = self.db.pipeline()
+		pipe.hmget('PORTS', candidates)
+		pipe.hmget('RACKS', candidates)
+		for peer in candidates:
+			pipe.hgetall('%s:UPLOADS' % peer)
+		result  = pipe.execute()
+		ports	= result[0]
+		racks	= result[1]
+		uploads = result[2:]
+
+		ranked = []
+		for i in range(0, len(candidates)):
+			count = len([ t for t in uploads[i].values()
+				      if float(t) > now ])
+			ranked.append((count >= MAX_UPLOADS,
+				       decode(racks[i]) != rack or rack is None,
+				       count, random.random(),
+				       candidates[i], decode(ports[i]) or '80'))
+		ranked.sort()
+
+		chosen = ranked[:MAX_PEERS]
+		pipe   = self.db.pipeline()
+		for (busy, remote, count, r, peer, port) in chosen:
+			key = '%s:UPLOADS' % peer
+			pipe.hset(key, '%s:%s' % (addr, hashcode), now + UPLOAD_TIMEOUT)
+			pipe.expire(key, UPLOAD_TIMEOUT)
+
+			# forget the transfers that timed out
+			for (member, t) in uploads[candidates.index(peer)].items():
+				if float(t) <= now:
+					pipe.hdel(key, member)
+
+			res['peers'].append('%s:%s' % (peer, port))
+
+		sources = '%s:SOURCES' % addr
+		pipe.hset(sources, hashcode,
+			  ','.join([ peer for (b, r, c, x, peer, p) in chosen ]))
+		pipe.expire(sources, UPLOAD_TIMEOUT)
+		pipe.execute()
+
+		return res
+
+	def unregister(self, addr, hashcode, peer):
+		"""
+		ADDR could not get HASHCODE from PEER.
+		"""
+
+		rack = self.db.hget('RACKS', peer)
+
+		pipe = self.db.pipeline()
+		pipe.srem(hashcode, peer)
+		pipe.srem('%s:FILES' % peer, hashcode)
+		if rack is not None:
+			pipe.srem('%s:RACK:%s' % (hashcode, decode(rack)), peer)
+		pipe.hdel('%s:UPLOADS' % peer, '%s:%s' % (addr, hashcode))
+		result = pipe.execute()
+
+		return result[0] > 0
+
+	def peerdone(self, addr):
+		"""
+		Removes ADDR and every file it holds.
+		"""
+
+		pipe = self.db.pipeline()
+		pipe.smembers('%s:FILES' % addr)
+		pipe.hget('RACKS', addr)
+		(files, rack) = pipe.execute()
+
+		pipe = self.db.pipeline()
+		for hashcode in files:
+			hashcode = decode(hashcode)
+			pipe.srem(hashcode, addr)
+			if rack is not None:
+				pipe.srem('%s:RACK:%s' % (hashcode, decode(rack)), addr)
+		pipe.delete('%s:FILES' % addr, '%s:UPLOADS' % addr,
+			    '%s:SOURCES' % addr)
+		pipe.hdel('PORTS', addr)
+		pipe.hdel('RACKS', addr)
+		pipe.execute()
+
+
+class Memory:
+	"""
+	In-memory stand-in for the few Redis commands the Tracker uses,
+	for testing and simulations.  Values come back as bytes, same
+	as Redis.  Keys do not expire.
+	"""
+
+	def __init__(self):
+		self.data = {}
+
+	@staticmethod
+	def encode(value):
+		if isinstance(value, bytes):
+			return value
+		return ('%s' % value).encode()
+
+	def sadd(self, name, *values):
+		s = self.data.setdefault(name, set())
+		n = len(s)
+		s.update([ self.encode(v) for v in values ])
+		return len(s) - n
+
+	def srem(self, name, *values):
+		s = self.data.get(name, set())
+		n = len(s)
+		s.difference_update([ self.encode(v) for v in values ])
+		if not s:
+			self.data.pop(name, None)
+		return n - len(s)
+
+	def smembers(self, name):
+		return set(self.data.get(name, ()))
+
+	def srandmember(self, name, number):
+		s = self.data.get(name, ())
+		if len(s) <= number:
+			return list(s)
+		return random.sample(list(s), number)
+
+	def hset(self, name, key, value):
+		h = self.data.setdefault(name, {})
+		n = self.encode(key) not in h
+		h[self.encode(key)] = self.encode(value)
+		return int(n)
+
+	def hget(self, name, key):
+		return self.data.get(name, {}).get(self.encode(key))
+
+	def hmget(self, name, keys):
+		h = self.data.get(name, {})
+		return [ h.get(self.encode(k)) for k in keys ]
+
+	def hgetall(self, name):
+		return dict(self.data.get(name, {}))
+
+	def hdel(self, name, *keys):
+		h = self.data.get(name, {})
+		n = len(h)
+		for k in keys:
+			h.pop(self.encode(k), None)
+		if not h:
+			self.data.pop(name, None)
+		return n - len(h)
+
+	def delete(self, *names):
+		return len([ self.data.pop(n) for n in names if n in self.data ])
+
+	def expire(self, name, seconds):
+		return int(name in self.data)
+
+	def pipeline(self):
+		return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+
+	def __init__(self, db):
+		self.db	      = db
+		self.commands = []
+
+	def __getattr__(self, name):
+		def queue(*args):
+			self.commands.append((name, args))
+			return self
+		return queue
+
+	def execute(self):
+		result = [ getattr(self.db, name)(*args)
+			   for (name, args) in self.commands ]
+		self.commands = []
+		return result
@@ -0,0 +1,23 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# ludicrous-client and ludicrous-server are installed as scripts, load
+# them from the source tree as the ludicrous_client and ludicrous_server
+# modules.
+
+import os
+import sys
+import importlib.util
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for name in [ 'ludicrous-client', 'ludicrous-server' ]:
+	module = name.replace('-', '_')
+	if module not in sys.modules:
+		spec = importlib.util.spec_from_file_location(module,
+			os.path.join(Root, '%s.py' % name))
+		sys.modules[module] = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(sys.modules[module])
@@ -0,0 +1,212 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+import ludicrous_client as client
+import ludicrous_server as server
+from ludicrous_tracker import Tracker, Memory, Files
+
+
+class Frontend:
+	"""
+	The frontend: the tracker of ludicrous-server, and the files
+	under ROOT/install served slowly enough for the requests of a
+	test to overlap.  Counts the file requests and how many were in
+	flight at once.
+	"""
+
+	def __init__(self, root):
+		self.root    = root
+		self.db	     = Memory()
+		self.fetches = []
+		self.active  = 0
+		self.most    = 0
+
+	async def install(self, request):
+		self.fetches.append(request.path)
+		self.active += 1
+		self.most    = max(self.most, self.active)
+		try:
+			await asyncio.sleep(0.2)
+		finally:
+			self.active -= 1
+		return web.FileResponse(self.root + request.path)
+
+	def application(self):
+		app = server.application(Tracker(self.db,
+			files=Files(self.root)))
+		app.router.add_get('/install/{path:.*}', self.install)
+		return app
+
+
+def run(test, tmp_path, monkeypatch):
+	"""
+	Runs the coroutine TEST(frontend, node) against a stub frontend
+	and a ludicrous-client saving its files under tmp_path/node.
+	"""
+
+	frontend = Frontend(str(tmp_path / 'frontend'))
+
+	async def main():
+		upstream = TestServer(frontend.application())
+		await upstream.start_server()
+		address = '127.0.0.1:%d' % upstream.port
+		monkeypatch.setitem(client.tracker_settings, 'TRACKER', address)
+		monkeypatch.setattr(client, 'tracker', lambda: address)
+		monkeypatch.setitem(client.client_settings,
+			'LOCAL_SAVE_LOCATION', str(tmp_path / 'node'))
+
+		node = TestClient(TestServer(client.application()))
+		await node.start_server()
+		try:
+			await test(frontend, node)
+		finally:
+			await node.close()
+			await upstream.close()
+
+	loop = asyncio.new_event_loop()
+	try:
+		loop.run_until_complete(main())
+	finally:
+		loop.close()
+	return frontend
+
+
+@pytest.fixture
+def files(tmp_path):
+	"""
+	The files on the frontend, /install/dir/file.<n>.
+	"""
+
+	files = [ os.urandom(100 * 1024) for i in range(0, 8) ]
+	for (i, data) in enumerate(files):
+		write(tmp_path / 'frontend', 'install/dir/file.%d' % i, data)
+	return files
+
+
+def write(root, path, data):
+	filename = root / path
+	filename.parent.mkdir(parents=True, exist_ok=True)
+	filename.write_bytes(data)
+
+
+async def get(node, path, headers=None):
+	res = await node.get(path, headers=headers, allow_redirects=False)
+	return (res.status, await res.read())
+
+
+def test_coalesce(tmp_path, monkeypatch, files):
+	"""
+	Concurrent requests for a missing file share one fetch.
+	"""
+
+	data = files[0]
+
+	async def test(frontend, node):
+		results = await asyncio.gather(*[
+			get(node, '/install/dir/file.0') for i in range(0, 20) ])
+		assert results == [ (200, data) ] * 20
+		assert frontend.fetches == [ '/install/dir/file.0' ]
+		assert not client.fetches
+
+		# the file is registered with the tracker, peers get it
+		# from the node now
+
+		assert frontend.db.smembers(client.hashit('/install/dir/file.0')) == \
+			{ b'127.0.0.1' }
+
+		# served from the saved copy, byte ranges too
+
+		assert await get(node, '/install/dir/file.0') == (200, data)
+		assert await get(node, '/install/dir/file.0',
+				 { 'Range': 'bytes=10-19' }) == (206, data[10:20])
+		assert frontend.fetches == [ '/install/dir/file.0' ]
+
+	run(test, tmp_path, monkeypatch)
+	assert (tmp_path / 'node' / 'install' / 'dir' / 'file.0').read_bytes() == data
+	assert [ f for f in os.listdir(str(tmp_path / 'node' / 'install' / 'dir'))
+		 if f.startswith('.') ] == []
+
+
+def test_fetches(tmp_path, monkeypatch, files):
+	"""
+	At most MAX_FETCHES files are fetched at once.
+	"""
+
+	monkeypatch.setattr(client, 'MAX_FETCHES', 2)
+
+	async def test(frontend, node):
+		results = await asyncio.gather(*[
+			get(node, '/install/dir/file.%d' % i) for i in range(0, 8) ])
+		assert [ status for (status, data) in results ] == [ 200 ] * 8
+		assert len(frontend.fetches) == 8
+
+	frontend = run(test, tmp_path, monkeypatch)
+	assert frontend.most == 2
+
+
+def test_ranges(tmp_path, monkeypatch, files):
+	"""
+	A range from a dead peer is fetched from the frontend instead.
+	"""
+
+	data = files[1]
+
+	async def test(frontend, node):
+		peers = [ client.tracker_settings['TRACKER'], '127.0.0.1:1' ]
+		(size, checksum, failed) = await client.fetch_ranges(
+			node.app['session'], peers, '/install/dir/file.1',
+			str(tmp_path / 'node'), 'file.1', len(data),
+			Files(frontend.root)('/install/dir/file.1')[1])
+		assert size == len(data)
+		assert failed == [ '127.0.0.1:1' ]
+
+		# one range for the live peer, one for the dead one's
+
+		assert len(frontend.fetches) == 2
+
+		# a checksum mismatch leaves nothing behind
+
+		with pytest.raises(client.DownloadError):
+			await client.fetch_ranges(node.app['session'], peers[:1],
+				'/install/dir/file.2', str(tmp_path / 'node'),
+				'file.2', len(data), 'bad')
+
+	run(test, tmp_path, monkeypatch)
+	assert (tmp_path / 'node' / 'file.1').read_bytes() == data
+	assert sorted(os.listdir(str(tmp_path / 'node'))) == [ 'file.1' ]
+
+
+def test_paths(tmp_path, monkeypatch):
+	"""
+	Nothing outside of the save location is served.
+	"""
+
+	write(tmp_path, 'secret', b'secret')
+	write(tmp_path / 'node', 'install/dir/file', b'file')
+
+	async def test(frontend, node):
+		assert await get(node, '/install/dir/file') == (200, b'file')
+		assert (await get(node, '/install/dir'))[0] == 301
+		for path in [ '/install/%2e%2e/%2e%2e/secret/x',
+			      '/%2e%2e/secret', '/install/%2e%2e/%2e%2e/secret' ]:
+			(status, data) = await get(node, path)
+			assert status == 404
+			assert data != b'secret'
+		assert frontend.fetches == []
+
+	run(test, tmp_path, monkeypatch)
+
+	monkeypatch.setitem(client.client_settings, 'LOCAL_SAVE_LOCATION',
+			    str(tmp_path / 'node'))
+	assert client.local_path('install', 'dir', 'file') == \
+		str(tmp_path / 'node' / 'install' / 'dir' / 'file')
+	with pytest.raises(web.HTTPNotFound):
+		client.local_path('install', '../..', 'secret')
@@ -0,0 +1,157 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import time
+import random
+import hashlib
+import ludicrous_tracker
+from ludicrous_tracker import Tracker, Memory, Files
+
+PEERS = 2000
+FILES = 5000
+RACKS = 50
+
+# files each peer holds at the start of the simulation
+
+HELD  = 50
+
+
+def addr(peer):
+	return '10.1.%d.%d' % (peer // 250, peer % 250)
+
+
+def rack(address):
+	(a, b, c, d) = address.split('.')
+	return '%d' % ((int(c) * 250 + int(d)) % RACKS)
+
+
+def hashit(path):
+	return hashlib.md5(path.encode()).hexdigest()
+
+
+def test_tracker():
+	db	= Memory()
+	tracker = Tracker(db, rack, lambda path: (100, 'sum'))
+	path	= '/install/file'
+	code	= hashit(path)
+
+	for peer in range(0, 10):
+		tracker.register(addr(peer), 80, code)
+
+	# same rack as peer 1 and 2 is busy
+
+	requester = addr(RACKS + 1)
+	for i in range(0, ludicrous_tracker.MAX_UPLOADS):
+		tracker.lookup(addr(2), 'busy.%d' % i)
+	for i in range(0, ludicrous_tracker.MAX_UPLOADS):
+		db.hset('%s:UPLOADS' % addr(2), 'x:%d' % i, time.time() + 60)
+
+	res = tracker.lookup(requester, code, path)
+	assert res['size'] == 100 and res['checksum'] == 'sum'
+	assert res['peers'][0] == '%s:80' % addr(1)
+	assert '%s:80' % addr(2) not in res['peers']
+	assert len(res['peers']) == ludicrous_tracker.MAX_PEERS
+	assert db.hget('%s:UPLOADS' % addr(1), '%s:%s' % (requester, code))
+
+	# registering the file finishes the transfers
+
+	tracker.register(requester, 80, code)
+	assert not db.hget('%s:UPLOADS' % addr(1), '%s:%s' % (requester, code))
+
+	assert tracker.unregister(requester, code, addr(3))
+	assert not tracker.unregister(requester, code, addr(3))
+	assert addr(3).encode() not in db.smembers(code)
+
+	# the size and checksum only come from the frontend's file at
+	# the path of the hashcode
+
+	res = tracker.lookup(requester, code)
+	assert 'size' not in res and 'checksum' not in res
+	res = tracker.lookup(requester, code, '/install/other')
+	assert 'size' not in res and 'checksum' not in res
+
+	for peer in list(range(0, 10)) + [ RACKS + 1 ]:
+		tracker.peerdone(addr(peer))
+	assert not db.data
+
+
+def test_files(tmp_path):
+	os.makedirs(str(tmp_path / 'install' / 'repodata'))
+	path = str(tmp_path / 'install' / 'repodata' / 'repomd.xml')
+	with open(path, 'w') as fout:
+		fout.write('old')
+	with open(str(tmp_path / 'secret'), 'w') as fout:
+		fout.write('secret')
+
+	files = Files(str(tmp_path))
+	assert files('/install/repodata/repomd.xml') == \
+		(3, hashlib.sha256(b'old').hexdigest())
+	assert files('/install/repodata/bogus.xml') is None
+	assert files('/install/../secret') is None
+	assert files('/install/repodata') is None
+
+	# the file on the frontend changed (repo rebuild)
+
+	with open(path, 'w') as fout:
+		fout.write('new file')
+	os.utime(path, (0, 0))
+	assert files('/install/repodata/repomd.xml') == \
+		(8, hashlib.sha256(b'new file').hexdigest())
+
+
+def test_simulation():
+	"""
+	PEERS peers install FILES files.  Every peer starts out
+	with HELD random files, looks up the files it is missing, and
+	is done.
+	"""
+
+	random.seed(1)
+	db	= Memory()
+	tracker = Tracker(db, rack)
+	files	= [ 'file.%d' % i for i in range(0, FILES) ]
+
+	t = time.time()
+	held = {}
+	for peer in range(0, PEERS):
+		held[peer] = random.sample(files, HELD)
+		for f in held[peer]:
+			tracker.register(addr(peer), 80, f)
+	register = time.time() - t
+
+	lookups = 0
+	local	= 0
+	uploads = {}
+	t = time.time()
+	for peer in range(0, PEERS):
+		for f in random.sample(files, 10):
+			res = tracker.lookup(addr(peer), f)
+			lookups += 1
+			for p in res['peers']:
+				p = p.split(':')[0]
+				if rack(p) == rack(addr(peer)):
+					local += 1
+				uploads[p] = uploads.get(p, 0) + 1
+			if res['peers']:
+				tracker.register(addr(peer), 80, f)
+	lookup = time.time() - t
+
+	t = time.time()
+	for peer in range(0, PEERS):
+		tracker.peerdone(addr(peer))
+	peerdone = time.time() - t
+
+	print('\n%d peers, %d files' % (PEERS, FILES))
+	print('register %6d %.3fs' % (PEERS * HELD, register))
+	print('lookup   %6d %.3fs, %d%% of peers in the same rack, at most %d from one peer' %
+	      (lookups, lookup, 100 * local // sum(uploads.values()),
+	       max(uploads.values())))
+	print('peerdone %6d %.3fs' % (PEERS, peerdone))
+
+	# random choice would have 1 in RACKS in the same rack
+	assert local > 5 * sum(uploads.values()) // RACKS
+	assert not db.data
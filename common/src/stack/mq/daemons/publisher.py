@@ -11,68 +11,80 @@ import sys
 import daemon
 import lockfile.pidlockfile
 import signal
+import time
 import zmq
 import stack.mq
 
 
 class Publisher(stack.mq.Receiver):
 
+	# Seconds between status messages on the rmq channel
+
+	Status = 60
+
 	def __init__(self, context, outPort):
 		stack.mq.Receiver.__init__(self)
 
 		self.channels = {}
+		self.status   = 0
 		self.pub = context.socket(zmq.PUB)
 		self.pub.bind('tcp://*:%d' % outPort)
 
 
-	def callback(self, message):
+	def callbacks(self, messages):
 		"""
-		Process incomming messages from the UDP receiver.
+		Process a batch of incomming messages from the UDP
+		receiver.
 		"""
 
-		chan = message.getChannel()
-
 		# For each channel keep track of the last message
 		# ID and timestamp.
 		#
 		# Clients can ask the controller for this info
 		# so they know what to subscribe to.
 
-		if chan in self.channels:
-			num  = self.channels[chan]['id'] + 1
-		else:
-			self.channels[chan] = {}
-			num = 0
-		message.setID(num)
-		self.channels[chan]['id']   = message.getID()
-		self.channels[chan]['time'] = message.getTime()
-
-		# Publish the message:
+		batches = {}
+		new	= False
+		for message in messages:
+			chan = message.getChannel()
+
+			if chan in self.channels:
+				num  = self.channels[chan]['id'] + 1
+			else:
+				self.channels[chan] = {}
+				num = 0
+				new = True
+			message.setID(num)
+			self.channels[chan]['id']   = message.getID()
+			self.channels[chan]['time'] = message.getTime()
+
+			message.addHop()
+
+			if 'STACKDEBUG' in os.environ:
+				print ("%s" % message.dumps())
+			if chan not in batches:
+				batches[chan] = []
+			batches[chan].append(message.dumps(channel=False).encode())
+
+		# Publish the messages, one zeromq message per channel:
 		#
-		# <channel> stack.mq.Message
+		# <channel> stack.mq.Message ...
 		#   text	json
 
-		message.addHop()
+		for chan in batches:
+			self.pub.send_multipart([ chan.encode() ] + batches[chan])
 
-		if 'STACKDEBUG' in os.environ:
-			print ("%s" % message.dumps())
-		self.pub.send_multipart((message.getChannel().encode(),
-			message.dumps(channel=False).encode()))
-
-		# If this is the first message for the given channel 
-		# send the list of channels over the rmq channel to
-		# subscribers.
-		#
-		# Actually we send the status on every 12th message
-		# for each channel.  Heartbeat is every 5 seconds, so
-		# this means at least once a minute.
-		#
-		# TODO: Think about how to be smarter here
+		# When a new channel shows up, and at least once a
+		# minute, send the list of channels over the rmq
+		# channel to subscribers.  The receive queue counters
+		# come along.
 
-		if (num % 12) == 0:
+		if new or time.time() - self.status > self.Status:
+			self.status = time.time()
 			message = stack.mq.Message('rmq', 
 					{'type'    : 'status',
-					'channels': self.channels})
+					'channels': self.channels,
+					'queue'   : self.queue.counters})
 			self.pub.send_multipart((message.getChannel().encode(),
 						 message.dumps(channel=False).encode()))
 
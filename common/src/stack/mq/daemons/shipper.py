@@ -29,19 +29,27 @@ class Subscriber(stack.mq.Subscriber):
 		self.tx  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.dst = (addr, stack.mq.ports.publish)
 
-	def callback(self, message):
-		if message.getChannel() == 'rmq':
-			rmq = message.getMessage()
-			try:
-				r = json.loads(rmq)
-				if r['type'] == 'status':
-					self.channels = r['channels']
-			except:
-				pass
-		else:
-			message.addHop()
+	def callbacks(self, messages):
+		out = []
+		for message in messages:
+			if message.getChannel() == 'rmq':
+				rmq = message.getMessage()
+				try:
+					r = json.loads(rmq)
+					if r['type'] == 'status':
+						self.channels = r['channels']
+				except:
+					pass
+			else:
+				message.addHop()
+				out.append(message)
+
+		# Forward the batch packed into as few datagrams as
+		# possible.
+
+		for frame in stack.mq.Frames(out):
 			try:
-				self.tx.sendto(message.dumps().encode(), self.dst)
+				self.tx.sendto(frame, self.dst)
 			except: # ignore failed sends
 				pass
 
@@ -24,25 +24,47 @@ class ProcessorBase(stack.mq.Subscriber):
 			self.subscribe(self.channel())
 			stack.mq.Subscriber.run(self)
 
-	def callback(self, message):
-		o = []
+	def callbacks(self, messages):
+		out = []
+		for message in messages:
+			o = []
+			if 'STACKDEBUG' not in os.environ:
+				try:
+					o = self.process(message)
+				except:
+					pass
+			else:
+				o = self.process(message)
+
+			if isinstance(o, list):
+				out.extend([ msg for msg in o if msg ])
+			elif o:
+				out.append(o)
+
 		if 'STACKDEBUG' not in os.environ:
 			try:
-				o = self.process(message)
+				self.flush()
 			except:
 				pass
 		else:
-			o = self.process(message)
+			self.flush()
 
-		if isinstance(o, list):
-			msgs = o
-		else:
-			msgs = [ o ]
+		# The new messages go back to the message queue
+		# packed into as few datagrams as possible.
 
-		for msg in msgs:
-			if msg:
-				self.sock.sendto(msg.dumps(), self.addr)
-		
+		for frame in stack.mq.Frames(out):
+			self.sock.sendto(frame, self.addr)
+
+	def callback(self, message):
+		self.callbacks([ message ])
+
+	def flush(self):
+		"""
+		Called after every batch of messages has been
+		processed.  Derived classes that queue up work in
+		:func:`process` (e.g. a Redis pipeline) finish it here.
+		"""
+		pass
 
 	def process(self, message):
 		"""
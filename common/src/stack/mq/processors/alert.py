@@ -16,6 +16,7 @@ class Processor(stack.mq.processors.ProcessorBase):
 
 	def __init__(self, context, sock):
 		self.redis = redis.StrictRedis()
+		self.pipe  = self.redis.pipeline(transaction=False)
 		stack.mq.processors.ProcessorBase.__init__(self, context, sock)
 
 	def isActive(self):
@@ -35,8 +36,11 @@ class Processor(stack.mq.processors.ProcessorBase):
 		host = self.redis.get('addr:%s:name' % message.getSource())
 		if host:
 			message.setSource(host)
-			self.redis.rpush('alert:%s' % host, message.dumps(channel=False))
+			self.pipe.rpush('alert:%s' % host, message.dumps(channel=False))
 
 		return None
 
+	def flush(self):
+		self.pipe.execute()
+
 
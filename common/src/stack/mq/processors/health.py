@@ -5,25 +5,177 @@
 # @copyright@
 
 import json
+import time
+import threading
 import redis
 import stack.api
 import stack.mq.processors
 
+# Seconds between reloads of the host map, and how soon an unknown
+# address may force an early reload.
+
+Refresh = 5 * 60
+Retry	= 60
+
+# Timeout of the host keys in Redis.
+
+Timeout = 60 * 60
+
+
+class HostCache:
+	"""
+	Maps the addresses of the cluster hosts to their name, rack,
+	and rank.  The whole map is loaded from the database at once
+	and reloaded every *Refresh* seconds, messages never cause a
+	database query of their own.  Reloads run on a thread of their
+	own, lookups go on with the old map in the meantime.
+	"""
+
+	def __init__(self):
+		self.hosts  = {}
+		self.loaded = 0
+		self.lock   = threading.Lock()
+		self.thread = None
+
+	def lookup(self, db, addr):
+		"""
+		Returns the dictionary with *name*, *addr*, *rack*, and
+		*rank* for *addr*.  The name, rack, and rank are None for
+		unknown addresses.
+
+		:param db: redis connection, for the keys of reloaded hosts
+		:param addr: IP address
+		:type addr: string
+		"""
+
+		# only the first lookup waits for the map
+
+		if not self.loaded:
+			with self.lock:
+				if not self.loaded:
+					try:
+						self.load(db)
+					finally:
+						self.loaded = time.time()
+		else:
+			age = time.time() - self.loaded
+			if age > Refresh or (addr not in self.hosts and age > Retry):
+				self.reload(db)
+
+		d = self.hosts.get(addr)
+		if not d:
+			return { 'name': None, 'addr': addr,
+				 'rack': None, 'rank': None }
+		return d
+
+	def reload(self, db):
+		"""
+		Starts reloading the map on a thread of its own, unless
+		a reload is running already.
+		"""
+		if not self.lock.acquire(blocking=False):
+			return
+		self.loaded = time.time()
+
+		def run():
+			try:
+				self.load(db)
+			finally:
+				self.lock.release()
+
+		self.thread = threading.Thread(target=run, daemon=True)
+		self.thread.start()
+
+	def load(self, db):
+		"""
+		Reloads the map.  The keys of new and changed hosts are
+		set in Redis, and the timeout of all host keys reset, in
+		a single pipeline.  Keys that are gone (Redis was
+		flushed or restarted) are set again with a second one.
+		"""
+
+		hosts = {}
+		try:
+			info	 = {}
+			frontend = None
+			for row in stack.api.Call('list host'):
+				info[row['host']] = (row['rack'], row['rank'])
+				if row['appliance'] == 'frontend':
+					frontend = row['host']
+			addrs = {}
+			for row in stack.api.Call('list host interface'):
+				if row['ip'] and row['host'] in info:
+					addrs[row['ip']] = row['host']
+			if frontend:
+				addrs['127.0.0.1'] = frontend
+		except:
+			return
+
+		for (addr, host) in addrs.items():
+			(rack, rank) = info[host]
+			hosts[addr] = { 'name': host, 'addr': addr,
+					'rack': rack, 'rank': rank }
+
+		keys	= {}
+		changed = {}
+		for (addr, d) in hosts.items():
+			k = { 'host:%s:name' % addr	   : d['name'],
+			      'host:%s:addr' % d['name'] : addr,
+			      'host:%s:rack' % d['name'] : d['rack'],
+			      'host:%s:rank' % d['name'] : d['rank'] }
+			keys.update(k)
+			if self.hosts.get(addr) != d:
+				changed.update(k)
+
+		names = list(keys)
+		pipe  = db.pipeline(transaction=False)
+		if changed:
+			pipe.mset(changed)
+		for key in names:
+			pipe.expire(key, Timeout)
+		result = pipe.execute()
+
+		if names:
+			missing = dict((key, keys[key]) for (key, found) in
+				       zip(names, result[-len(names):]) if not found)
+			if missing:
+				pipe.mset(missing)
+				for key in missing:
+					pipe.expire(key, Timeout)
+				pipe.execute()
+
+		self.hosts = hosts
+
+
+# One map for all the processors in the daemon.
+
+Hosts = HostCache()
+
 
 class ProcessorBase(stack.mq.processors.ProcessorBase):
 	"""
 	Extends the stack.mq.processors.ProcessorBase to
 	add support for creating Redis keys.  
 	This is used to cache host information.
+	The keys are written through a pipeline, once for every batch
+	of messages.
 	"""
 
 	def __init__(self, context, sock):
 		self.redis = redis.StrictRedis()
+		self.pipe  = self.redis.pipeline(transaction=False)
 		stack.mq.processors.ProcessorBase.__init__(self, context, sock)
 
 	def isActive(self):
 		return self.isMaster()
 
+	def run(self):
+		# Warm up the host map before the first message.
+
+		if self.isActive():
+			Hosts.lookup(self.redis, '127.0.0.1')
+		stack.mq.processors.ProcessorBase.run(self)
+
 	def updateKey(self, key, value, timeout=None):
 		"""
 		Create an new *key* and *value* in the local Redis
@@ -38,16 +190,16 @@ class ProcessorBase(stack.mq.processors.ProcessorBase):
 		:param timeout: key timeout in seconds
 		:type timeout: int
 		"""
-		self.redis.set(key, value)
-		self.redis.expire(key, timeout)
+		self.pipe.set(key, value, ex=timeout)
+
+	def flush(self):
+		self.pipe.execute()
 
 	def updateHostKeys(self, client):
 		"""
-		Updates the Redis keys for a given host in the cluster.  
-		If Redis does not know about the host the cluster database is inspected and
-		the keys are created with a one hour timeout.
-		If Redis already contains the keys the timeout is reset.
-		The following Redis keys are defined for the host::
+		Returns the information about a given host in the cluster.
+		The host map (see :class:`HostCache`) keeps the following
+		Redis keys for every host, with a one hour timeout::
 
 			host:HOSTNAME:rack
 			host:HOSTNAME:rank
@@ -61,31 +213,7 @@ class ProcessorBase(stack.mq.processors.ProcessorBase):
 		if not client:
 			client = '127.0.0.1'
 
-		host = self.redis.get('host:%s:name' % client)
-		if host:
-			host = host.decode()
-			rack = self.redis.get('host:%s:rack' % host).decode()
-			rank = self.redis.get('host:%s:rank' % host).decode()
-			addr = self.redis.get('host:%s:addr' % host).decode()
-
-		if not host or not rack or not rank or not addr:
-			for row in stack.api.Call('list.host', [ client ]):
-				host = row['host']
-				rack = row['rack']
-				rank = row['rank']
-
-			if host: 
-				self.updateKey('host:%s:name' % client, host,   60 * 60)
-				self.updateKey('host:%s:addr' % host,   client, 60 * 60)
-				self.updateKey('host:%s:rack' % host,   rack,   60 * 60)
-				self.updateKey('host:%s:rank' % host,   rank,   60 * 60)
-
-		d = { 'name': host,
-			 'addr': client,
-			 'rack': rack,
-			 'rank': rank }
-
-		return d
+		return Hosts.lookup(self.redis, client)
 
 
 
@@ -101,9 +229,10 @@ class Processor(ProcessorBase):
 	def process(self, msg):
 		keys = self.updateHostKeys(msg.getSource())
 
-		self.updateKey('host:%s:status' % keys['name'], 
-			       msg.getMessage(), 
-			       60 * 2)
+		if keys['name']:
+			self.updateKey('host:%s:status' % keys['name'], 
+				       msg.getMessage(), 
+				       60 * 2)
 		return None
 
 
@@ -72,7 +72,7 @@ class Processor(ProcessorBase):
 		host since it may be the Frontend and is not
 		actually installing.
 		"""
-		if field == 'to':
+		if field == 'to' and keys['name']:
 			self.updateKey('host:%s:status' % keys['name'], 
 				       'installing', 60*60)
 
@@ -5,6 +5,7 @@
 # @copyright@
 
 import time
+import queue
 import threading
 import zmq
 import json
@@ -26,6 +27,98 @@ class ports:
 	control		= 5002
 
 
+class limits:
+	"""
+	Sizes of the batches and queues between the Stack Message Queue
+	daemons.
+
+	:var batch: most messages handed to a :func:`callbacks` at once
+	:var queue: most messages waiting in a :class:`Queue`
+	:var frame: largest multi-message UDP frame in bytes
+	"""
+	batch		= 500
+	queue		= 10000
+	frame		= 60000
+
+
+class Queue(queue.Queue):
+	"""
+	Bounded queue between two stages of the message queue.
+
+	When the queue is full a new message is either dropped (the
+	sender cannot be slowed down, e.g. UDP) or the sender waits
+	for room, which pushes back on the stage before it.  Both are
+	counted in *counters*.
+	"""
+
+	def __init__(self, maxsize=limits.queue, block=False):
+		"""
+		:param maxsize: most queued messages
+		:type maxsize: int
+		:param block: wait for room rather than drop messages
+		:type block: bool
+		"""
+		queue.Queue.__init__(self, maxsize)
+		self.block    = block
+		self.counters = { 'received': 0, 'dropped': 0, 'blocked': 0 }
+
+	def push(self, item):
+		"""
+		Queues the *item*.
+
+		:returns: False if the item was dropped
+		"""
+		self.counters['received'] += 1
+		try:
+			self.put_nowait(item)
+		except queue.Full:
+			if not self.block:
+				self.counters['dropped'] += 1
+				return False
+			self.counters['blocked'] += 1
+			self.put(item)
+		return True
+
+	def pop(self, size=limits.batch):
+		"""
+		Waits for an item and returns it along with up to *size*
+		- 1 more items that are already queued.
+
+		:returns: list of items
+		"""
+		items = [ self.get() ]
+		while len(items) < size:
+			try:
+				items.append(self.get_nowait())
+			except queue.Empty:
+				break
+		return items
+
+
+def Frames(messages, size=limits.frame):
+	"""
+	Packs *messages* into as few UDP frames as possible.  A frame is
+	a json list of messages, the :class:`Receiver` accepts frames as
+	well as single messages.
+
+	:param messages: list of :class:`Message`
+	:param size: largest frame in bytes
+	:returns: generator of encoded frames
+	"""
+	frame  = []
+	length = 2
+	for message in messages:
+		pkt = message.dumps().encode()
+		if frame and length + len(pkt) + 1 > size:
+			yield b'[' + b','.join(frame) + b']'
+			frame  = []
+			length = 2
+		frame.append(pkt)
+		length += len(pkt) + 1
+	if frame:
+		yield b'[' + b','.join(frame) + b']'
+
+
 class Message():
 	"""
 	Stack Message Queue Message
@@ -217,7 +310,16 @@ class Message():
 		:param packet: json representation of a message
 		:type packet: string
 		"""
-		d = json.loads(packet.decode())
+		self.loadDict(json.loads(packet.decode()))
+
+	def loadDict(self, d):
+		"""
+		Updates the message fields included in the
+		dictionary *d*.
+
+		:param d: dictionary of message fields
+		:type d: dict
+		"""
 		if 'channel' in d:
 			self.channel = d['channel']
 		if 'id' in d:
@@ -257,6 +359,12 @@ class Subscriber(threading.Thread):
 		self.sub = context.socket(zmq.SUB)
 		self.sub.connect('tcp://%s:%d' % (host, ports.subscribe))
 
+		# A slow callback stops us reading the socket, zeromq
+		# then queues (and at its limit drops) messages in the
+		# publisher.
+
+		self.queue = Queue(block=True)
+
 	def subscribe(self, channel):
 		"""
 		Subscribes to all channels that start with the
@@ -279,16 +387,45 @@ class Subscriber(threading.Thread):
 		self.sub.setsockopt_string(zmq.UNSUBSCRIBE, channel)
 		
 	def run(self):
+		dispatcher = threading.Thread(target=self.dispatch)
+		dispatcher.setDaemon(True)
+		dispatcher.start()
+
+		# A zeromq message is the channel followed by one or
+		# more messages.
+
 		while True:
 			try:
-				channel, pkt = self.sub.recv_multipart()
-				msg = Message(channel.decode())
-				msg.loads(pkt)
+				frames  = self.sub.recv_multipart()
+				channel = frames[0].decode()
 			except:
 				continue
-			if 'STACKDEBUG' in os.environ:
-				print (msg.getDict())
-			self.callback(msg)
+			for pkt in frames[1:]:
+				try:
+					msg = Message(channel)
+					msg.loads(pkt)
+				except:
+					continue
+				if 'STACKDEBUG' in os.environ:
+					print (msg.getDict())
+				self.queue.push(msg)
+
+	def dispatch(self):
+		while True:
+			self.callbacks(self.queue.pop())
+
+	def callbacks(self, messages):
+		"""
+		Called for every batch of received messages.  The
+		default calls :func:`callback` for each message, derived
+		classes can override this to handle the whole batch at
+		once.
+
+		:param messages: received messages
+		:type messages: list of stack.mq.Message
+		"""
+		for message in messages:
+			self.callback(message)
 
 
 	def callback(self, message):
@@ -311,14 +448,24 @@ class Receiver(threading.Thread):
 	Once the Receiver thread is started it will not exit.
 	"""
 
-	def __init__(self):
+	def __init__(self, port=ports.publish):
 		threading.Thread.__init__(self)
 
 		self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-		self.rx.bind(('', ports.publish))
+		self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+		self.rx.bind(('', port))
+
+		# UDP senders cannot be slowed down, when the callbacks
+		# fall behind new messages are dropped.
+
+		self.queue = Queue()
 
 	def run(self):
+		dispatcher = threading.Thread(target=self.dispatch)
+		dispatcher.setDaemon(True)
+		dispatcher.start()
+
 		while True:
 			pkt, addr = self.rx.recvfrom(65565)
 
@@ -336,21 +483,58 @@ class Receiver(threading.Thread):
 			# simple so we don't need an API to write to
 			# the message queue.
 
-			msg = None
-			tm  = time.asctime()
-			try:
-				msg = Message(time=tm)
-				msg.loads(pkt)
-			except:
-				try:
-					(c, m) = pkt.split(' ', 1)
-					msg = Message(c, m, time=tm)
-				except:
-					pass # drop bad message
-			if msg:
+			for msg in self.decode(pkt):
 				if not msg.getSource() and addr[0] != '127.0.0.1':
 					msg.setSource(addr[0])
-				self.callback(msg)
+				self.queue.push(msg)
+
+	def decode(self, pkt):
+		"""
+		Returns the list of messages in the packet *pkt*, which
+		is either text, a json message, or a frame of json
+		messages (see :func:`Frames`).
+		"""
+		msgs = []
+		tm   = time.asctime()
+		try:
+			d = json.loads(pkt.decode())
+		except:
+			d = None
+
+		if isinstance(d, dict):
+			d = [ d ]
+		if isinstance(d, list):
+			for entry in d:
+				try:
+					msg = Message(time=tm)
+					msg.loadDict(entry)
+				except:
+					continue # drop bad message
+				msgs.append(msg)
+		else:
+			try:
+				(c, m) = pkt.decode().split(' ', 1)
+				msgs.append(Message(c, m, time=tm))
+			except:
+				pass # drop bad message
+		return msgs
+
+	def dispatch(self):
+		while True:
+			self.callbacks(self.queue.pop())
+
+	def callbacks(self, messages):
+		"""
+		Called for every batch of received messages.  The
+		default calls :func:`callback` for each message, derived
+		classes can override this to handle the whole batch at
+		once.
+
+		:param messages: received messages
+		:type messages: list of stack.mq.Message
+		"""
+		for message in messages:
+			self.callback(message)
 
 	def callback(self, message):
 		"""
@@ -0,0 +1,32 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# The mq sources are installed as stack.mq, stack.mq.processors and
+# stack.mq.producers, load them from the source tree under the same
+# names.
+
+import os
+import sys
+import importlib.util
+import stack
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, path):
+	directory = os.path.dirname(path)
+	spec	  = importlib.util.spec_from_file_location(name, path,
+		submodule_search_locations=[ directory ])
+	module	  = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
+
+
+if 'stack.mq' not in sys.modules:
+	stack.mq = load('stack.mq', os.path.join(Root, 'pylib', 'mq', '__init__.py'))
+	stack.mq.processors = load('stack.mq.processors',
+		os.path.join(Root, 'processors', '__init__.py'))
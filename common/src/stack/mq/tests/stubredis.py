@@ -0,0 +1,65 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+
+class Redis:
+	"""
+	Redis stand-in, counts the round trips.
+	"""
+
+	def __init__(self):
+		self.data      = {}
+		self.ttl       = {}
+		self.calls     = 0
+		self.pipelines = 0
+
+	def get(self, key):
+		self.calls += 1
+		value = self.data.get(key)
+		return value.encode() if value is not None else None
+
+	def set(self, key, value, ex=None):
+		self.data[key] = '%s' % value
+		if ex:
+			self.ttl[key] = ex
+
+	def mset(self, mapping):
+		for (key, value) in mapping.items():
+			self.data[key] = '%s' % value
+		return True
+
+	def expire(self, key, seconds):
+		if key not in self.data:
+			return False
+		self.ttl[key] = seconds
+		return True
+
+	def rpush(self, key, value):
+		self.data.setdefault(key, []).append(value)
+
+	def pipeline(self, transaction=True):
+		return Pipeline(self)
+
+
+class Pipeline:
+
+	def __init__(self, db):
+		self.db	      = db
+		self.commands = []
+
+	def __getattr__(self, name):
+		def queue(*args, **kwargs):
+			self.commands.append((name, args, kwargs))
+		return queue
+
+	def execute(self):
+		if self.commands:
+			self.db.calls	  += 1
+			self.db.pipelines += 1
+		result = [ getattr(self.db, name)(*args, **kwargs)
+			   for (name, args, kwargs) in self.commands ]
+		self.commands = []
+		return result
@@ -0,0 +1,170 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import time
+import threading
+import stack.api
+import stack.mq
+import stack.mq.processors.health
+from stack.mq.processors.health import HostCache
+from .stubredis import Redis
+
+HOSTS = 5000
+
+
+class Database:
+	"""
+	Stands in for stack.api.Call, counts the commands.
+	"""
+
+	def __init__(self, hosts):
+		self.hosts = hosts
+		self.calls = []
+
+	def __call__(self, cmd, args=[]):
+		self.calls.append(cmd)
+		if cmd == 'list host':
+			return [ { 'host': host, 'rack': rack, 'rank': rank,
+				   'appliance': 'frontend' if host == 'frontend-0-0' else 'backend' }
+				 for (addr, host, rack, rank) in self.hosts ]
+		if cmd == 'list host interface':
+			return [ { 'host': host, 'ip': addr }
+				 for (addr, host, rack, rank) in self.hosts ]
+		return []
+
+
+def addr(i):
+	return '10.3.%d.%d' % (i // 250, i % 250)
+
+
+def test_hosts(monkeypatch):
+	hosts = [ ('10.1.1.1', 'frontend-0-0', '0', '0') ] + \
+		[ (addr(i), 'backend-%d-%d' % (i // 40, i % 40), '%d' % (i // 40), '%d' % (i % 40))
+		  for i in range(0, HOSTS) ]
+	database = Database(hosts)
+	monkeypatch.setattr(stack.api, 'Call', database)
+
+	db    = Redis()
+	cache = HostCache()
+
+	# one bulk load, one pipeline for all the keys
+
+	assert cache.lookup(db, addr(41)) == { 'name': 'backend-1-1',
+		'addr': addr(41), 'rack': '1', 'rank': '1' }
+	assert cache.lookup(db, '127.0.0.1')['name'] == 'frontend-0-0'
+	for i in range(0, HOSTS):
+		assert cache.lookup(db, addr(i))['rank'] == '%d' % (i % 40)
+	assert len(database.calls) == 2
+	assert db.pipelines == 1
+	assert db.data['host:%s:name' % addr(41)] == 'backend-1-1'
+	assert db.data['host:backend-1-1:rack'] == '1'
+	assert db.ttl['host:backend-1-1:addr'] == stack.mq.processors.health.Timeout
+
+	# unknown addresses reload the map at most every Retry seconds
+
+	assert cache.lookup(db, '10.9.9.9')['name'] is None
+	assert cache.lookup(db, '10.9.9.8')['name'] is None
+	assert len(database.calls) == 2
+
+	# a reload only sets the keys of new and changed hosts, it
+	# runs on its own thread and the lookup goes on with the old map
+
+	hosts.append(('10.9.9.9', 'backend-99-0', '99', '0'))
+	cache.loaded -= stack.mq.processors.health.Retry + 1
+	assert cache.lookup(db, '10.9.9.9')['name'] is None
+	cache.thread.join()
+	assert cache.lookup(db, '10.9.9.9')['name'] == 'backend-99-0'
+	assert len(database.calls) == 4
+	assert db.pipelines == 2
+
+	# lookups never wait for a reload
+
+	with cache.lock:
+		cache.loaded -= stack.mq.processors.health.Refresh + 1
+		assert cache.lookup(db, addr(41))['name'] == 'backend-1-1'
+	assert len(database.calls) == 4
+
+	# keys lost in Redis (flush, restart) are set again
+
+	db.data.clear()
+	cache.lookup(db, addr(41))
+	cache.thread.join()
+	assert len(database.calls) == 6
+	assert db.pipelines == 4
+	assert db.data['host:%s:name' % addr(41)] == 'backend-1-1'
+	assert db.data['host:backend-1-1:rack'] == '1'
+	assert db.data['host:backend-99-0:addr'] == '10.9.9.9'
+
+
+def test_warmup(monkeypatch):
+	"""
+	Lookups made while the first load runs wait for it.
+	"""
+
+	database = Database([ ('10.1.1.1', 'frontend-0-0', '0', '0') ])
+	started	 = threading.Event()
+	release	 = threading.Event()
+
+	def call(cmd, args=[]):
+		started.set()
+		release.wait(10)
+		return database(cmd, args)
+	monkeypatch.setattr(stack.api, 'Call', call)
+
+	db     = Redis()
+	cache  = HostCache()
+	names  = []
+	lookup = lambda: names.append(cache.lookup(db, '10.1.1.1')['name'])
+
+	first = threading.Thread(target=lookup)
+	first.start()
+	started.wait(10)
+	other = threading.Thread(target=lookup)
+	other.start()
+	time.sleep(0.1)
+	assert names == []
+
+	release.set()
+	first.join()
+	other.join()
+	assert names == [ 'frontend-0-0', 'frontend-0-0' ]
+	assert len(database.calls) == 2
+
+
+def test_processor(monkeypatch):
+	"""
+	The tracker processor looks up both ends of every message
+	without a database query of its own.
+	"""
+
+	import json
+	import redis
+	import stack.mq.processors.tracker
+
+	hosts	 = [ (addr(i), 'backend-0-%d' % i, '0', '%d' % i) for i in range(0, 100) ]
+	database = Database(hosts)
+	db	 = Redis()
+	monkeypatch.setattr(stack.api, 'Call', database)
+	monkeypatch.setattr(redis, 'StrictRedis', lambda: db)
+	monkeypatch.setattr(stack.mq.processors.health, 'Hosts', HostCache())
+
+	processor = stack.mq.processors.tracker.Processor.__new__(
+		stack.mq.processors.tracker.Processor)
+	processor.redis = db
+	processor.pipe	= db.pipeline()
+
+	t = time.time()
+	for i in range(0, 10000):
+		msg = stack.mq.Message('rawtracker', json.dumps({
+			'from': addr(i % 100), 'to': addr((i + 1) % 100) }))
+		msg = processor.process(msg)
+	processor.flush()
+	print('\n10000 tracker messages %.3fs, %d database commands, %d redis round trips' %
+	      (time.time() - t, len(database.calls), db.calls))
+
+	assert json.loads(msg.getMessage())['to']['host'] == 'backend-0-0'
+	assert len(database.calls) == 2
+	assert db.calls == 2
@@ -0,0 +1,143 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import time
+import socket
+import zmq
+import redis
+import stack.api
+import stack.mq
+import stack.mq.processors.health
+from .stubredis import Redis
+
+MESSAGES = 20000
+HOSTS	 = 2000
+
+
+class Publisher(stack.mq.Receiver):
+	"""
+	Same data path as the rmq-publisher daemon, a zeromq message
+	per channel and batch.
+	"""
+
+	def __init__(self, context, port, pubport):
+		stack.mq.Receiver.__init__(self, port)
+		self.pub = context.socket(zmq.PUB)
+		self.pub.setsockopt(zmq.SNDHWM, 0)
+		self.pub.bind('tcp://127.0.0.1:%d' % pubport)
+
+	def callbacks(self, messages):
+		batches = {}
+		for message in messages:
+			message.addHop()
+			batches.setdefault(message.getChannel(), []).append(
+				message.dumps(channel=False).encode())
+		for chan in batches:
+			self.pub.send_multipart([ chan.encode() ] + batches[chan])
+
+
+def port():
+	s = socket.socket()
+	s.bind(('127.0.0.1', 0))
+	p = s.getsockname()[1]
+	s.close()
+	return p
+
+
+def addr(host):
+	return '10.2.%d.%d' % (host // 250, host % 250)
+
+
+def Call(cmd, args=[]):
+	if cmd == 'list host':
+		return [ { 'host': 'backend-0-%d' % i, 'rack': '0', 'rank': '%d' % i,
+			   'appliance': 'backend' } for i in range(0, HOSTS) ]
+	if cmd == 'list host interface':
+		return [ { 'host': 'backend-0-%d' % i, 'ip': addr(i) }
+			 for i in range(0, HOSTS) ]
+	return []
+
+
+def test_frames():
+	msgs = [ stack.mq.Message('health', 'up', source=addr(i))
+		 for i in range(0, 2000) ]
+	frames = list(stack.mq.Frames(msgs))
+	assert len(frames) > 1
+	assert max([ len(f) for f in frames ]) <= stack.mq.limits.frame
+
+	receiver = stack.mq.Receiver.__new__(stack.mq.Receiver)
+	result	 = []
+	for frame in frames:
+		result.extend(receiver.decode(frame))
+	assert [ m.getSource() for m in result ] == [ m.getSource() for m in msgs ]
+	assert receiver.decode(b'alert disk full')[0].getMessage() == 'disk full'
+
+	q = stack.mq.Queue(maxsize=2)
+	assert q.push(1) and q.push(2) and not q.push(3)
+	assert q.pop() == [ 1, 2 ]
+	assert q.counters == { 'received': 3, 'dropped': 1, 'blocked': 0 }
+
+
+def test_throughput(monkeypatch):
+	db = Redis()
+	monkeypatch.setattr(redis, 'StrictRedis', lambda: db)
+	monkeypatch.setattr(stack.api, 'Call', Call)
+	monkeypatch.setattr(stack.mq.processors.health, 'Hosts',
+		stack.mq.processors.health.HostCache())
+
+	udp	= port()
+	pubport = port()
+	monkeypatch.setattr(stack.mq.ports, 'subscribe', pubport)
+
+	context   = zmq.Context()
+	publisher = Publisher(context, udp, pubport)
+	publisher.setDaemon(True)
+	publisher.start()
+
+	sink	  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	processor = stack.mq.processors.health.Processor(context, sink)
+	processor.setDaemon(True)
+	processor.start()
+	time.sleep(0.5)
+
+	msgs = [ stack.mq.Message('health', 'up', source=addr(i % HOSTS))
+		 for i in range(0, MESSAGES) ]
+	tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	t = time.time()
+	frames = 0
+	for frame in stack.mq.Frames(msgs, 8000):
+		tx.sendto(frame, ('127.0.0.1', udp))
+		frames += 1
+		if frames % 20 == 0:
+			time.sleep(0.001)
+
+	# every message is either dropped by the publisher or
+	# handled by the processor
+
+	counters = publisher.queue.counters
+	while time.time() - t < 30:
+		done = processor.queue.counters['received'] + counters['dropped']
+		if done == MESSAGES and not processor.queue.qsize():
+			break
+		time.sleep(0.01)
+	elapsed = time.time() - t
+
+	print('\n%d messages in %d frames, %.2fs, %d messages/s delivered' %
+	      (MESSAGES, frames, elapsed,
+	       processor.queue.counters['received'] / elapsed))
+	print('publisher %s' % publisher.queue.counters)
+	print('processor %s' % processor.queue.counters)
+	print('redis round trips %d, %d of them pipelines' % (db.calls, db.pipelines))
+
+	# the last batch may still be in the processor
+	while time.time() - t < 30:
+		statuses = len([ k for k in list(db.data) if k.endswith(':status') ])
+		if statuses == HOSTS:
+			break
+		time.sleep(0.01)
+	assert statuses == HOSTS
+	assert db.calls < MESSAGES // 10
@@ -4,14 +4,37 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
+import io
 import os
-import subprocess
+import pwd
+import sys
 import json
+import time
+import marshal
+import threading
+import subprocess
+import contextlib
 
 __stack__ = '/opt/stack/bin/stack'
 
+# Commands are run in-process (sharing one database connection)
+# unless this is False or there is no database to connect to, then
+# every Call forks the stack command line.
+
+__inprocess__ = True
+
 rc = None
 
+Database = None		# in-process connection, False if there is none
+Retry	 = 0		# when to try connecting again if there is none
+Commands = {}		# command words -> (name, Command class, arg count)
+Lock	 = threading.Lock()
+
+# Seconds to wait before connecting again after a failed connect, in
+# the meantime commands fork the stack command line.
+
+RetryInterval = 30
+
 
 def ReturnCode():
 	"""
@@ -20,11 +43,166 @@ def ReturnCode():
 	return rc
 
 
+def connect():
+	"""
+	Returns the database connection for in-process commands, the
+	connection is made the same way the stack command line makes
+	it.  Returns None if there is no database, connecting is tried
+	again after RetryInterval seconds.
+	"""
+
+	global Database, Retry
+
+	if Database:
+		try:
+			Database.ping(reconnect=True)
+			return Database
+		except Exception:
+			Database = False
+			Retry	 = time.time() + RetryInterval
+			return None
+	if Database is False and time.time() < Retry:
+		return None
+
+	Database = False
+	Retry	 = time.time() + RetryInterval
+	try:
+		import pymysql
+		import stack.commands
+	except ImportError:
+		return None
+
+	passwd = ''
+	try:
+		with open('/opt/stack/etc/my.cnf', 'r') as fin:
+			for line in fin.readlines():
+				if line.startswith('password'):
+					passwd = line.split('=')[1].strip()
+					break
+	except:
+		pass
+
+	if os.geteuid() == 0:
+		username = 'apache'
+	else:
+		username = pwd.getpwuid(os.geteuid())[0]
+
+	try:
+		if os.path.exists('/var/opt/stack/mysql/mysql.sock'):
+			Database = pymysql.connect(db='cluster',
+				host='localhost',
+				user=username,
+				passwd='%s' % passwd,
+				unix_socket='/var/opt/stack/mysql/mysql.sock',
+				autocommit=True)
+		else:
+			try:
+				host = stack.DatabaseHost
+			except:
+				host = 'localhost'
+			Database = pymysql.connect(db='cluster',
+				host='%s' % host,
+				user=username,
+				passwd='%s' % passwd,
+				port=40000,
+				autocommit=True)
+	except pymysql.err.OperationalError:
+		Database = False
+		return None
+
+	return Database
+
+
+def lookup(command):
+	"""
+	Finds the Command class for the COMMAND words the same way the
+	stack command line does: the longest prefix that is a command
+	module, the remaining words are arguments.  Returns None if
+	there is no such command.
+	"""
+
+	key = tuple(command)
+	if key in Commands:
+		return Commands[key]
+
+	result = None
+	for i in range(len(command), 0, -1):
+		module = 'stack.commands.%s' % '.'.join(command[:i])
+		try:
+			__import__(module)
+		except ImportError:
+			continue
+		module = sys.modules[module]
+		if hasattr(module, 'Command'):
+			result = (' '.join(command[:i]), module.Command, i)
+		break
+
+	Commands[key] = result
+	return result
+
+
+def run(database, command, args):
+	"""
+	Runs the COMMAND words in-process using the DATABASE
+	connection.  Returns the return code (the same as the stack
+	command line's exit code) and either the list of rows (list
+	commands) or the lines of output.
+	"""
+
+	found = lookup(command)
+	if not found:
+		sys.stderr.write('Error - Invalid stack command "%s"\n' %
+				 ' '.join(command))
+		return (255, [ ])
+
+	(name, cls, n) = found
+	args = command[n:] + (args or [])
+	rows = command[0] == 'list'
+	if rows:
+		args.append('output-format=binary')
+
+	# Anything the command prints would have been the output of
+	# the command line, keep it away from our caller's stdout.
+
+	stdout = io.StringIO()
+	try:
+		with contextlib.redirect_stdout(stdout):
+			o = cls(database)
+			o.structured = rows
+			result = o.runWrapper(name, args)
+	except (Exception, SystemExit) as e:
+		sys.stderr.write('%s\n' % e)
+		return (255, [ ])
+
+	if result is not True:
+		return (255, [ ])
+
+	if rows:
+		if o.rows is not None:
+			return (0, o.rows)
+		text = o.getText()
+		if text:
+			return (0, marshal.loads(text))
+		return (0, [ ])
+
+	text = o.getText()
+	if isinstance(text, bytes):
+		text = text.decode()
+	text = (text or '') + stdout.getvalue()
+	if text:
+		return (0, text.split('\n'))
+	return (0, [ ])
+
+
 def Call(cmd, args=None, format='json', sudo=False):
 	"""
 	Call the Stack Command Line and return a python dictionary as the
 	result.  Currently only works with list commands.
 
+	When the database is reachable the command is run in-process,
+	otherwise (or for SUDO and non-json formats) the stack command
+	line is run.
+
 	Example:
 		result = stack.api.Call('list network', [ 'private' ])
 	"""
@@ -36,6 +214,13 @@ def Call(cmd, args=None, format='json', sudo=False):
 		return [ ]
 	
 	command = cmd.replace('.', ' ').strip().split()
+
+	if __inprocess__ and not sudo and format == 'json' and command:
+		with Lock:
+			database = connect()
+			if database:
+				(rc, result) = run(database, command, args)
+				return result
 	
 	if sudo:
 		list = [ sudo ]
@@ -66,7 +251,7 @@ def Call(cmd, args=None, format='json', sudo=False):
 		return [ ]
 	
 	if s:
-		return s.split('\n')
+		return s.decode().split('\n')
 	return [ ]
 
 
@@ -0,0 +1,163 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Index of the stack command modules.  The index is built when the
+# commands are installed and maps every command path (e.g.
+# 'list.host.attr') to whether the module has a Command class, so
+# the command line can find a command without trial imports or
+# walking the commands directory.
+#
+# Each pallet installs its own commands, the index built at install
+# time only knows the commands of the stacki pallet.  The first run by
+# a user that can write the commands directory (root) after another
+# pallet added commands rebuilds the index, until then those commands
+# are found the old way.
+#
+# This module is also run at install time:
+#
+#	python3 commandindex.py /opt/stack/lib/python3.6/site-packages/stack/commands
+
+import os
+import re
+import sys
+import marshal
+import importlib.util
+
+Filename = 'commands.index'
+
+_commandRE = re.compile(r'^class\s+Command\b', re.MULTILINE)
+
+_directory = None
+_index	   = None
+
+
+def Directory():
+	"""
+	Returns the directory of the stack.commands package without
+	importing it.
+	"""
+
+	global _directory
+
+	if _directory is None:
+		try:
+			spec = importlib.util.find_spec('stack.commands')
+		except ImportError:
+			spec = None
+		if spec and spec.submodule_search_locations:
+			_directory = list(spec.submodule_search_locations)[0]
+		else:
+			_directory = ''
+	return _directory
+
+
+def Build(directory):
+	"""
+	Walks the commands DIRECTORY and returns the index.
+	"""
+
+	index = {}
+	for (path, dirs, files) in os.walk(directory):
+		dirs[:] = [ d for d in dirs if d != '__pycache__' ]
+		if path == directory or '__init__.py' not in files:
+			continue
+		name = os.path.relpath(path, directory).replace(os.sep, '.')
+		with open(os.path.join(path, '__init__.py'), 'r') as fin:
+			index[name] = _commandRE.search(fin.read()) is not None
+	return index
+
+
+def Write(directory):
+	"""
+	Builds the index for the commands DIRECTORY and writes it
+	into the directory.
+	"""
+
+	index = Build(directory)
+	path  = os.path.join(directory, Filename)
+	tmp   = '%s.%d' % (path, os.getpid())
+	with open(tmp, 'wb') as fout:
+		marshal.dump(index, fout)
+	os.rename(tmp, path)
+	return index
+
+
+def Load():
+	"""
+	Returns the installed index, or None if there is none.
+	"""
+
+	global _index
+
+	if _index is None:
+		_index = False
+		directory = Directory()
+		if directory:
+			try:
+				with open(os.path.join(directory, Filename), 'rb') as fin:
+					_index = marshal.load(fin)
+			except (OSError, EOFError, ValueError, TypeError):
+				pass
+	return _index or None
+
+
+def Refresh():
+	"""
+	Rebuilds the installed index, if the commands directory can be
+	written.  Returns True if the index was rebuilt.
+	"""
+
+	global _index
+
+	directory = Directory()
+	if not directory or not os.access(directory, os.W_OK):
+		return False
+	try:
+		_index = Write(directory)
+	except OSError:
+		return False
+	return True
+
+
+def Lookup(words, refresh=True):
+	"""
+	Finds the longest prefix of WORDS that is a command module.
+	Returns the module name and the number of words it used, or
+	None if the index cannot answer (the caller falls back to
+	importing each prefix).
+	"""
+
+	index = Load()
+	if not index:
+		return None
+
+	for i in range(len(words), 0, -1):
+		name = '.'.join(words[:i])
+		if name in index:
+			break
+	else:
+		i = 0
+
+	# Commands installed after the index was built (e.g. by
+	# another pallet) live just below the longest indexed
+	# prefix.
+
+	if i < len(words) and os.path.exists(os.path.join(Directory(),
+			*(words[:i + 1] + [ '__init__.py' ]))):
+		if refresh and Refresh():
+			return Lookup(words, False)
+		return None
+	if not i:
+		return None
+
+	return ('stack.commands.%s' % name, i)
+
+
+if __name__ == '__main__':
+	for directory in sys.argv[1:]:
+		index = Write(directory)
+		print('%s: %d commands' % (directory,
+			len([ n for n in index if index[n] ])))
@@ -13,20 +13,27 @@
 # @rocks@
 
 
-from collections import UserDict
+import ast
+from functools import lru_cache
 
 
-class _CondEnv(UserDict):
+class _CondEnv:
 	"""This is a special dictionary that rather than throwing
 	an exception when an item is not found it just returns None.  It is
 	used to create a special local() environment where all unresolved
 	variables evaluate to None.  This allows condintional expressions
-	that refer to non-existent attributes to evaluate to False."""
+	that refer to non-existent attributes to evaluate to False.
+
+	The environment is a view of the ATTRS dictionary, the NAMES
+	dictionary maps the variable names in a compiled expression to the
+	attribute names (e.g. a_DOT_b -> a.b), nothing is copied."""
+
+	def __init__(self, attrs, names):
+		self.attrs = attrs
+		self.names = names
 	
 	def __getitem__(self, key):
 
-		# print '__getitem__', key
-		
 		# Handle boolean special since they are not in the
 		# environment
 
@@ -36,7 +43,7 @@ class _CondEnv(UserDict):
 			return False
 		
 		try:
-			val = UserDict.__getitem__(self, key)
+			val = self.attrs[self.names.get(key, key)]
 		except:
 			return None	# undefined vars are None
 
@@ -51,7 +58,78 @@ class _CondEnv(UserDict):
 		# Everything else is returned as a string
 
 		return val
-		
+
+
+class _DottedNames(ast.NodeTransformer):
+	"""Rewrites the dotted attribute names (e.g. os.version) in an
+	expression into single variables, and records the name of every
+	attribute referenced."""
+
+	def __init__(self):
+		self.names = {}
+
+	def dotted(self, node):
+		path = []
+		while isinstance(node, ast.Attribute):
+			path.insert(0, node.attr)
+			node = node.value
+		if not isinstance(node, ast.Name):
+			return None
+		path.insert(0, node.id)
+		return '.'.join(path)
+
+	def visit_Attribute(self, node):
+		name = self.dotted(node)
+		if not name:
+			return self.generic_visit(node)
+		var = name.replace('.', '_DOT_')
+		self.names[var] = name
+		return ast.copy_location(ast.Name(id=var, ctx=node.ctx), node)
+
+	def visit_Name(self, node):
+		self.names[node.id] = node.id
+		return node
+
+
+class CondExpr:
+	"""A compiled conditional expression.  Use CompileCondExpr to
+	create these, the ATTRS member is the set of attribute names the
+	expression reads."""
+
+	def __init__(self, cond):
+		self.cond = cond
+		self.code = None
+		self.names = {}
+
+		if cond:
+			tree = ast.parse(cond.strip(), mode='eval')
+			transformer = _DottedNames()
+			tree = ast.fix_missing_locations(transformer.visit(tree))
+			self.code  = compile(tree, '<cond>', 'eval')
+			self.names = transformer.names
+
+		self.attrs = set(self.names.values())
+			
+	def eval(self, attrs):
+		if not self.code:
+			return True
+
+		try:
+			result = eval(self.code, globals(), _CondEnv(attrs, self.names))
+		except:
+			result = False
+
+		return result
+
+
+@lru_cache(maxsize=4096)
+def CompileCondExpr(cond):
+	"""Returns the CondExpr for COND.  Each distinct expression is only
+	parsed and compiled once.  Raises a SyntaxError if COND is not
+	a valid expression."""
+
+	return CondExpr(cond)
+
 
 def CreateCondExpr(archs, oses, releases, cond):
 	"""Build a boolean expression from the old Rocks style
@@ -101,6 +179,18 @@ def CreateCondExpr(archs, oses, releases, cond):
 	return ' and '.join(exprs)
 
 
+def CondAttrs(cond):
+	"""Returns the set of attribute names referenced by the
+	conditional expression COND, or None if COND is not a valid
+	expression.  Callers can use this to resolve only the attributes
+	an expression needs before calling EvalCondExpr.
+	"""
+
+	try:
+		return set(CompileCondExpr(cond).attrs)
+	except (SyntaxError, ValueError):
+		return None
+
     
 def EvalCondExpr(cond, attrs):
 	"""Tests the conditional expression.  The ATTRS dictionary is use to
@@ -109,39 +199,14 @@ def EvalCondExpr(cond, attrs):
 	for every key-value pair in the ATTRS dictionary a Python variable
 	is created, this allows the COND expression to directly refer to
 	all the attributes as variables.
-	"""
 
-	if not cond:
-		return True
-
-	cond = cond.replace('.', '_DOT_')
-
-	env = _CondEnv()
-	for (k, v) in attrs.items():
-
-		# FIXME
-		#
-		# list.attr:addHostAttrs we create [] attributes instead of strings
-		# catch when this happens and replace the '.' to '_DOT_' in the
-		# list elements.
-		#
-		# This is horrible, but fixes the code for now. Will open a ticket
-		# to clean this up.
-
-		if type(v) == type([]):
-			l = [ ]
-			for s in v:
-				l.append(s.replace('.', '_DOT_'))
-			v = l
-		else:
-			v = v.replace('.', '_DOT_')
-		k = k.replace('.', '_DOT_')
-#		print(cond, ':', k, ':', v)
-		env[k] = v
+	The expression is compiled once (see CompileCondExpr) and the
+	attributes are only looked up when the expression reads them.
+	"""
 
 	try:
-		result = eval(cond, globals(), env)
+		expr = CompileCondExpr(cond)
 	except:
-		result = False
+		return False
 
-	return result
+	return expr.eval(attrs)
@@ -13,7 +13,11 @@
 # @rocks@
 
 import os
+import re
 import sys
+import hashlib
+import marshal
+import tempfile
 import subprocess
 import stack.util
 import stack.graph
@@ -112,6 +116,7 @@ class GraphHandler(handler.ContentHandler,
 		self.text			= ''
 		self.os				= attrs['os']
 		self.directories		= directories
+		self.nodeFiles			= {}
 		self.xmlns			= ''
 
 		# Should we prune the graph while adding edges or not.
@@ -143,18 +148,19 @@ class GraphHandler(handler.ContentHandler,
 
 		xml = [ None, None, None ] # default, extend, replace
 		for dir in nodesPath:
+			files = self.listNodes(dir)
 			if not xml[0]:
-				file = os.path.join(dir, '%s.xml' % node.name)
-				if os.path.isfile(file):
-					xml[0] = file
+				file = '%s.xml' % node.name
+				if file in files:
+					xml[0] = os.path.join(dir, file)
 			if not xml[1]:
-				file = os.path.join(dir, 'extend-%s.xml' % node.name)
-				if os.path.isfile(file):
-					xml[1] = file
+				file = 'extend-%s.xml' % node.name
+				if file in files:
+					xml[1] = os.path.join(dir, file)
 			if not xml[2]:
-				file = os.path.join(dir, 'replace-%s.xml' % node.name)
-				if os.path.isfile(file):
-					xml[2] = file
+				file = 'replace-%s.xml' % node.name
+				if file in files:
+					xml[2] = os.path.join(dir, file)
 
 		if not (xml[0] or xml[2]):
 			raise stack.util.KickstartNodeError('cannot find node "%s"' % node.name)
@@ -165,16 +171,34 @@ class GraphHandler(handler.ContentHandler,
 		if xml[2]:
 			xmlFiles = [ xml[2] ]
 
+		cache = NodeCache()
 		for xmlFile in xmlFiles:
 
 			xmlFileBasename = os.path.split(xmlFile)[1]
+
+			with open(xmlFile, 'r') as fin:
+				lines = fin.readlines()
+
+			# Nodes already parsed with the same attributes (by
+			# this or an earlier process) are not parsed again.
+
+			key = None
+			if 'STACKDEBUG' not in os.environ:
+				key = cache.key(xmlFile, ''.join(lines), self.attributes)
+			if key:
+				value = cache.get(key)
+				if value:
+					(nodeXML, nodeKSText, xmlns, filename) = value
+					node.setFilename(filename)
+					node.addXML(nodeXML)
+					node.addKSText(nodeKSText)
+					continue
 		
 			# 1st Pass
 			#	- Expand XML Entities
 			#	- Expand EVAL tags
 			#	- Logging for post sections
 
-			fin       = open(xmlFile, 'r')
 			parser    = make_parser(["stack.expatreader"])
 			handler_1 = Pass1NodeHandler(node, xmlFile, self.attributes, eval, rcl)
 			parser.setContentHandler(handler_1)
@@ -192,7 +216,7 @@ class GraphHandler(handler.ContentHandler,
 			parser.feed(header)
 
 			linenumber = 0
-			for line in fin.readlines():
+			for line in lines:
 				linenumber += 1
 			
 				# Some of the node files might have the <?xml
@@ -221,7 +245,6 @@ class GraphHandler(handler.ContentHandler,
 			if 'STACKDEBUG' in os.environ:
 				sys.stderr.write('[parse1 %4d]</stack:ns>\n' % i)
 			parser.feed('</stack:ns>')
-			fin.close()
 			
 			# 2nd Pass
 			#	- Expand XML Entities
@@ -251,8 +274,45 @@ class GraphHandler(handler.ContentHandler,
 			node.addXML(handler_2.getXML())
 			node.addKSText(handler_2.getKSText())
 
+			if key:
+				cache.put(key, (handler_2.getXML(),
+						handler_2.getKSText(),
+						xmlns,
+						node.getFilename()))
+
 		self.xmlns = xmlns
 
+	def listNodes(self, dir):
+		"""Returns the set of files in the nodes DIR, each directory
+		is only read once per handler."""
+
+		if dir not in self.nodeFiles:
+			try:
+				self.nodeFiles[dir] = set(os.listdir(dir))
+			except OSError:
+				self.nodeFiles[dir] = set()
+		return self.nodeFiles[dir]
+
+	def replay(self, edges, orders):
+		"""Builds the graphs from the EDGES and ORDERS recorded
+		by a GraphRecorder, pruning the edges just as parsing the
+		graph files would."""
+
+		for (parent, child, cond, prune) in edges:
+			if self.prune and prune is not None and \
+				not stack.cond.EvalCondExpr(prune, self.attributes):
+				continue
+			self.attrs.main.parent	     = parent
+			self.attrs.main.child	     = child
+			self.attrs.main.default.cond = cond
+			self.addEdge()
+
+		for (head, tail, gen) in orders:
+			self.attrs.order.head = head
+			self.attrs.order.tail = tail
+			self.attrs.order.gen  = gen
+			self.addOrder()
+
 	def addOrder(self):
 		if self.graph.order.hasNode(self.attrs.order.head):
 			head = self.graph.order.getNode(self.attrs.order.head)
@@ -473,6 +533,284 @@ class GraphHandler(handler.ContentHandler,
 		self.text = self.text + s
 		
 
+def ReadCache(path, key):
+	"""Returns the value stored by WriteCache, or None."""
+
+	filename = os.path.join(path, '%d' % os.geteuid(), key)
+	try:
+		with open(filename, 'rb') as fin:
+			return marshal.load(fin)
+	except (OSError, EOFError, ValueError, TypeError):
+		return None
+
+def WriteCache(path, key, value):
+	"""Stores the VALUE for KEY in a per-user directory of PATH.
+	Failures are ignored, the cache is only an optimization."""
+
+	dir = os.path.join(path, '%d' % os.geteuid())
+	try:
+		if not os.path.exists(dir):
+			os.makedirs(dir, 0o700)
+		fd, tmp = tempfile.mkstemp(dir=dir)
+		with os.fdopen(fd, 'wb') as fout:
+			marshal.dump(value, fout)
+		os.rename(tmp, os.path.join(dir, key))
+	except (OSError, ValueError):
+		pass
+
+
+class NodeCache:
+	"""Cache of the parsed (both passes) node files.  The key is the
+	content of the file and the values of the attributes it uses as
+	entities, so hosts of the same appliance and OS share the
+	output.  Files with <eval> or <report> sections depend on more
+	than their attributes and are never cached."""
+
+	path	= '/dev/shm/stack-nodecache'
+	entries = {}
+	size	= 4096
+
+	_dynamicRE = re.compile(r'<\s*(?:stack:)?(?:eval|report)\b')
+
+	def key(self, filename, text, attrs):
+		"""Returns the key for the node FILENAME with the contents
+		TEXT, or None if it cannot be cached."""
+
+		if self._dynamicRE.search(text):
+			return None
+
+		m = hashlib.md5()
+		m.update(filename.encode())
+		m.update(b'\0')
+		m.update(attrs['os'].encode())
+		m.update(b'\0')
+		m.update(text.encode())
+		for entity in sorted(set(GraphCache._entityRE.findall(text))):
+			if entity in GraphCache._builtins:
+				continue
+			value = attrs.get(entity)
+			if value is None:
+				return None
+			m.update(('\0%s=%s' % (entity, value)).encode())
+		return m.hexdigest()
+
+	def get(self, key):
+		value = NodeCache.entries.get(key)
+		if value is None:
+			value = ReadCache(self.path, key)
+			if value is not None:
+				self.remember(key, value)
+		return value
+
+	def put(self, key, value):
+		self.remember(key, value)
+		WriteCache(self.path, key, value)
+
+	def remember(self, key, value):
+		if len(NodeCache.entries) >= self.size:
+			NodeCache.entries.clear()
+		NodeCache.entries[key] = value
+
+
+class GraphRecorder(GraphHandler):
+	"""Parses the graph files without pruning and records the edges
+	rather than building the graphs.  The <to> and <from> conditionals
+	are kept with each edge so GraphHandler.replay can prune the graph
+	for any set of attributes."""
+
+	def __init__(self, attrs, directories=[ '.' ]):
+		GraphHandler.__init__(self, attrs, False, directories)
+		self.edges  = []
+		self.orders = []
+		self.cond   = None
+
+	def endElement_to(self, name):
+		self.cond = self.attrs.main.cond
+		GraphHandler.endElement_to(self, name)
+		self.cond = None
+
+	def endElement_from(self, name):
+		self.cond = self.attrs.main.cond
+		GraphHandler.endElement_from(self, name)
+		self.cond = None
+
+	def addEdge(self):
+		self.edges.append((self.attrs.main.parent,
+				   self.attrs.main.child,
+				   self.attrs.main.default.cond,
+				   self.cond))
+
+	def addOrder(self):
+		self.orders.append((self.attrs.order.head,
+				    self.attrs.order.tail,
+				    self.attrs.order.gen))
+
+
+class GraphCache:
+	"""Cache of the parsed graph files of a list of directories, and
+	of the graph traversals.  Entries are kept in memory (for long
+	running processes) and on disk, and are invalidated when any of
+	the graph files change.
+
+	Parsing the graph only depends on the attributes referenced as
+	entities in the graph files, pruning and traversing the graph
+	depends on the values of the edge conditionals.  Both are part of
+	the cache key."""
+
+	path	= '/dev/shm/stack-graphcache'
+	entries = {}
+
+	_entityRE = re.compile(r'&([^;&#\s]+);')
+	_builtins = [ 'amp', 'lt', 'gt', 'quot', 'apos' ]
+
+	def __init__(self, directories):
+		self.directories = directories
+		self.key	 = hashlib.md5('\0'.join(directories).encode()).hexdigest()
+
+	def stamp(self):
+		stamp = []
+		for dir in self.directories:
+			graph = os.path.join(dir, 'graph')
+			if not os.path.isdir(graph):
+				continue
+			files = []
+			for file in sorted(os.listdir(graph)):
+				if os.path.splitext(file)[1] != '.xml':
+					continue
+				st = os.stat(os.path.join(graph, file))
+				files.append((file, st.st_mtime_ns, st.st_size))
+			stamp.append((graph, files))
+		return stamp
+
+	def parse(self, attrs):
+		handler  = GraphRecorder(attrs, self.directories)
+		entities = {}
+
+		for dir in self.directories:
+			graph = os.path.join(dir, 'graph')
+			if not os.path.exists(graph):
+				continue
+
+			for file in os.listdir(graph):
+				base, ext = os.path.splitext(file)
+				if ext != '.xml':
+					continue
+
+				with open(os.path.join(graph, file), 'r') as xml:
+					lines = []
+					for line in xml.readlines():
+						if line.find('<?xml') != -1:
+							continue
+						lines.append(line)
+				text = ''.join(lines)
+
+				for entity in self._entityRE.findall(text):
+					if entity not in self._builtins:
+						entities[entity] = attrs.get(entity)
+
+				parser = make_parser(["stack.expatreader"])
+				parser.setContentHandler(handler)
+				parser.feed(handler.getXMLHeader())
+				parser.feed(text)
+
+		# Every distinct conditional on the <to>/<from> edges, the
+		# outcome of each is the key of the traversal cache.
+
+		prunes = []
+		for (parent, child, cond, prune) in handler.edges:
+			if prune is not None and prune not in prunes:
+				prunes.append(prune)
+
+		return { 'entities'  : entities,
+			 'edges'     : handler.edges,
+			 'orders'    : handler.orders,
+			 'prunes'    : prunes,
+			 'order'     : None,
+			 'framework' : {} }
+
+	def load(self, stamp):
+		entry = GraphCache.entries.get(self.key)
+		if entry and entry['stamp'] == stamp:
+			return entry
+
+		entry = ReadCache(self.path, self.key)
+		if not entry:
+			return None
+
+		if entry['stamp'] != stamp:
+			return None
+		GraphCache.entries[self.key] = entry
+		return entry
+
+	def save(self, entry):
+		GraphCache.entries[self.key] = entry
+		WriteCache(self.path, self.key, entry)
+
+	def traverse(self, handler, root):
+		"""Returns the traversal of the HANDLER's graphs rooted at
+		ROOT, the same (nodes, deps) lists as FrameworkIterator and
+		OrderIterator, or None if ROOT is not in the graph.  Every
+		node is a new Node object."""
+
+		attrs = handler.attributes
+		stamp = self.stamp()
+		entry = self.load(stamp)
+
+		if entry:
+			for (entity, value) in entry['entities'].items():
+				if attrs.get(entity) != value:
+					entry = None
+					break
+		if not entry:
+			entry = self.parse(attrs)
+			entry['stamp'] = stamp
+			self.save(entry)
+
+		dirty = False
+
+		if entry['order'] is None:
+			graph = GraphHandler(attrs, handler.prune, self.directories)
+			graph.replay([], entry['orders'])
+			entry['order'] = [ (node.name, gen) for (node, gen) in 
+					   OrderIterator(graph.getOrderGraph()).run() ]
+			dirty = True
+
+		prunes = []
+		if handler.prune:
+			for cond in entry['prunes']:
+				if stack.cond.EvalCondExpr(cond, attrs):
+					prunes.append(True)
+				else:
+					prunes.append(False)
+		key = '%s %s' % (root, prunes)
+
+		if key not in entry['framework']:
+			graph = GraphHandler(attrs, handler.prune, self.directories)
+			graph.replay(entry['edges'], [])
+			main = graph.getMainGraph()
+			if main.hasNode(root):
+				entry['framework'][key] = [ (node.name, cond) for (node, cond) in
+							    FrameworkIterator(main).run(main.getNode(root)) ]
+			else:
+				entry['framework'][key] = None
+			dirty = True
+
+		if dirty:
+			self.save(entry)
+
+		if entry['framework'][key] is None:
+			return None
+
+		nodes = []
+		for (name, cond) in entry['framework'][key]:
+			nodes.append((Node(name), cond))
+		deps = []
+		for (name, gen) in entry['order']:
+			deps.append((Node(name), gen))
+
+		return (nodes, deps)
+
+
 class NodeHandler(handler.ContentHandler,
 		  handler.DTDHandler,
 		  handler.EntityResolver,
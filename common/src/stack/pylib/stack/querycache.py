@@ -0,0 +1,352 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Cross-process cache for the results of DatabaseConnection.select().
+#
+# Every entry records the generation of each table its query read.  The
+# generations live in a small mmap'd file shared by all processes and
+# are bumped by DatabaseConnection.execute() after each write, and again
+# when the transaction the write was part of ends, so a write to one
+# table only invalidates the queries that read that table.
+#
+# The cache directory and the generations file are created by root.
+# The generations can only be bumped by root and the Group (the users
+# the database is written as), everyone else runs without the shared
+# cache.  Each user keeps their entries in their own directory, one
+# for each database user they connect as since what a query returns
+# depends on the database user's permissions.
+
+import os
+import re
+import grp
+import mmap
+import stat
+import time
+import fcntl
+import struct
+import marshal
+import zlib
+import tempfile
+
+CacheDir = '/dev/shm/stack-querycache'
+Group	 = 'apache'
+
+# Entries not written for MaxAge seconds are removed, as are the oldest
+# entries once a user's entries use more than MaxBytes.  Each user's
+# entries are checked at most once every PruneInterval seconds.
+
+MaxAge	      = 600
+MaxBytes      = 64 * 1024 * 1024
+PruneInterval = 60
+
+# Layout of the generations file, an array of unsigned 64-bit
+# counters.  Table names are hashed into the table slots, a collision
+# only costs an unneeded invalidation.
+
+GLOBAL	      = 0	# bumped by writes to unknown tables
+WRITES	      = 1	# bumped by every write
+HITS	      = 2
+MISSES	      = 3
+INVALIDATIONS = 4
+TABLES	      = 5
+SLOTS	      = 1024
+
+_counter = struct.Struct('Q')
+
+_tableRE = re.compile(r'\b(?:from|join|into|update|table|truncate)\s+'
+		      r'((?:`?\w+`?(?:\s+(?:as\s+)?\w+)?\s*,\s*)*`?\w+`?)',
+		      re.IGNORECASE)
+
+_userRE = re.compile(r'^\w+$')
+
+_readonly = [ 'select', 'show', 'describe', 'desc', 'explain', 'set', 'use' ]
+
+_transaction = { 'begin'   : 'begin',
+		 'start'   : 'begin',
+		 'commit'  : 'end',
+		 'rollback': 'end' }
+
+
+def Tables(command):
+	"""Returns the set of table names referenced by the SQL COMMAND,
+	or None if they cannot be determined."""
+
+	tables = set()
+	for match in _tableRE.findall(command):
+		for table in match.split(','):
+			tokens = table.split()
+			if tokens:
+				tables.add(tokens[0].strip('`').lower())
+	if not tables:
+		return None
+	return tables
+
+
+def IsWrite(command):
+	"""Returns True if the SQL COMMAND can modify the database."""
+
+	tokens = command.split(None, 1)
+	if not tokens:
+		return False
+	verb = tokens[0].lower()
+	return verb not in _readonly and verb not in _transaction
+
+
+def Transaction(command):
+	"""Returns 'begin' if the SQL COMMAND starts a transaction, 'end'
+	if it commits or rolls one back, otherwise None."""
+
+	tokens = command.split(None, 1)
+	if not tokens:
+		return None
+	return _transaction.get(tokens[0].lower())
+
+
+class QueryCache:
+	"""Query cache shared by all the processes of one user connected
+	as the same database USER.  Entries are files in a per-user
+	directory, the generation counters are shared by all users since
+	any of them can write to the database.  Raises OSError if this
+	process cannot use the cache.
+	"""
+
+	def __init__(self, path=CacheDir, user=None):
+		uid = os.geteuid()
+
+		self.path    = path
+		self.entries = os.path.join(path, '%d' % uid)
+		if user is not None:
+			if not _userRE.match(user):
+				raise OSError('bad database user %s' % user)
+			self.entries += '.%s' % user
+
+		# Like /tmp, anyone can add their own directory but only
+		# root (or the owner of a private cache) owns the rest.
+
+		if uid == 0 and not os.path.exists(path):
+			os.mkdir(path, 0o755)
+		owner = self.check(path, uid)
+		if owner == 0 and uid == 0:
+			os.chmod(path, 0o1777)
+
+		filename = os.path.join(path, 'generations')
+		if owner == uid:
+			fd   = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+			mode = 0o600
+			if uid == 0:
+				try:
+					os.fchown(fd, 0, grp.getgrnam(Group).gr_gid)
+					mode = 0o660
+				except KeyError:
+					pass
+			os.fchmod(fd, mode)
+		else:
+			fd = os.open(filename, os.O_RDWR)
+		try:
+			self.check(filename, uid, fd)
+			try:
+				os.mkdir(self.entries, 0o700)
+			except FileExistsError:
+				pass
+			if self.check(self.entries, uid) != uid:
+				raise OSError('%s is not owned by %d' %
+					      (self.entries, uid))
+			os.chmod(self.entries, 0o700)
+		except OSError:
+			os.close(fd)
+			raise
+
+		size = (TABLES + SLOTS) * _counter.size
+		if os.fstat(fd).st_size < size:
+			os.ftruncate(fd, size)
+		self.fd	 = fd
+		self.map = mmap.mmap(fd, size)
+
+	@staticmethod
+	def check(filename, uid, fd=None):
+		"""Returns the owner of FILENAME.  Raises OSError unless
+		it is owned by root or UID and only the owner (or the
+		sticky bit) keeps others from replacing it."""
+
+		if fd is None:
+			st = os.lstat(filename)
+		else:
+			st = os.fstat(fd)
+		if st.st_uid not in (0, uid):
+			raise OSError('%s is not owned by root' % filename)
+		if st.st_mode & stat.S_IWOTH and not (stat.S_ISDIR(st.st_mode) and
+						      st.st_mode & stat.S_ISVTX):
+			raise OSError('%s is writable by anyone' % filename)
+		return st.st_uid
+
+	def close(self):
+		self.map.close()
+		os.close(self.fd)
+
+
+	def slot(self, table):
+		return TABLES + (zlib.crc32(table.encode()) % SLOTS)
+
+	def read(self, slot):
+		return _counter.unpack_from(self.map, slot * _counter.size)[0]
+
+	def count(self, slot):
+		"""Adds one to the statistics counter SLOT.  Not locked,
+		a concurrent update can be lost but readers never wait on
+		each other."""
+
+		offset = slot * _counter.size
+		value  = _counter.unpack_from(self.map, offset)[0]
+		_counter.pack_into(self.map, offset, value + 1)
+
+	def bump(self, slots):
+		fcntl.lockf(self.fd, fcntl.LOCK_EX)
+		try:
+			for slot in slots:
+				offset = slot * _counter.size
+				value  = _counter.unpack_from(self.map, offset)[0]
+				_counter.pack_into(self.map, offset, value + 1)
+		finally:
+			fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+	def stamp(self, tables):
+		"""Returns the current generations of the TABLES.  Take
+		the stamp before running a query so a concurrent write
+		always invalidates the result."""
+
+		# Queries whose tables could not be determined depend on
+		# every write.
+
+		if tables is None:
+			slots = [ (WRITES, self.read(WRITES)) ]
+		else:
+			slots = []
+			for table in sorted(tables):
+				slot = self.slot(table)
+				slots.append((slot, self.read(slot)))
+		return (self.read(GLOBAL), slots)
+
+	def valid(self, stamp):
+		(generation, slots) = stamp
+		if self.read(GLOBAL) != generation:
+			return False
+		for (slot, value) in slots:
+			if self.read(slot) != value:
+				return False
+		return True
+
+
+	def get(self, key):
+		"""Returns the cached rows for KEY or None."""
+
+		filename = os.path.join(self.entries, key)
+		try:
+			with open(filename, 'rb') as fin:
+				(stamp, rows) = marshal.load(fin)
+		except (OSError, EOFError, ValueError, TypeError):
+			self.count(MISSES)
+			return None
+
+		if not self.valid(stamp):
+			self.count(INVALIDATIONS)
+			try:
+				os.unlink(filename)
+			except OSError:
+				pass
+			return None
+
+		self.count(HITS)
+		return rows
+
+	def put(self, key, stamp, rows):
+		"""Stores the ROWS for KEY.  Rows that cannot be
+		marshalled are not cached."""
+
+		try:
+			data = marshal.dumps((stamp, rows))
+		except ValueError:
+			return
+
+		fd, tmp = tempfile.mkstemp(dir=self.entries)
+		with os.fdopen(fd, 'wb') as fout:
+			fout.write(data)
+		os.rename(tmp, os.path.join(self.entries, key))
+
+		self.prune()
+
+	def prune(self, now=None):
+		"""Removes the entries older than MaxAge, then the oldest
+		entries until they use no more than MaxBytes.  Does nothing
+		if the entries were checked in the last PruneInterval
+		seconds."""
+
+		if now is None:
+			now = time.time()
+
+		marker = os.path.join(self.entries, '.pruned')
+		try:
+			if now - os.stat(marker).st_mtime < PruneInterval:
+				return
+		except OSError:
+			pass
+		with open(marker, 'a'):
+			os.utime(marker, (now, now))
+
+		entries = []
+		for filename in os.listdir(self.entries):
+			if filename.startswith('.'):
+				continue
+			filename = os.path.join(self.entries, filename)
+			try:
+				st = os.stat(filename)
+			except OSError:
+				continue
+			entries.append((st.st_mtime, st.st_size, filename))
+		entries.sort()
+
+		size = sum([ e[1] for e in entries ])
+		for (mtime, length, filename) in entries:
+			if mtime > now - MaxAge and size <= MaxBytes:
+				break
+			try:
+				os.unlink(filename)
+			except OSError:
+				pass
+			size -= length
+
+	def invalidate(self, tables):
+		"""Called after a write to TABLES.  If the tables are not
+		known (None) every entry is invalidated."""
+
+		if tables is None:
+			self.bump([ GLOBAL, WRITES ])
+		else:
+			slots = set([ WRITES ])
+			for table in tables:
+				slots.add(self.slot(table))
+			self.bump(sorted(slots))
+
+
+	def stats(self):
+		"""Returns a dictionary of the cache statistics."""
+
+		entries = 0
+		size	= 0
+		for filename in os.listdir(self.entries):
+			if filename.startswith('.'):
+				continue
+			try:
+				size += os.path.getsize(os.path.join(self.entries, filename))
+				entries += 1
+			except OSError:
+				pass
+
+		return { 'hits'		 : self.read(HITS),
+			 'misses'	 : self.read(MISSES),
+			 'invalidations' : self.read(INVALIDATIONS),
+			 'entries'	 : entries,
+			 'bytes'	 : size }
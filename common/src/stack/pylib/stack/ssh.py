@@ -0,0 +1,157 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import time
+import threading
+import subprocess
+
+
+class ControlPool:
+	"""
+	Pool of multiplexed SSH connections, one ControlMaster for each
+	host.  Every ssh started with the options() of the host runs as
+	a new session over the existing connection of the host instead
+	of doing its own handshake.
+
+	The control sockets live on disk so the connections are shared
+	by all the commands (and processes) within the persist time.  A
+	master exits by itself after being idle for PERSIST seconds,
+	keep it short since every master is a process (and a socket) on
+	this machine.  The master of a host is checked before it is used
+	and restarted if it died.  If the master cannot be started, or
+	does not answer the check, the ssh just makes a connection of
+	its own.  Only the owner of the directory (root) can use the
+	pool, everyone else always makes their own connections.
+	"""
+
+	def __init__(self, directory='/var/run/stack/ssh', persist=30,
+		     timeout=10, recheck=30):
+		self.directory = directory
+		self.persist   = persist
+		self.timeout   = timeout
+		self.recheck   = recheck
+		self.checked   = {}
+		self.locks     = {}
+		self.lock      = threading.Lock()
+		self.usable    = None
+
+	def path(self, host):
+		return os.path.join(self.directory, host)
+
+	def ready(self):
+		"""
+		Returns True if the control directory can be used.
+		"""
+		if not self.directory:
+			return False
+		if self.usable is None:
+			try:
+				os.makedirs(os.path.dirname(self.directory),
+					    exist_ok=True)
+				try:
+					os.mkdir(self.directory, 0o700)
+				except FileExistsError:
+					pass
+				self.usable = os.stat(self.directory).st_uid == os.geteuid()
+			except OSError:
+				self.usable = False
+		return self.usable
+
+	def options(self, host):
+		"""
+		Returns the ssh options to multiplex over the connection
+		of HOST.
+		"""
+		if not self.ready():
+			return []
+		return [ '-o', 'ControlMaster=no',
+			 '-o', 'ControlPath=%s' % self.path(host) ]
+
+	def control(self, host, *args, timeout=None):
+		if timeout is None:
+			timeout = self.timeout
+		return subprocess.call([ 'ssh', '-o', 'ControlPath=%s' %
+					 self.path(host) ] + list(args) + [ host ],
+				       stdin=subprocess.DEVNULL,
+				       stdout=subprocess.DEVNULL,
+				       stderr=subprocess.DEVNULL,
+				       timeout=timeout)
+
+	def check(self, host, timeout=None):
+		"""
+		Returns True if the master of HOST is up, False if it is
+		not, and None if it did not answer in time (it could just
+		be busy).  A good check is trusted for RECHECK seconds.
+		"""
+		if time.time() - self.checked.get(host, 0) < self.recheck:
+			return True
+		if not os.path.exists(self.path(host)):
+			return False
+		try:
+			if self.control(host, '-O', 'check', timeout=timeout) != 0:
+				return False
+		except subprocess.TimeoutExpired:
+			return None
+		self.checked[host] = time.time()
+		return True
+
+	def connect(self, host, start=True, timeout=None):
+		"""
+		Starts the master of HOST if it is not up already (and
+		START is set).  Gives up after TIMEOUT seconds, the pool
+		timeout by default.  Returns True if the host has a master,
+		only then use the options() of the host.
+		"""
+		if not self.ready():
+			return False
+		if timeout is None:
+			timeout = self.timeout
+		deadline = time.time() + timeout
+
+		with self.lock:
+			if host not in self.locks:
+				self.locks[host] = threading.Lock()
+			lock = self.locks[host]
+
+		with lock:
+			up = self.check(host, timeout)
+			if up or up is None or not start:
+				return bool(up)
+
+			# The master went away without removing its
+			# socket.
+
+			self.checked.pop(host, None)
+			try:
+				os.unlink(self.path(host))
+			except OSError:
+				pass
+
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				return False
+			try:
+				self.control(host, '-M', '-N', '-f', '-T', '-x',
+					     '-o', 'ControlPersist=%d' % self.persist,
+					     '-o', 'BatchMode=yes',
+					     '-o', 'ConnectTimeout=%d' % max(1, remaining),
+					     timeout=remaining)
+			except (OSError, subprocess.TimeoutExpired):
+				return False
+
+			return bool(self.check(host, max(1, deadline - time.time())))
+
+	def close(self, host):
+		"""
+		Stops the master of HOST.
+		"""
+		self.checked.pop(host, None)
+		if os.path.exists(self.path(host)):
+			try:
+				self.control(host, '-O', 'exit')
+			except subprocess.TimeoutExpired:
+				pass
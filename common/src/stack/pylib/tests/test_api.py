@@ -0,0 +1,159 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import sys
+import time
+import types
+import subprocess
+import stack.api
+from stack.api import Call, ReturnCode
+
+CALLS = 1000
+
+
+class Command:
+	"""
+	Stand-in for the stack commands:
+
+		list thing	one row for each argument
+		report thing	prints and returns a line of text
+		exit thing	exits, like a command that calls Abort
+	"""
+
+	def __init__(self, database):
+		self.database = database
+		self.rows     = None
+		self.text     = ''
+
+	def runWrapper(self, name, args):
+		if name == 'list thing':
+			self.rows = [ { 'thing': a } for a in args
+				      if not a.startswith('output-format=') ]
+		elif name == 'report thing':
+			print('printed')
+			self.text = 'text\n'
+		else:
+			sys.exit(1)
+		return True
+
+	def getText(self):
+		return self.text
+
+
+class Connection:
+
+	def __init__(self):
+		self.alive = True
+
+	def ping(self, reconnect=False):
+		if not self.alive:
+			raise OSError('gone')
+
+
+def test_run(monkeypatch):
+	monkeypatch.setattr(stack.api, '__stack__', __file__)
+	monkeypatch.setattr(stack.api, 'Database', Connection())
+	monkeypatch.setattr(stack.api, 'Commands', {
+		('list', 'thing')   : ('list thing', Command, 2),
+		('report', 'thing') : ('report thing', Command, 2),
+		('exit', 'thing')   : ('exit thing', Command, 2),
+		})
+
+	assert Call('list thing', [ 'a', 'b' ]) == [ { 'thing': 'a' },
+						     { 'thing': 'b' } ]
+	assert ReturnCode() == 0
+	assert Call('report thing') == [ 'text', 'printed', '' ]
+	assert ReturnCode() == 0
+
+	# SystemExit is a failed command, not the end of the caller
+
+	assert Call('exit thing') == []
+	assert ReturnCode() == 255
+
+
+def test_connect(monkeypatch):
+	now	 = [ 1000.0 ]
+	attempts = []
+
+	class OperationalError(Exception):
+		pass
+
+	def connect(**kwargs):
+		attempts.append(kwargs)
+		if len(attempts) == 1:
+			raise OperationalError()
+		return Connection()
+
+	pymysql = types.ModuleType('pymysql')
+	pymysql.connect = connect
+	pymysql.err	= types.SimpleNamespace(OperationalError=OperationalError)
+
+	monkeypatch.setitem(sys.modules, 'pymysql', pymysql)
+	monkeypatch.setitem(sys.modules, 'stack.commands',
+			    types.ModuleType('stack.commands'))
+	monkeypatch.setattr(stack.api, 'time',
+			    types.SimpleNamespace(time=lambda: now[0]))
+	monkeypatch.setattr(stack.api, 'Database', None)
+	monkeypatch.setattr(stack.api, 'Retry', 0)
+
+	# a failed connect is not retried right away ...
+
+	assert stack.api.connect() is None
+	assert stack.api.connect() is None
+	assert len(attempts) == 1
+
+	# ... but after RetryInterval
+
+	now[0] += stack.api.RetryInterval
+	database = stack.api.connect()
+	assert database
+	assert stack.api.connect() is database
+	assert len(attempts) == 2
+
+	# same for a connection that went away
+
+	database.alive = False
+	assert stack.api.connect() is None
+	assert stack.api.connect() is None
+	now[0] += stack.api.RetryInterval
+	assert stack.api.connect()
+	assert len(attempts) == 3
+
+
+def test_api_scale(monkeypatch):
+	"""
+	Compare running the same list command in-process and by
+	forking the stack command line.  Needs a stack database.
+	"""
+
+	if not stack.api.connect():
+		return
+
+	forks = []
+	popen = subprocess.Popen
+	def fork(*args, **kwargs):
+		forks.append(args)
+		return popen(*args, **kwargs)
+	monkeypatch.setattr(subprocess, 'Popen', fork)
+
+	results = {}
+	for inprocess in (True, False):
+		monkeypatch.setattr(stack.api, '__inprocess__', inprocess)
+		t0 = time.time()
+		for i in range(0, CALLS):
+			result = Call('list host attr', [ 'localhost', 'attr=os' ])
+			assert ReturnCode() == 0
+		t1 = time.time()
+		results[inprocess] = result
+		print('%d x list host attr %s (%.3fs)' %
+		      (CALLS, 'in-process' if inprocess else 'subprocess',
+		       t1 - t0))
+
+		# in-process nothing is forked
+
+		assert len(forks) == (0 if inprocess else CALLS)
+
+	assert results[True] == results[False]
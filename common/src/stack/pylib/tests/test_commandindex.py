@@ -0,0 +1,49 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commandindex
+
+
+def command(tmpdir, path, source):
+	d = tmpdir.join(*path.split('.'))
+	d.ensure(dir=True)
+	d.join('__init__.py').write(source)
+
+
+def test_index(tmpdir, monkeypatch):
+	command(tmpdir, 'list', 'class command:\n\tpass\n')
+	command(tmpdir, 'list.host', 'class Command(command):\n\tpass\n')
+	command(tmpdir, 'list.host.attr', 'class Command(command):\n\tpass\n')
+
+	index = stack.commandindex.Write(str(tmpdir))
+	assert index == { 'list': False, 'list.host': True,
+			  'list.host.attr': True }
+
+	monkeypatch.setattr(stack.commandindex, '_directory', str(tmpdir))
+	monkeypatch.setattr(stack.commandindex, '_index', None)
+	assert stack.commandindex.Load() == index
+
+	Lookup = stack.commandindex.Lookup
+	assert Lookup([ 'list', 'host', 'attr', 'backend-0-0' ]) == \
+		('stack.commands.list.host.attr', 3)
+	assert Lookup([ 'list', 'host', 'backend-0-0' ]) == \
+		('stack.commands.list.host', 2)
+	assert Lookup([ 'list' ]) == ('stack.commands.list', 1)
+	assert Lookup([ 'bogus' ]) is None
+
+	# commands the index does not know about (another pallet's),
+	# the index is rebuilt when the directory can be written
+
+	command(tmpdir, 'list.host.route', 'class Command(command):\n\tpass\n')
+	command(tmpdir, 'report', 'class command:\n\tpass\n')
+	command(tmpdir, 'report.host', 'class Command(command):\n\tpass\n')
+	assert Lookup([ 'list', 'host', 'route', 'backend-0-0' ], False) is None
+	assert Lookup([ 'report', 'host' ], False) is None
+
+	assert Lookup([ 'list', 'host', 'route', 'backend-0-0' ]) == \
+		('stack.commands.list.host.route', 3)
+	assert Lookup([ 'report', 'host' ]) == ('stack.commands.report.host', 2)
+	assert Lookup([ 'bogus' ]) is None
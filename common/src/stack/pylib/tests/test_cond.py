@@ -4,7 +4,7 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
-from stack.cond import EvalCondExpr
+from stack.cond import EvalCondExpr, CondAttrs, CompileCondExpr
 
 attrs = {
 	'a'  : 'foo',
@@ -27,3 +27,20 @@ def test_dot():
 
 	assert(EvalCondExpr("'bb.aa' in p.a", attrs))
 
+
+
+def test_attrs():
+
+	assert(CondAttrs(None) == set())
+	assert(CondAttrs("a == 'foo.bar'") == set([ 'a' ]))
+	assert(CondAttrs("a.b == 'bar' and 'bb' in p.a") == set([ 'a.b', 'p.a' ]))
+	assert(CondAttrs("a ==") is None)
+
+
+def test_compile():
+
+	expr = CompileCondExpr("a.b == 'bar' and b == 'foo.bar'")
+	assert(expr is CompileCondExpr("a.b == 'bar' and b == 'foo.bar'"))
+	assert(expr.attrs == set([ 'a.b', 'b' ]))
+	assert(expr.eval(attrs))
+	assert(not expr.eval({}))
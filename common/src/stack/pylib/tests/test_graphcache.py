@@ -0,0 +1,109 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import stack.profile
+from xml.sax import make_parser
+
+graph = """<?xml version="1.0" standalone="no"?>
+<graph>
+	<order head="HEAD"><tail>base</tail></order>
+	<order head="server" tail="TAIL" gen="kgen"/>
+	<edge from="client" to="base"/>
+	<edge from="server" cond="release"><to>base</to><to cond="release == '&release;'">extra</to></edge>
+	<edge from="backend" cond="os"><to>client</to><to cond="appliance == 'backend'">gpu</to></edge>
+	<edge from="gpu" to="cuda" cond="os == 'redhat'"/>
+</graph>
+"""
+
+
+def parse(attrs, root, directories):
+	"""
+	Parse and traverse the graph the way list node xml used to.
+	"""
+
+	handler = stack.profile.GraphHandler(attrs, directories=directories)
+	for dir in directories:
+		for file in os.listdir(os.path.join(dir, 'graph')):
+			parser = make_parser(["stack.expatreader"])
+			parser.setContentHandler(handler)
+			parser.feed(handler.getXMLHeader())
+			with open(os.path.join(dir, 'graph', file), 'r') as xml:
+				for line in xml.readlines():
+					if line.find('<?xml') == -1:
+						parser.feed(line)
+
+	main = handler.getMainGraph()
+	if not main.hasNode(root):
+		return None
+	nodes = stack.profile.FrameworkIterator(main).run(main.getNode(root))
+	deps  = stack.profile.OrderIterator(handler.getOrderGraph()).run()
+	return names((nodes, deps))
+
+
+def names(result):
+	if result is None:
+		return None
+	(nodes, deps) = result
+	return ([ (n.name, c) for (n, c) in nodes ],
+		[ (n.name, g) for (n, g) in deps ])
+
+
+def test_graphcache(tmp_path):
+	os.makedirs(str(tmp_path / 'pallet' / 'graph'))
+	with open(str(tmp_path / 'pallet' / 'graph' / 'default.xml'), 'w') as fout:
+		fout.write(graph)
+
+	stack.profile.GraphCache.path = str(tmp_path / 'cache')
+	directories = [ str(tmp_path / 'pallet') ]
+
+	for attrs in [ { 'os': 'redhat', 'appliance': 'backend', 'release': '7' },
+		       { 'os': 'sles',   'appliance': 'backend', 'release': '8' },
+		       { 'os': 'sles',   'appliance': 'compute', 'release': '7' } ]:
+		for root in [ 'server', 'backend', 'missing' ]:
+
+			# First from memory then from the disk.
+
+			for i in range(0, 2):
+				handler = stack.profile.GraphHandler(attrs, directories=directories)
+				cache   = stack.profile.GraphCache(directories)
+				result  = cache.traverse(handler, root)
+				assert names(result) == parse(attrs, root, directories)
+				stack.profile.GraphCache.entries.clear()
+
+
+node = """<?xml version="1.0" standalone="no"?>
+<stack:stack>
+	<stack:package>foo-&release;</stack:package>
+	<stack:script stack:stage="install-post">
+	echo &hostname; &gt; /tmp/name
+	</stack:script>
+</stack:stack>
+"""
+
+
+def test_nodecache(tmp_path):
+	os.makedirs(str(tmp_path / 'pallet' / 'nodes'))
+	with open(str(tmp_path / 'pallet' / 'nodes' / 'foo.xml'), 'w') as fout:
+		fout.write(node)
+
+	stack.profile.NodeCache.path = str(tmp_path / 'cache')
+	directories = [ str(tmp_path / 'pallet') ]
+
+	output = {}
+	for hostname in [ 'backend-0-0', 'backend-0-1', 'backend-0-0' ]:
+		attrs   = { 'os': 'redhat', 'release': '7', 'hostname': hostname }
+		handler = stack.profile.GraphHandler(attrs, directories=directories)
+		n	= stack.profile.Node('foo')
+		handler.parseNode(n)
+		assert hostname in n.getXML()
+		assert n.getFilename().endswith('foo.xml')
+
+		if hostname in output:
+			assert output[hostname] == (n.getXML(), handler.nsAttrs())
+		output[hostname] = (n.getXML(), handler.nsAttrs())
+
+	assert len(stack.profile.NodeCache.entries) == 2
@@ -0,0 +1,136 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import stat
+import time
+import stack.querycache
+from stack.querycache import QueryCache, Tables, IsWrite, Transaction
+
+
+def test_tables():
+
+	assert Tables("n.name, a.name from nodes n, appliances a where n.appliance = a.id") == { 'nodes', 'appliances' }
+	assert Tables("n.name from nodes n left join environments e on n.environment=e.id") == { 'nodes', 'environments' }
+	assert Tables("insert into attributes (attr, value) values ('a', 'b')") == { 'attributes' }
+	assert Tables("update nodes set rack=0 where name='backend-0-0'") == { 'nodes' }
+	assert Tables("delete from attributes where scope='global'") == { 'attributes' }
+	assert Tables("now()") is None
+
+	assert IsWrite("insert into attributes values ('a')")
+	assert IsWrite("delete from nodes")
+	assert not IsWrite("select * from nodes")
+	assert not IsWrite("commit")
+
+	assert Transaction("start transaction") == 'begin'
+	assert Transaction("rollback") == 'end'
+	assert Transaction("COMMIT") == 'end'
+	assert Transaction("delete from nodes") is None
+
+
+def test_invalidate(tmp_path):
+
+	# Two caches on the same directory stand in for two processes.
+
+	a = QueryCache(str(tmp_path))
+	b = QueryCache(str(tmp_path))
+
+	nodes = Tables('name from nodes')
+	attrs = Tables('attr from attributes')
+
+	a.put('nodes', a.stamp(nodes), ((1, 'backend-0-0'), ))
+	a.put('attrs', a.stamp(attrs), ((1, 'managed'), ))
+	a.put('other', a.stamp(None),  ((1, ), ))
+	assert b.get('nodes') == ((1, 'backend-0-0'), )
+
+	b.invalidate(Tables("update attributes set value='false'"))
+	assert a.get('nodes') == ((1, 'backend-0-0'), )
+	assert a.get('attrs') is None
+	assert a.get('other') is None
+
+	b.invalidate(None)
+	assert a.get('nodes') is None
+
+	stats = a.stats()
+	assert stats['hits'] == 2
+	assert stats['misses'] == 0
+	assert stats['invalidations'] == 3
+
+
+def test_users(tmp_path):
+
+	# what a query returns depends on the database user, one of them
+	# never gets the rows cached by another
+
+	path   = str(tmp_path)
+	apache = QueryCache(path, 'apache')
+	nobody = QueryCache(path, 'nobody')
+	assert apache.entries != nobody.entries
+
+	nodes = Tables('name from nodes')
+	apache.put('nodes', apache.stamp(nodes), ((1, 'backend-0-0'), ))
+	assert nobody.get('nodes') is None
+	assert QueryCache(path, 'apache').get('nodes') == ((1, 'backend-0-0'), )
+
+	try:
+		QueryCache(path, '../apache')
+		assert False
+	except OSError:
+		pass
+
+
+def test_permissions(tmp_path):
+
+	path = str(tmp_path)
+	generations = os.path.join(path, 'generations')
+
+	# an existing generations file anyone can write is fixed up by
+	# its owner
+
+	with open(generations, 'wb'):
+		pass
+	os.chmod(generations, 0o666)
+
+	cache = QueryCache(path)
+	assert not os.stat(generations).st_mode & stat.S_IWOTH
+	assert stat.S_IMODE(os.stat(cache.entries).st_mode) == 0o700
+	cache.close()
+
+	# a cache directory someone else could have replaced is not used
+
+	if os.geteuid() != 0:
+		os.chmod(path, 0o777)
+		try:
+			QueryCache(path)
+			assert False
+		except OSError:
+			pass
+
+
+def test_prune(tmp_path, monkeypatch):
+
+	cache = QueryCache(str(tmp_path))
+	now   = time.time() + stack.querycache.PruneInterval + 10
+
+	# old entries go first, then the oldest until under MaxBytes
+
+	for i in range(0, 10):
+		cache.put('entry.%d' % i, cache.stamp(None), 'x' * 200)
+		t = now - stack.querycache.MaxAge - 1 if i == 0 else now - 100 + i
+		os.utime(os.path.join(cache.entries, 'entry.%d' % i), (t, t))
+	size = cache.stats()['bytes'] // 10
+	monkeypatch.setattr(stack.querycache, 'MaxBytes', 4 * size)
+
+	cache.prune(now)
+	assert sorted(os.listdir(cache.entries)) == [ '.pruned' ] + \
+		[ 'entry.%d' % i for i in range(6, 10) ]
+
+	# not checked again for PruneInterval seconds
+
+	cache.put('entry.10', cache.stamp(None), 'x' * 200)
+	assert cache.stats()['entries'] == 5
+	cache.prune(now + stack.querycache.PruneInterval)
+	assert cache.stats()['entries'] == 4
@@ -0,0 +1,93 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+from stack.ssh import ControlPool
+
+# Fake ssh: a master creates the control socket unless the host is
+# down, '-O check' tests for it and '-O exit' removes it.
+
+SSH = """#!/bin/sh
+echo "$@" >> %s
+for arg; do
+	case $arg in
+	ControlPath=*)	path=${arg#ControlPath=} ;;
+	-M)		mode=master ;;
+	check|exit)	mode=$arg ;;
+	esac
+	host=$arg
+done
+case $mode in
+master)	test $host = down || touch $path ;;
+check)	test $host = hung && sleep 5 ; test -e $path ;;
+exit)	rm -f $path ;;
+esac
+"""
+
+
+def test_pool(tmpdir, monkeypatch):
+	log = tmpdir.join('log')
+	ssh = tmpdir.join('ssh')
+	ssh.write(SSH % log)
+	ssh.chmod(0o755)
+	monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+
+	def calls():
+		if not log.check():
+			return 0
+		return len(log.readlines())
+
+	pool = ControlPool(str(tmpdir.join('control')))
+	assert pool.options('backend-0-0') == [
+		'-o', 'ControlMaster=no',
+		'-o', 'ControlPath=%s' % tmpdir.join('control', 'backend-0-0') ]
+
+	# master is started once and then checked every RECHECK
+	# seconds
+
+	assert pool.connect('backend-0-0')
+	assert calls() == 2
+	assert pool.connect('backend-0-0')
+	assert calls() == 2
+
+	pool.recheck = 0
+	assert pool.connect('backend-0-0')
+	assert calls() == 3
+
+	# a dead master is restarted
+
+	os.unlink(pool.path('backend-0-0'))
+	assert pool.connect('backend-0-0')
+	assert os.path.exists(pool.path('backend-0-0'))
+
+	pool.close('backend-0-0')
+	assert not os.path.exists(pool.path('backend-0-0'))
+
+	assert not pool.connect('down')
+
+	# only checked, not started
+
+	assert not pool.connect('backend-0-1', start=False)
+	assert not os.path.exists(pool.path('backend-0-1'))
+
+	# a master that does not answer in time is left alone
+
+	open(pool.path('hung'), 'w').close()
+	assert not pool.connect('hung', timeout=1)
+	assert os.path.exists(pool.path('hung'))
+
+	# no directory, no pooling
+
+	pool = ControlPool(None)
+	assert not pool.connect('backend-0-0')
+	assert pool.options('backend-0-0') == []
+
+	# nor for a directory someone else owns
+
+	if os.geteuid() != 0:
+		pool = ControlPool('/')
+		assert not pool.connect('backend-0-0')
+		assert pool.options('backend-0-0') == []
@@ -7,6 +7,7 @@
 
 import os
 import sys
+import time
 import requests
 
 import json
@@ -58,6 +59,46 @@ class StackWSClient:
 			self.logged_in = True
 		
 	def run(self, cmd):
+		resp = self.post(cmd)
+		return self.output(resp.text)
+
+	def submit(self, cmd):
+		"""
+		Runs the command as a job on the web service and returns
+		the job id without waiting for the command.
+		"""
+		resp = self.post(cmd, job=True)
+		resp.raise_for_status()
+		return resp.json()['job']
+
+	def job(self, job):
+		"""
+		Returns the state of the job: the 'status' (queued,
+		running, done or failed), the 'elapsed' time and, once the
+		job is finished, the 'result'.
+		"""
+		if not self.logged_in:
+			self.login()
+		resp = self.session.get("%s/job/%s" % (self.url, job))
+		resp.raise_for_status()
+		return resp.json()
+
+	def wait(self, job, interval=2, timeout=None):
+		"""
+		Polls the job until it is finished and returns its output,
+		same as run() would.  Raises TimeoutError if the job is not
+		finished in TIMEOUT seconds.
+		"""
+		start = time.time()
+		while True:
+			state = self.job(job)
+			if state['status'] in [ 'done', 'failed' ]:
+				return self.output(state['result'])
+			if timeout and time.time() - start > timeout:
+				raise TimeoutError("Job %s did not finish" % job)
+			time.sleep(interval)
+
+	def post(self, cmd, job=False):
 		if not self.logged_in:
 			self.login()
 		if cmd.startswith('load ') or \
@@ -66,14 +107,17 @@ class StackWSClient:
 			cmd = new_cmd
 
 		self.session.headers.update({"Content-Type": "application/json"})
-		js = json.dumps({"cmd":cmd})
-		resp = self.session.post(self.url, data = js)
+		body = {"cmd":cmd}
+		if job:
+			body['job'] = True
+		return self.session.post(self.url, data = json.dumps(body))
+
+	def output(self, text):
 		try:
-			out = json.loads(resp.json())
+			out = json.loads(json.loads(text))
 			return json.dumps(out)
 		except:
-			out = resp.text
-			return out
+			return text
 
 	def loadFile(self, cmd):
 		c = cmd.split()
@@ -17,6 +17,7 @@ urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
     url(r'^$', StackWS.as_view()),
     url(r'^dir/(?P<file>%s)$' % (ftoken), list_dir),
+    url(r'^job/(?P<job>[a-f0-9]+)$', job_status),
     url(r'^login$',log_in),
     url(r'^logout$',log_out),
     url(r'^user$',check_user),
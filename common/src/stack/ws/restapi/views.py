@@ -9,6 +9,7 @@
 from django.shortcuts import render
 from django.views.generic import View
 from django.http import HttpResponse, HttpResponseForbidden
+from django.http import StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.contrib.auth import authenticate, login, logout
@@ -22,6 +23,11 @@ import stack.commands
 import stack.api
 import os, sys, time
 import subprocess
+import threading
+import queue
+import socket
+import uuid
+import concurrent.futures
 
 import logging
 import shlex
@@ -52,6 +58,21 @@ xml_cmds = [
 	'list.node.xml',
 ]
 
+# Privileged commands run on the pre-forked workers of wsworkerd,
+# there is one UNIX socket for each privilege level.  If wsworkerd is
+# not running the commands are run with sudo.
+
+WORKER_DIR	= '/var/run/stack/ws'
+WORKER_TIMEOUT	= 600
+
+# Commands submitted as jobs run in the background on a pool of
+# threads, the state and result of every job is kept as a json file
+# for JOB_KEEP seconds so any web service process can answer for it.
+
+JOB_DIR		= '/var/opt/stack/ws/jobs'
+JOB_WORKERS	= 4
+JOB_KEEP	= 24 * 60 * 60
+
 class StackWS(View):
 
 	# Decorator Function to check if a user is logged in
@@ -75,10 +96,23 @@ class StackWS(View):
 		return HttpResponse('{}')
 
 	# Main POST Function. Runs the actual Stacki Command Line
+	# If the request is a job, return the job id right away
+	# and run the command in the background.
 	@_check_login_
 	def post(self, request):
 		body = json.loads(request.body)
 
+		if body.get('job'):
+			body['stream'] = False
+			job = _submit_(request.user.username, str(body['cmd']),
+				lambda: self._run(request, body))
+			return HttpResponse(str(json.dumps({'job':job})),
+				content_type = "application/json",
+				status = 202)
+
+		return self._run(request, body)
+
+	def _run(self, request, body):
 		# Get the command being used
 		cmd = str(body['cmd'])
 		args = shlex.split(cmd)
@@ -178,25 +212,14 @@ class StackWS(View):
 			# privileges before running the command
 			if not request.user.is_superuser:
 				c.extend(['/usr/bin/sudo','-u','nobody'])
+				privilege = 'nobody'
+			else:
+				privilege = 'apache'
 			c.append("/opt/stack/bin/stack")
 			c.extend(cmd_module.split('.'))
 			c.extend(cmd_arg_list)
-			p = subprocess.Popen(c, stdin=None,
-				stdout=subprocess.PIPE,
-				stderr=subprocess.PIPE)
-			o, e = p.communicate()
-			rc = p.wait()
-			if rc:
-				j = {"API Error":e, "Output": o}
-				return HttpResponse(str(json.dumps(j)),
-					content_type = "application/json",
-					status = 500)
-			else:
-				if not o:
-					o = {}
-				return HttpResponse(str(json.dumps(o)),
-					content_type = "application/json",
-					status = 200)
+			return self._privileged(privilege, c,
+				cmd_module, cmd_arg_list)
 		# If command is a sync/load command, run
 		# it with sudo, as the command will require
 		# some root privileges. However, if the user
@@ -220,23 +243,18 @@ class StackWS(View):
 				]
 				c.extend(cmd_module.split('.'))
 				c.extend(cmd_arg_list)
-				p = subprocess.Popen(c, stdout=subprocess.PIPE,
-					stderr=subprocess.PIPE)
-				o, e = p.communicate()
-				rc = p.wait()
-				if rc:
-					j = {"API Error":e, "Output": o}
-					return HttpResponse(str(json.dumps(j)),
-						content_type = "application/json",
-						status = 500)
-				else:
-					if not o:
-						o = {}
-					return HttpResponse(str(json.dumps(o)),
-						content_type = "application/json",
-						status = 200)
+				return self._privileged('root', c,
+					cmd_module, cmd_arg_list)
 		# If it's not the sync command, run the
 		# command module wrapper directly.
+		# If the client asked for a stream, the
+		# output is sent as the command produces
+		# it (one json object per line).
+		elif body.get('stream'):
+			return StreamingHttpResponse(
+				_stream_(m.Command, admin,
+					cmd_module, cmd_arg_list),
+				content_type = "application/x-ndjson")
 		else:
 			try:
 				rc = command.runWrapper(cmd_module, cmd_arg_list)
@@ -280,6 +298,56 @@ class StackWS(View):
 			return HttpResponse(str(json.dumps(text)),
 				content_type = "application/json")
 
+	# Run a command that needs a different privilege
+	# level than the web service. The command goes to
+	# a worker of the privilege level, or is run with
+	# sudo (the command line C) if there are no workers.
+	def _privileged(self, privilege, c, cmd_module, cmd_arg_list):
+		try:
+			result = _worker_(privilege, cmd_module, cmd_arg_list)
+		except BlockingIOError:
+			j = {"API Error":"Service Busy"}
+			response = HttpResponse(str(json.dumps(j)),
+				content_type = "application/json",
+				status = 503)
+			response['Retry-After'] = '15'
+			return response
+		except socket.timeout:
+			j = {"API Error":"Command timed out"}
+			return HttpResponse(str(json.dumps(j)),
+				content_type = "application/json",
+				status = 504)
+		# The worker went away after it got the command,
+		# don't run it a second time.
+		except OSError:
+			j = {"API Error":"Command worker failed"}
+			return HttpResponse(str(json.dumps(j)),
+				content_type = "application/json",
+				status = 502)
+
+		if result:
+			rc, o, e = result
+		else:
+			p = subprocess.Popen(c, stdin=None,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE)
+			o, e = p.communicate()
+			rc = p.wait()
+			o = o.decode()
+			e = e.decode()
+
+		if rc:
+			j = {"API Error":e, "Output": o}
+			return HttpResponse(str(json.dumps(j)),
+				content_type = "application/json",
+				status = 500)
+		else:
+			if not o:
+				o = {}
+			return HttpResponse(str(json.dumps(o)),
+				content_type = "application/json",
+				status = 200)
+
 	# Check if command is blacklisted
 	def _blacklisted(self, mod):
 		# Get all blacklisted commands
@@ -297,7 +365,209 @@ class StackWS(View):
 				if m.group() == mod:
 					return True
 		return False
-	
+
+
+_jobs_ = concurrent.futures.ThreadPoolExecutor(JOB_WORKERS)
+
+
+def _job_path_(job):
+	return os.path.join(JOB_DIR, '%s.json' % job)
+
+
+def _write_job_(state):
+	path = _job_path_(state['id'])
+	tmp  = '%s.%d' % (path, os.getpid())
+	with open(tmp, 'w') as f:
+		json.dump(state, f)
+	os.rename(tmp, path)
+
+
+def _read_job_(job):
+	try:
+		with open(_job_path_(job), 'r') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+
+def _submit_(username, cmd, func):
+	"""
+	Queue FUNC (returns the HttpResponse of the command) as a
+	job of USERNAME and return the job id.
+	"""
+	os.makedirs(JOB_DIR, mode=0o700, exist_ok=True)
+
+	# Forget the old jobs
+
+	now = time.time()
+	for name in os.listdir(JOB_DIR):
+		path = os.path.join(JOB_DIR, name)
+		try:
+			if now - os.path.getmtime(path) > JOB_KEEP:
+				os.unlink(path)
+		except OSError:
+			pass
+
+	state = {
+		'id'	    : uuid.uuid4().hex,
+		'user'	    : username,
+		'cmd'	    : cmd,
+		'pid'	    : os.getpid(),
+		'status'    : 'queued',
+		'submitted' : now,
+		'started'   : None,
+		'finished'  : None,
+		'code'	    : None,
+		'result'    : None,
+		}
+	_write_job_(state)
+
+	def run():
+		state['status']  = 'running'
+		state['started'] = time.time()
+		_write_job_(state)
+		try:
+			response = func()
+			state['code']	= response.status_code
+			state['result'] = response.content.decode()
+			if response.status_code < 400:
+				state['status'] = 'done'
+			else:
+				state['status'] = 'failed'
+		except:
+			errortext = str(traceback.format_exc())
+			log.error(errortext)
+			state['code']	= 500
+			state['result'] = json.dumps({"API Error":errortext})
+			state['status'] = 'failed'
+		state['finished'] = time.time()
+		_write_job_(state)
+
+	_jobs_.submit(run)
+	return state['id']
+
+
+class _Stream:
+	"""
+	Output stream of a command run for a streaming request.  The
+	command thread writes the chunks, the response reads them.  The
+	queue is bounded so a slow client also slows down the command.
+	"""
+
+	def __init__(self):
+		self.queue  = queue.Queue(64)
+		self.closed = False
+
+	def write(self, data):
+		while not self.closed:
+			try:
+				self.queue.put(data, timeout=1)
+				return
+			except queue.Full:
+				pass
+		raise BrokenPipeError('client went away')
+
+
+def _stream_(cls, admin, cmd_module, cmd_arg_list):
+	"""
+	Runs the command (an instance of CLS) on a thread of its own
+	and yields its output.  The request thread goes on with other
+	requests, so the command gets a database connection of its
+	own.
+	"""
+	stream = _Stream()
+
+	# The client can go away at any time, then there is no one
+	# left to tell.
+
+	def send(data):
+		try:
+			stream.write(data)
+		except BrokenPipeError:
+			pass
+
+	def run():
+		link = None
+		try:
+			link = _connect_db_(admin)
+			command = cls(link)
+			command.stream = stream
+			command.runWrapper(cmd_module, cmd_arg_list)
+		except BrokenPipeError:
+			return
+		except pymysql.OperationalError as e:
+			errortext = str(sys.exc_info()[1])
+			log.error(errortext)
+			if int(e.args[0]) in MYSQL_EX:
+				errortext = "Database Permission Denied. " +\
+					"Admin privileges required"
+			send(json.dumps({"API Error":errortext}).encode() + b'\n')
+		except:
+			errortext = str(traceback.format_exc())
+			log.error(errortext)
+			send(json.dumps({"API Error":errortext}).encode() + b'\n')
+		finally:
+			if link:
+				link.close()
+			send(None)
+
+	threading.Thread(target=run, daemon=True).start()
+
+	try:
+		while True:
+			data = stream.queue.get()
+			if data is None:
+				break
+			yield data
+	finally:
+		stream.closed = True
+
+
+def _worker_(privilege, cmd_module, cmd_arg_list):
+	"""
+	Runs the command on a wsworkerd worker of the PRIVILEGE level
+	and returns (rc, output, error), or None if wsworkerd is not
+	running.  Raises BlockingIOError if the request queue of the
+	workers is full, socket.timeout if the command does not
+	finish within WORKER_TIMEOUT, and OSError if the worker
+	went away after it got the command (it may have run).
+	"""
+
+	path = os.path.join(WORKER_DIR, '%s.sock' % privilege)
+
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		# A full listen queue fails the connect right away
+		# (EAGAIN) rather than blocking.
+
+		s.setblocking(False)
+		try:
+			s.connect(path)
+		except BlockingIOError:
+			raise
+		except OSError:
+			return None
+
+		s.settimeout(WORKER_TIMEOUT + 30)
+		request = {
+			'cmd'	  : cmd_module,
+			'args'	  : cmd_arg_list,
+			'timeout' : WORKER_TIMEOUT
+			}
+		s.sendall(json.dumps(request).encode() + b'\n')
+
+		fin = s.makefile('rb')
+		line = fin.readline()
+		fin.close()
+	finally:
+		s.close()
+
+	if not line:
+		raise ConnectionError('no response from worker')
+	response = json.loads(line.decode())
+	return response['rc'], response['output'], response['error']
+
+
 # Create Connections to the database, and return
 # connection based on the administrative privilege.
 # Use this instead of Django's internal database
@@ -305,8 +575,31 @@ class StackWS(View):
 # creates a layer between the user and the DB
 # and wraps up certain functions. We need direct
 # access to the database layer.
+#
+# The connections are kept for each (web service)
+# thread and privilege level, a thread only runs
+# one request at a time.  Streamed commands outlive
+# their request, they use a connection of their own
+# from _connect_db_.
+
+_db_conns_ = threading.local()
+
 
 def _get_db_conn_(admin=False):
+	link = getattr(_db_conns_, str(admin), None)
+	if link:
+		try:
+			link.ping(reconnect=True)
+			return link
+		except pymysql.Error:
+			pass
+
+	link = _connect_db_(admin)
+	setattr(_db_conns_, str(admin), link)
+	return link
+
+
+def _connect_db_(admin=False):
 	if admin == True:
 		username = 'apache'
 		# Get Cluster username and password
@@ -329,6 +622,44 @@ def _get_db_conn_(admin=False):
 	return link
 
 
+# Function to poll a job. Returns the state of the
+# job, and the result once it is done.
+def job_status(request, job):
+	if not request.user.is_authenticated():
+		j = json.dumps({'logged_in':False})
+		return HttpResponseForbidden(str(j),
+			content_type="application/json")
+
+	state = _read_job_(job)
+	if not state or (state['user'] != request.user.username and
+		not request.user.is_superuser):
+		j = {"API Error":"Job Not Found"}
+		return HttpResponse(str(json.dumps(j)),
+			content_type="application/json",
+			status = 404)
+
+	# The web service process running the job went away
+	if state['status'] in ['queued', 'running']:
+		try:
+			os.kill(state['pid'], 0)
+		except ProcessLookupError:
+			state['status'] = 'failed'
+			state['result'] = json.dumps({"API Error":"Job Lost"})
+		except OSError:
+			pass
+
+	# Progress is the state of the job and how long it has
+	# been running.
+	if state['started']:
+		end = state['finished'] or time.time()
+		state['elapsed'] = end - state['started']
+	else:
+		state['elapsed'] = 0
+	del state['pid']
+
+	return HttpResponse(str(json.dumps(state)),
+		content_type="application/json")
+
 # Function to log in the user
 def log_in(request):
 
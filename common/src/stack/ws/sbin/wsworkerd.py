@@ -0,0 +1,320 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Web service command workers.  Runs the commands the web service is
+# not allowed to run itself (sync, load, the XML commands, ...) in
+# pre-forked worker processes instead of a 'sudo stack' for every
+# request.  There is one pool of workers for each privilege level,
+# each pool listens on its own UNIX socket and every worker keeps its
+# own database connection.
+#
+# Request (one json line):  { "cmd": "sync.host", "args": [ ... ],
+#			      "timeout": 600 }
+# Response (one json line): { "rc": 0, "output": "...", "error": "..." }
+
+import io
+import os
+import pwd
+import grp
+import sys
+import json
+import errno
+import signal
+import socket
+import syslog
+import traceback
+import pymysql
+import stack
+import stack.commands
+from stack.exception import CommandError
+
+Directory = '/var/run/stack/ws'
+
+# Privilege levels: the user the workers run as and the database
+# user of their connections.
+
+Pools = [
+	('root',   'root',   'apache'),
+	('apache', 'apache', 'apache'),
+	('nobody', 'nobody', 'nobody'),
+	]
+
+
+class Worker:
+	"""
+	A single worker process, serves one request at a time from the
+	listening socket of its pool.  Workers exit after REQUESTS
+	requests (or a timeout) so a command cannot leave its state
+	behind for long, the master starts a new one.
+	"""
+
+	Requests = 100
+
+	def __init__(self, server, dbuser):
+		self.server   = server
+		self.dbuser   = dbuser
+		self.database = None
+		self.conn     = None
+		self.request  = None
+
+	def connect(self):
+		passwd = ''
+		if self.dbuser == 'apache':
+			try:
+				with open('/opt/stack/etc/my.cnf', 'r') as fin:
+					for line in fin.readlines():
+						if line.startswith('password'):
+							passwd = line.split('=')[1].strip()
+							break
+			except:
+				pass
+
+		if os.path.exists('/var/opt/stack/mysql/mysql.sock'):
+			return pymysql.connect(db='cluster',
+				host='localhost',
+				user=self.dbuser,
+				passwd='%s' % passwd,
+				unix_socket='/var/opt/stack/mysql/mysql.sock',
+				autocommit=True)
+
+		try:
+			host = stack.DatabaseHost
+		except:
+			host = 'localhost'
+		return pymysql.connect(db='cluster',
+			host='%s' % host,
+			user=self.dbuser,
+			passwd='%s' % passwd,
+			port=40000,
+			autocommit=True)
+
+	def run(self, cmd, args):
+		"""
+		Runs the command in-process, same as the stack command
+		line does.  Anything the command prints is part of the
+		output.
+		"""
+		if self.database:
+			self.database.ping(reconnect=True)
+		else:
+			self.database = self.connect()
+
+		module = 'stack.commands.%s' % cmd
+		__import__(module)
+		module = sys.modules[module]
+
+		command = getattr(module, 'Command')(self.database)
+		rc	= command.runWrapper(' '.join(cmd.split('.')), args)
+
+		text = command.getText()
+		if isinstance(text, bytes):
+			text = text.decode()
+		if rc is True:
+			rc = 0
+		elif rc is False:
+			rc = 1
+		return (rc, text)
+
+	def handle(self, conn):
+		fin = conn.makefile('rb')
+		try:
+			request = json.loads(fin.readline().decode())
+		except (OSError, ValueError):
+			return
+		finally:
+			fin.close()
+
+		stdout = sys.stdout
+		stderr = sys.stderr
+		sys.stdout = io.StringIO()
+		sys.stderr = io.StringIO()
+
+		self.conn    = conn
+		self.request = request
+
+		response = { 'rc': 0, 'output': '', 'error': '' }
+		signal.alarm(int(request.get('timeout', 0)))
+		try:
+			(rc, text) = self.run(request['cmd'], request.get('args', []))
+			response['rc']	   = rc
+			response['output'] = (text or '') + sys.stdout.getvalue()
+		except CommandError as e:
+			response['rc']	  = 1
+			response['error'] = '%s' % e
+		except:
+			exc, msg, tb = sys.exc_info()
+			response['rc']	  = 1
+			response['error'] = ''.join(traceback.format_tb(tb))
+			response['error'] += '%s -- %s\n' % (exc.__name__, msg)
+			syslog.syslog(syslog.LOG_ERR, '%s %s' % (request['cmd'], msg))
+		finally:
+			signal.alarm(0)
+			self.conn = None
+			response['error'] += sys.stderr.getvalue()
+			sys.stdout = stdout
+			sys.stderr = stderr
+
+		try:
+			conn.sendall(json.dumps(response).encode() + b'\n')
+		except OSError:
+			pass
+
+	def expire(self, signum, frame):
+		"""
+		SIGALRM handler.  The command ran out of time: answer the
+		request and exit right here, an exception could be
+		caught by the command.  Nothing it left behind is
+		trusted, the master starts a new worker.
+		"""
+		if not self.conn:
+			return
+
+		response = { 'rc': 1, 'output': '',
+			     'error': 'timeout after %s seconds' %
+				      self.request['timeout'] }
+		try:
+			self.conn.sendall(json.dumps(response).encode() + b'\n')
+		except OSError:
+			pass
+		os._exit(0)
+
+	def serve(self):
+		signal.signal(signal.SIGALRM, self.expire)
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+		for i in range(0, self.Requests):
+			try:
+				(conn, addr) = self.server.accept()
+			except OSError as e:
+				if e.errno == errno.EINTR:
+					continue
+				raise
+			try:
+				self.handle(conn)
+			finally:
+				conn.close()
+
+
+class Master:
+	"""
+	Pre-forks COUNT workers for every pool and replaces the
+	workers as they exit.  The listen backlog of each pool socket
+	caps the number of queued requests, a client that cannot
+	connect is told the service is busy.
+	"""
+
+	def __init__(self, count, backlog):
+		self.count   = count
+		self.backlog = backlog
+		self.pools   = {}
+		self.workers = {}
+
+		try:
+			apache = grp.getgrnam('apache').gr_gid
+		except KeyError:
+			apache = None
+
+		os.makedirs(Directory, exist_ok=True)
+		for (name, user, dbuser) in Pools:
+			path = os.path.join(Directory, '%s.sock' % name)
+			if os.path.exists(path):
+				os.unlink(path)
+			server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			server.bind(path)
+			server.listen(backlog)
+
+			# Only apache (the web service) can talk to us.
+
+			if apache is not None:
+				os.chown(path, 0, apache)
+				os.chmod(path, 0o660)
+			else:
+				os.chmod(path, 0o600)
+
+			self.pools[name] = (server, user, dbuser)
+
+	def spawn(self, name):
+		(server, user, dbuser) = self.pools[name]
+
+		pid = os.fork()
+		if pid:
+			self.workers[pid] = name
+			return
+
+		try:
+			for other in self.pools:
+				if other != name:
+					self.pools[other][0].close()
+
+			if user != 'root':
+				pw = pwd.getpwnam(user)
+				os.setgroups([])
+				os.setgid(pw.pw_gid)
+				os.setuid(pw.pw_uid)
+				os.environ['HOME'] = pw.pw_dir
+
+			Worker(server, dbuser).serve()
+		except SystemExit:
+			pass
+		except:
+			syslog.syslog(syslog.LOG_ERR, 'worker %s failed: %s' %
+				      (name, sys.exc_info()[1]))
+		os._exit(0)
+
+	def run(self):
+		for name in self.pools:
+			for i in range(0, self.count):
+				self.spawn(name)
+
+		while True:
+			try:
+				(pid, status) = os.wait()
+			except ChildProcessError:
+				break
+			name = self.workers.pop(pid, None)
+			if name:
+				self.spawn(name)
+
+	def stop(self):
+		for pid in self.workers:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except OSError:
+				pass
+		for (name, user, dbuser) in Pools:
+			try:
+				os.unlink(os.path.join(Directory, '%s.sock' % name))
+			except OSError:
+				pass
+
+
+##
+## MAIN
+##
+
+if __name__ == '__main__':
+	if 'STACKDEBUG' not in os.environ:
+		import daemon
+		import lockfile.pidlockfile
+
+		if not os.path.exists('/var/run/stack'):
+			os.makedirs('/var/run/stack')
+		lock = lockfile.pidlockfile.PIDLockFile('/var/run/stack/wsworkerd.pid')
+		daemon.DaemonContext(pidfile=lock).open()
+
+	syslog.openlog('wsworkerd', syslog.LOG_PID, syslog.LOG_LOCAL0)
+
+	count	= int(os.environ.get('STACKWSWORKERS', 4))
+	backlog = int(os.environ.get('STACKWSQUEUE', 32))
+	master	= Master(count, backlog)
+
+	signal.signal(signal.SIGTERM, lambda signal, frame: sys.exit(0))
+	try:
+		master.run()
+	finally:
+		master.stop()
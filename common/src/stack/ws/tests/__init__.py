@@ -0,0 +1,29 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# wsworkerd is installed as a script, load it from the source tree as
+# the wsworkerd module.  The same for the wsclient module of ws-client.
+
+import os
+import sys
+import importlib.util
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'wsworkerd' not in sys.modules:
+	spec   = importlib.util.spec_from_file_location('wsworkerd',
+			os.path.join(Root, 'sbin', 'wsworkerd.py'))
+	module = importlib.util.module_from_spec(spec)
+	sys.modules['wsworkerd'] = module
+	spec.loader.exec_module(module)
+
+if 'wsclient' not in sys.modules:
+	spec   = importlib.util.spec_from_file_location('wsclient',
+			os.path.join(os.path.dirname(Root), 'ws-client',
+				     'pylib', 'wsclient.py'))
+	module = importlib.util.module_from_spec(spec)
+	sys.modules['wsclient'] = module
+	spec.loader.exec_module(module)
@@ -0,0 +1,189 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import json
+import time
+import threading
+import pytest
+import django
+import django.conf
+import stack
+import wsclient
+from . import Root
+
+# The views are installed as stack.restapi, import them from the source
+# tree with just enough of a django setup for the models.
+
+stack.__path__.append(Root)
+if not django.conf.settings.configured:
+	django.conf.settings.configure(
+		INSTALLED_APPS=[ 'django.contrib.auth',
+				 'django.contrib.contenttypes',
+				 'stack.restapi' ],
+		DATABASES={ 'default': {
+			'ENGINE': 'django.db.backends.sqlite3',
+			'NAME'	: ':memory:' } })
+	django.setup()
+
+from django.http import HttpResponse
+import stack.restapi.views as views
+
+
+class Executor:
+	"""
+	Holds on to the submitted jobs until the test runs them.
+	"""
+
+	def __init__(self):
+		self.jobs = []
+
+	def submit(self, fn):
+		self.jobs.append(fn)
+
+
+class User:
+
+	def __init__(self, username, superuser=False, authenticated=True):
+		self.username	   = username
+		self.is_superuser  = superuser
+		self.authenticated = authenticated
+
+	def is_authenticated(self):
+		return self.authenticated
+
+
+class Request:
+
+	def __init__(self, user):
+		self.user = user
+
+
+def status(user, job):
+	response = views.job_status(Request(user), job)
+	if response.status_code != 200:
+		return response.status_code
+	return json.loads(response.content.decode())
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+	executor = Executor()
+	monkeypatch.setattr(views, 'JOB_DIR', str(tmp_path / 'jobs'))
+	monkeypatch.setattr(views, '_jobs_', executor)
+	return executor
+
+
+def test_transitions(jobs):
+	owner	= User('owner')
+	started = threading.Event()
+	release = threading.Event()
+
+	def command():
+		started.set()
+		release.wait(10)
+		return HttpResponse('"output"')
+
+	job   = views._submit_('owner', 'sync config', command)
+	state = status(owner, job)
+	assert state['status'] == 'queued'
+	assert state['cmd'] == 'sync config'
+	assert state['elapsed'] == 0
+	assert 'pid' not in state
+
+	worker = threading.Thread(target=jobs.jobs[0])
+	worker.start()
+	started.wait(10)
+	state = status(owner, job)
+	assert state['status'] == 'running'
+	assert state['result'] is None
+
+	release.set()
+	worker.join()
+	state = status(owner, job)
+	assert state['status'] == 'done'
+	assert state['code'] == 200
+	assert state['result'] == '"output"'
+	assert state['elapsed'] >= 0
+
+	# an error response or an exception fails the job
+
+	job = views._submit_('owner', 'remove host', lambda:
+		HttpResponse('{}', status=500))
+	jobs.jobs[1]()
+	state = status(owner, job)
+	assert (state['status'], state['code']) == ('failed', 500)
+
+	def crash():
+		raise ValueError('crashed')
+
+	job = views._submit_('owner', 'load hostfile', crash)
+	jobs.jobs[2]()
+	state = status(owner, job)
+	assert (state['status'], state['code']) == ('failed', 500)
+	assert 'crashed' in json.loads(state['result'])['API Error']
+
+
+def test_expire(jobs):
+	old = views._submit_('owner', 'list host', lambda: HttpResponse('{}'))
+	path = views._job_path_(old)
+	then = time.time() - views.JOB_KEEP - 1
+	os.utime(path, (then, then))
+
+	new = views._submit_('owner', 'list host', lambda: HttpResponse('{}'))
+	assert not os.path.exists(path)
+	assert views._read_job_(old) is None
+	assert views._read_job_(new)['status'] == 'queued'
+
+
+def test_owner(jobs):
+	job = views._submit_('owner', 'list host', lambda: HttpResponse('{}'))
+
+	assert status(User('owner'), job)['user'] == 'owner'
+	assert status(User('root', superuser=True), job)['user'] == 'owner'
+	assert status(User('other'), job) == 404
+	assert status(User('owner'), 'f' * 32) == 404
+	assert status(User('owner', authenticated=False), job) == 403
+
+
+def test_lost(jobs):
+	job = views._submit_('owner', 'sync config', lambda: HttpResponse('{}'))
+
+	# the web service process that ran the job is gone
+
+	pid = os.fork()
+	if not pid:
+		os._exit(0)
+	os.waitpid(pid, 0)
+
+	state	     = views._read_job_(job)
+	state['pid'] = pid
+	views._write_job_(state)
+
+	state = status(User('owner'), job)
+	assert state['status'] == 'failed'
+	assert json.loads(state['result']) == { 'API Error': 'Job Lost' }
+
+
+def test_wait(monkeypatch):
+	client = wsclient.StackWSClient('localhost', 'owner', 'key')
+	states = [ { 'status': 'queued' }, { 'status': 'running' },
+		   { 'status': 'done', 'result': '"[{\\"host\\": \\"a\\"}]"' } ]
+	polled = []
+
+	def job(job):
+		polled.append(job)
+		return states[min(len(polled), len(states)) - 1]
+	monkeypatch.setattr(client, 'job', job)
+
+	assert client.wait('1234', interval=0) == '[{"host": "a"}]'
+	assert polled == [ '1234' ] * 3
+
+	# a job that never finishes
+
+	states = [ { 'status': 'running' } ]
+	with pytest.raises(TimeoutError):
+		client.wait('1234', interval=0.01, timeout=0.1)
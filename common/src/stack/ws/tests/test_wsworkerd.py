@@ -0,0 +1,98 @@
+# @copyright@
+# Copyright (c) 2006 - 2017 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import json
+import time
+import socket
+import wsworkerd
+
+
+class Worker(wsworkerd.Worker):
+	"""
+	Runs the test commands instead of stack commands:
+
+		echo	prints 'printed', returns its arguments
+		fail	raises a CommandError
+		hang	never returns, and swallows every exception
+	"""
+
+	Requests = 3
+
+	def run(self, cmd, args):
+		if cmd == 'echo':
+			print('printed')
+			return (0, '%s\n' % ' '.join(args))
+		if cmd == 'fail':
+			raise wsworkerd.CommandError(cmd, 'failed')
+		while True:
+			try:
+				time.sleep(10)
+			except:
+				pass
+
+
+def call(path, request):
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		s.connect(path)
+		s.sendall(json.dumps(request).encode() + b'\n')
+		fin  = s.makefile('rb')
+		line = fin.readline()
+		fin.close()
+	finally:
+		s.close()
+	return json.loads(line.decode())
+
+
+def wait(pid, timeout):
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		(done, status) = os.waitpid(pid, os.WNOHANG)
+		if done:
+			return True
+		time.sleep(0.1)
+	return False
+
+
+def test_worker(tmp_path):
+	path   = str(tmp_path / 'nobody.sock')
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	server.bind(path)
+	server.listen(4)
+
+	pid = os.fork()
+	if not pid:
+		try:
+			Worker(server, 'nobody').serve()
+		finally:
+			os._exit(0)
+	server.close()
+
+	try:
+		response = call(path, { 'cmd': 'echo', 'args': [ 'a', 'b' ],
+					'timeout': 5 })
+		assert response == { 'rc': 0, 'output': 'a b\nprinted\n',
+				     'error': '' }
+
+		response = call(path, { 'cmd': 'fail', 'timeout': 5 })
+		assert response['rc'] == 1
+		assert response['error'] == 'error - failed'
+
+		# the timeout holds even though the command catches
+		# everything, and the worker does not serve again
+
+		t0	 = time.time()
+		response = call(path, { 'cmd': 'hang', 'timeout': 1 })
+		assert response == { 'rc': 1, 'output': '',
+				     'error': 'timeout after 1 seconds' }
+		assert time.time() - t0 < 5
+		assert wait(pid, 5)
+		pid = None
+	finally:
+		if pid:
+			os.kill(pid, 9)
+			os.waitpid(pid, 0)